@@ -1,19 +1,63 @@
+import os
 import math
+import functools
+import concurrent.futures
 # import torch
 import numpy as np
-import matplotlib
-import matplotlib.pyplot as plt
-plt.style.use(['science'])
 np.set_printoptions(precision=2)
 
-
-def applyNoise(input_array, sigma, my_seed=1, u_wall=10):
-    np.random.seed(my_seed)
-    output_array = np.random.normal(input_array, u_wall*sigma)
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'Results', 'analytical_cache')    # None -> memory only
+CACHE_SIZE = 32             # parameter sets kept in memory
+NOISE_CHUNK = 2**20         # values per noise stream, fixes the stream layout
+NOISE_THREADS = os.cpu_count() or 1
+
+
+def _addNoiseChunk(flat, chunk, sigma, my_seed, u_wall):
+    start = chunk*NOISE_CHUNK
+    stop = min(start + NOISE_CHUNK, flat.size)
+    generator = np.random.Generator(np.random.PCG64(my_seed).jumped(chunk))
+    noise = generator.standard_normal(stop - start, dtype=np.float32)
+    noise *= u_wall*sigma
+    flat[start:stop] += noise
+
+
+def applyNoise(input_array, sigma, my_seed=1, u_wall=10, num_threads=None):
+    # Adds Gaussian noise of standard deviation u_wall*sigma. The flattened
+    # array is split into chunks of NOISE_CHUNK values, chunk k draws from its
+    # own stream PCG64(my_seed).jumped(k). The chunks are generated by
+    # num_threads threads (NumPy releases the GIL while sampling). Since the
+    # chunk layout does not depend on num_threads, the output is bitwise
+    # reproducible for a given seed regardless of the thread count. The global
+    # np.random state is left untouched.
+    # A float32, C-contiguous, writable input_array is modified in place and
+    # returned; any other input is first converted to such a float32 copy.
+    output_array = input_array
+    if not (isinstance(output_array, np.ndarray)
+            and output_array.dtype == np.float32
+            and output_array.flags.c_contiguous
+            and output_array.flags.writeable):
+        output_array = np.array(input_array, dtype=np.float32, order='C')
+    flat = output_array.reshape(-1)
+    num_chunks = -(-flat.size // NOISE_CHUNK)
+    num_threads = min(num_threads or NOISE_THREADS, num_chunks)
+
+    if num_threads <= 1:
+        for chunk in range(num_chunks):
+            _addNoiseChunk(flat, chunk, sigma, my_seed, u_wall)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(num_threads) as executor:
+            list(executor.map(
+                lambda chunk: _addNoiseChunk(
+                    flat, chunk, sigma, my_seed, u_wall),
+                range(num_chunks)))
     return output_array
 
 
 def compareVelocityField(prediction_array, target_array, wall_height=20):
+    # matplotlib is imported lazily, so that the dataset workers only load numpy
+    import matplotlib.pyplot as plt
+    plt.style.use(['science'])
     t, h, w = prediction_array.shape
     v_step = wall_height / (h-1)
     v_steps = np.arange(0, wall_height + v_step, v_step).tolist()
@@ -93,8 +137,34 @@ def list2array(input_list):
     return output_array
 
 
-def couetteSolver(desired_timesteps, u_wall=10, wall_height=20, nu=2, vertical_resolution=63, sigma=0):
-    my_data = []  # Container for all time step vectors
+def couetteTerms(t_min, u_wall=10, wall_height=20, nu=2, tolerance=1e-6, max_terms=30):
+    # Number of Fourier terms required so that the truncation error at the
+    # earliest timestep t_min stays below tolerance*u_wall. The magnitude of
+    # term n is bounded by 2*u_wall/(pi*n)*exp(-n^2*a) with
+    # a = pi^2*nu*t/wall_height^2. The tail beyond N is thus bounded by the
+    # geometric series over exp(-a*(2N+1)), which decays quickly for any t > 0.
+    # Later timesteps converge faster, hence the result holds for all t.
+    a = (math.pi**2)*nu*t_min/(wall_height**2)
+    if a <= 0:
+        return max_terms
+    ratio = math.exp(-a)
+    for N in range(1, max_terms+1):
+        tail = 2/(math.pi*(N+1))*math.exp(-a*(N+1)**2)/(1-ratio)
+        if tail <= tolerance:
+            return N
+    return max_terms
+
+
+def couetteSolver(desired_timesteps, u_wall=10, wall_height=20, nu=2, vertical_resolution=63, sigma=0, tolerance=1e-6, max_terms=30):
+    # The start-up Couette flow is given by the Fourier series
+    # u(t, y) = u_wall*y/h + 2*u_wall/pi * sum_n (-1)^n/n
+    #           * exp(-n^2*pi^2*nu*t/h^2) * sin(n*pi*y/h),
+    # which equals the previous formulation -1/n * sin(n*pi*(1-y/h)) since
+    # sin(n*pi - x) = -(-1)^n*sin(x). The series is evaluated for all
+    # timesteps, heights and modes at once: the (t, n) decay factors and the
+    # (y, n) sine modes are contracted over n via a single matrix product.
+    # The number of modes is chosen adaptively via tolerance, refer to
+    # couetteTerms, and capped at max_terms.
 
     # The relaxation time is roughly: t = h*h/nu. We want 'desired_timesteps' of
     # time samples before start up. Therefor we need the general formula to
@@ -104,11 +174,7 @@ def couetteSolver(desired_timesteps, u_wall=10, wall_height=20, nu=2, vertical_r
     # stepsize = (1/desired_timesteps)* h*h/nu
     my_timestep = (1/desired_timesteps)*(wall_height**2)/(nu)
     my_time_upperbound = (wall_height**2)/(nu)
-    my_timesteps = np.arange(
-        my_timestep, my_time_upperbound, my_timestep).tolist()
-    my_time_zero = [0.0]*(vertical_resolution+1)
-    # print('length of time_zero: {length}'.format(length=len(my_time_zero)))
-    my_data.append(np.array(my_time_zero))
+    my_timesteps = np.arange(my_timestep, my_time_upperbound, my_timestep)
     # For the initial u_net test cases, a picture-like resolution of 64x64 is
     # desired. Therefor we need the general formula to create the list of vertical
     # steps. Caution, these must include h=0 and h=wall_height:
@@ -117,35 +183,138 @@ def couetteSolver(desired_timesteps, u_wall=10, wall_height=20, nu=2, vertical_r
     my_vertical_step = wall_height / vertical_resolution
     my_vertical_upperbound = wall_height + my_vertical_step
     my_vertical_steps = np.arange(
-        my_vertical_step, my_vertical_upperbound, my_vertical_step).tolist()
-
-    for t in my_timesteps:
-        dummy_vector = []
-        dummy_vector.append(0.0)
-        for y in my_vertical_steps:
-            result = 2*u_wall/(math.pi)
-            sum = 0
-            for n in list(range(1, 31)):
-                sum += ((-1**n)/n) * math.exp(-(n**2)*(math.pi**2)*nu*t
-                                              / (wall_height**2)) * math.sin(n*math.pi*(1-(y/wall_height)))
-            result *= sum
-            result += u_wall*(y/wall_height)
-            dummy_vector.append(result)
-        my_data.append(np.flip(np.array(dummy_vector)))
-
-    # Sanity check: Do the lengths of the lists make sense?
-    # print('length of my_data: {length}'.format(length=len(my_data)))
-    # print('length of element: {length}'.format(length=len(my_data[0])))
-
-    # Sanity check: Do the first and last elements in the list make sense?
-    # print('couette solver shape at [0]: ', my_data[0].shape)
-    # print('couette solver shape at [10]: ', my_data[10].shape)
-    # print('couette solver element at [10]: ', my_data[10])
-    # print('couette solver type of list element [0]: ', type(my_data[0]))
-    # print('couette solver type of list element [5]: ', type(my_data[5]))
-    # print(my_data[desired_timesteps-1])
-
-    return my_data
+        my_vertical_step, my_vertical_upperbound, my_vertical_step)
+
+    N = couetteTerms(my_timesteps[0], u_wall, wall_height, nu, tolerance,
+                     max_terms)
+    n = np.arange(1, N+1)
+    coefficients = (-1.0)**n / n
+    decay = np.exp(-np.outer(my_timesteps, n**2)*(math.pi**2)*nu
+                   / (wall_height**2))
+    modes = np.sin(np.outer(my_vertical_steps, n)*math.pi/wall_height)
+
+    my_data = np.zeros(
+        (len(my_timesteps)+1, len(my_vertical_steps)+1), dtype=np.float32)
+    my_data[1:, 1:] = 2*u_wall/(math.pi)*((decay*coefficients) @ modes.T) \
+        + u_wall*(my_vertical_steps/wall_height)
+    # The first row is the fluid at rest (t = 0), the first column the
+    # stationary wall (y = 0). As before, each profile is returned top-down.
+    return list(np.ascontiguousarray(my_data[:, ::-1]))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _cachedProfiles(desired_timesteps, u_wall, wall_height, nu, vertical_resolution, tolerance, max_terms):
+    file_name = None
+    if CACHE_DIR is not None:
+        file_name = os.path.join(
+            CACHE_DIR, f'analytical_{desired_timesteps}_{u_wall}_{wall_height}'
+            f'_{nu}_{vertical_resolution}_{tolerance}_{max_terms}.npy')
+        if os.path.isfile(file_name):
+            profiles = np.load(file_name)
+            profiles.setflags(write=False)
+            return profiles
+
+    profiles = np.stack(couetteSolver(
+        desired_timesteps, u_wall, wall_height, nu, vertical_resolution,
+        tolerance=tolerance, max_terms=max_terms))
+
+    if file_name is not None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write to a temporary file first, so that concurrent processes never
+        # read a partially written cache entry.
+        tmp_name = f'{file_name[:-4]}_{os.getpid()}.tmp.npy'
+        np.save(tmp_name, profiles)
+        os.replace(tmp_name, file_name)
+    profiles.setflags(write=False)
+    return profiles
+
+
+def cachedCouetteSolver(desired_timesteps, u_wall=10, wall_height=20, nu=2, vertical_resolution=63, tolerance=1e-6, max_terms=30):
+    # Memoized couetteSolver. The profiles are keyed by the full parameter
+    # tuple and kept in an in-memory LRU cache of CACHE_SIZE entries, backed
+    # by .npy files in CACHE_DIR that persist across runs. Returns the
+    # read-only (t, h) float32 array of profiles, i.e. np.stack of the
+    # couetteSolver output.
+    return _cachedProfiles(int(desired_timesteps), float(u_wall),
+                           float(wall_height), float(nu),
+                           int(vertical_resolution), float(tolerance),
+                           int(max_terms))
+
+
+def analyticalReference(desired_timesteps=1000, u_wall=10, wall_height=20, nu=2, vertical_resolution=31, timestep=None):
+    # Noise-free analytical baseline for plots and error metrics, e.g.
+    # analyticalReference(u_wall=5, timestep=99) replaces the hand-saved
+    # 'analytical_5_99_1_3_32_32_32.csv'. Returns the (3, h, h, h) volume of
+    # timestep, or the LazyCouetteVolume of all timesteps if timestep is None.
+    volume = LazyCouetteVolume(cachedCouetteSolver(
+        desired_timesteps, u_wall, wall_height, nu, vertical_resolution))
+    return volume if timestep is None else volume[timestep]
+
+
+def sampleNoise(shape, sigma, seed, index, u_wall=10):
+    # Counter-based Gaussian noise: the Philox key combines seed and sample
+    # index, so that the noise of a sample only depends on (seed, index) and
+    # not on the order or the process in which samples are generated. As in
+    # applyNoise, the standard deviation is u_wall*sigma.
+    generator = np.random.Generator(
+        np.random.Philox(key=int(seed) + (int(index) << 64)))
+    return generator.standard_normal(shape, dtype=np.float32)*(u_wall*sigma)
+
+
+class LazyCouetteVolume():
+    # Lazy equivalent of the (t, 3, h, h, h) array built by my3DCouetteSolver.
+    # Only the (t, h) profiles are stored. The 3D volume of a timestep is a
+    # np.broadcast_to view of its profile (channel 0) and of zeros (channels
+    # 1 and 2), i.e. expandVector2Matrix, expandMatrix2Tensor and expand2RGB
+    # without copies. Memory is only allocated when a sample is accessed via
+    # indexing or when the whole volume is converted via np.asarray. For
+    # sigma != 0, the noise of each sample is generated at access time via
+    # sampleNoise, hence it is reproducible per (seed, index) but differs from
+    # the noise of applyNoise.
+    def __init__(self, profiles, sigma=0, seed=1, u_wall=10, indices=None):
+        self.profiles = profiles
+        self.sigma = sigma
+        self.seed = seed
+        self.u_wall = u_wall
+        self.indices = np.arange(len(profiles)) if indices is None else indices
+        h = profiles.shape[1]
+        self._channels = np.zeros((len(profiles), 3, h), dtype=profiles.dtype)
+        self._channels[:, 0] = profiles
+        self.shape = (len(self.indices), 3, h, h, h)
+        self.dtype = profiles.dtype
+
+    def __len__(self):
+        return len(self.indices)
+
+    def view(self, idx):
+        # Read-only, zero-copy view of the noise-free volume of sample idx.
+        h = self.shape[2]
+        return np.broadcast_to(
+            self._channels[self.indices[idx], :, None, :, None], (3, h, h, h))
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return LazyCouetteVolume(self.profiles, self.sigma, self.seed,
+                                     self.u_wall, self.indices[idx])
+        sample = np.array(self.view(idx))
+        if self.sigma != 0.0:
+            sample += sampleNoise(sample.shape, self.sigma, self.seed,
+                                  self.indices[idx], self.u_wall)
+        return sample
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __array__(self, dtype=None, copy=None):
+        output = np.empty(self.shape, dtype=self.dtype)
+        output[:] = np.broadcast_to(
+            self._channels[self.indices, :, None, :, None], self.shape)
+        if self.sigma != 0.0:
+            for i, idx in enumerate(self.indices):
+                output[i] += sampleNoise(output.shape[1:], self.sigma,
+                                         self.seed, idx, self.u_wall)
+        return output if dtype is None else output.astype(dtype, copy=False)
 
 
 def my1DCouetteSolver(desired_timesteps, u_wall=10, wall_height=20, nu=2, vertical_resolution=63, sigma=0):
@@ -181,18 +350,19 @@ def my2DCouetteSolver(desired_timesteps, u_wall=10, wall_height=20, nu=2, vertic
     return my_2d_array
 
 
-def my3DCouetteSolver(desired_timesteps, u_wall=10, wall_height=20, nu=2, vertical_resolution=63, sigma=0, my_seed=1):
+def my3DCouetteSolver(desired_timesteps, u_wall=10, wall_height=20, nu=2, vertical_resolution=63, sigma=0, my_seed=1, lazy=False):
+    # If lazy, a LazyCouetteVolume is returned instead of the materialized
+    # float32 array. Refer to LazyCouetteVolume for the noise semantics.
 
     my_1d_list = couetteSolver(
         desired_timesteps, u_wall, wall_height, nu, vertical_resolution)
 
-    my_2d_list = expandVector2Matrix(my_1d_list)
-
-    my_3d_list = expandMatrix2Tensor(my_2d_list)
+    my_3d_volume = LazyCouetteVolume(list2array(my_1d_list))
 
-    my_3d_RGB_list = expand2RGB(my_3d_list)
+    if lazy:
+        return LazyCouetteVolume(my_3d_volume.profiles, sigma, my_seed)
 
-    my_3d_array = list2array(my_3d_RGB_list)
+    my_3d_array = np.asarray(my_3d_volume)
 
     if sigma != 0.0:
         my_3d_array = applyNoise(my_3d_array, sigma, my_seed)
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import time
+import itertools
+import concurrent.futures
+import numpy as np
+from numpy.lib.format import open_memmap
+from torch.utils.data import ConcatDataset
+from couette_solver import couetteSolver, LazyCouetteVolume
+from dataset import MyFlowDataset, MyCouetteDataset
+
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+
+
+def sweepGrid(u_walls=[10], wall_heights=[20], nus=[2], sigmas=[0.3], resolutions=[31], seeds=[1], timesteps=1000):
+    # Builds the list of trajectory parameters from the cartesian product of
+    # all parameter lists. Each entry fully specifies one trajectory.
+    grid = []
+    for u, w, n, s, r, seed in itertools.product(
+            u_walls, wall_heights, nus, sigmas, resolutions, seeds):
+        grid.append({'u_wall': u, 'wall_height': w, 'nu': n, 'sigma': s,
+                     'resolution': r, 'seed': seed, 'timesteps': timesteps})
+    return grid
+
+
+def _solverShape(params):
+    # The floating point ranges of couetteSolver may yield one timestep or
+    # height more or less than requested, depending on wall_height and nu.
+    # Hence the shape is taken from the solver itself (a single term suffices).
+    profiles = couetteSolver(
+        desired_timesteps=params['timesteps'], u_wall=params['u_wall'],
+        wall_height=params['wall_height'], nu=params['nu'],
+        vertical_resolution=params['resolution'], max_terms=1)
+    return len(profiles), len(profiles[0])
+
+
+def _generate(params, file_name, row, store):
+    # Worker: computes one trajectory and writes it into row of the
+    # preallocated .npy file. Workers never return the data itself, so that
+    # no volumes are pickled between processes.
+    profiles = np.stack(couetteSolver(
+        desired_timesteps=params['timesteps'], u_wall=params['u_wall'],
+        wall_height=params['wall_height'], nu=params['nu'],
+        vertical_resolution=params['resolution']))
+    output = open_memmap(file_name, mode='r+')
+    if store == 'profiles':
+        output[row] = profiles
+    else:
+        volume = LazyCouetteVolume(
+            profiles, sigma=params['sigma'], seed=params['seed'])
+        for t in range(len(volume)):
+            output[row, t] = volume[t]
+    output.flush()
+    del output
+    return row
+
+
+def generateSweep(grid, directory, store='profiles', max_workers=None):
+    # Generates all trajectories of grid in parallel across a process pool and
+    # writes them to directory. Trajectories of identical (timesteps,
+    # resolution) are stacked in one .npy file, e.g. 'couette_1000_32.npy' of
+    # shape (n, t, h) for store='profiles' or (n, t, 3, h, h, h) for
+    # store='volumes'. A manifest lists the file and row of every trajectory
+    # alongside its parameters.
+    # store='profiles' only keeps the analytical profiles (~128 kB per
+    # trajectory at t=1000, h=32); the noisy volumes are then generated on
+    # access from (seed, index), refer to MyCouetteDataset. store='volumes'
+    # writes the noisy float32 volumes (~390 MB per trajectory at t=1000,
+    # h=32) for consumers that require materialized data.
+    # As sigma and seed do not affect the profiles, store='profiles' solves
+    # and writes each physical parameter set only once. The manifest entries
+    # of all (sigma, seed) pairs then point to the shared row.
+    if store not in ['profiles', 'volumes']:
+        print('Invalid value for function parameter: store.')
+        return
+    os.makedirs(directory, exist_ok=True)
+
+    entries = []
+    files = {}
+    jobs = []
+    rows = {}
+    for params in grid:
+        physical = tuple(params[k] for k in [
+            'u_wall', 'wall_height', 'nu', 'resolution', 'timesteps'])
+        if store == 'volumes':
+            physical += (params['sigma'], params['seed'])
+        if physical not in rows:
+            t, h = _solverShape(params)
+            key = f'{t}_{h}'
+            if key not in files:
+                files[key] = {'file': f'couette_{key}.npy', 'rows': 0,
+                              't': t, 'h': h}
+            rows[physical] = (files[key]['file'], files[key]['rows'])
+            files[key]['rows'] += 1
+            jobs.append((params,) + rows[physical])
+        file_name, row = rows[physical]
+        entries.append(dict(params, file=file_name, row=row))
+
+    for f in files.values():
+        f['shape'] = [f['rows'], f['t'], f['h']] if store == 'profiles' else \
+            [f['rows'], f['t'], 3, f['h'], f['h'], f['h']]
+        open_memmap(os.path.join(directory, f['file']), mode='w+',
+                    dtype=np.float32, shape=tuple(f['shape']))
+
+    start = time.time()
+    with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+        futures = [executor.submit(
+            _generate, params, os.path.join(directory, file_name), row, store)
+            for params, file_name, row in jobs]
+        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            future.result()
+            if (i+1) % 100 == 0 or i+1 == len(futures):
+                print(f'Generated {i+1}/{len(futures)} trajectories.')
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'store': store,
+        'dtype': 'float32',
+        'files': {f['file']: f['shape'] for f in files.values()},
+        'trajectories': entries
+    }
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    print(f'Sweep of {len(entries)} trajectories ({len(jobs)} solved) '
+          f'written to {directory} in {time.time()-start:.1f}s.')
+    return manifest
+
+
+def loadSweep(directory, select=None):
+    # Loads a sweep as one ConcatDataset of (image, mask) pairs. The .npy
+    # files are memory-mapped, hence only accessed samples are read.
+    # select - optional function of the trajectory parameters, e.g.
+    # lambda p: p['sigma'] == 0.3, to load a subset of the sweep
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    arrays = {}
+    datasets = []
+    for entry in manifest['trajectories']:
+        if select is not None and not select(entry):
+            continue
+        if entry['file'] not in arrays:
+            arrays[entry['file']] = np.load(
+                os.path.join(directory, entry['file']), mmap_mode='c')
+        data = arrays[entry['file']][entry['row']]
+        if manifest['store'] == 'profiles':
+            datasets.append(MyCouetteDataset(
+                timesteps=entry['timesteps'], couette_dim=entry['resolution'],
+                sigma=entry['sigma'], seed=entry['seed'], profiles=data))
+        else:
+            datasets.append(MyFlowDataset(data[:-1], data[1:]))
+    return ConcatDataset(datasets)
+
+
+if __name__ == '__main__':
+    # python couette_sweep.py <directory> [profiles|volumes]
+    _directory = sys.argv[1] if len(sys.argv) > 1 else 'Sweep'
+    _store = sys.argv[2] if len(sys.argv) > 2 else 'profiles'
+    _grid = sweepGrid(
+        u_walls=[2, 4, 6, 8, 10],
+        wall_heights=[10, 20, 40],
+        nus=[1, 2, 4],
+        sigmas=[0.0, 0.1, 0.3, 0.5],
+        resolutions=[31, 63],
+        seeds=[1, 2, 3]
+    )
+    generateSweep(_grid, _directory, store=_store)
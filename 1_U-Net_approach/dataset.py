@@ -1,6 +1,7 @@
 import numpy as np
 import torch
 from torch.utils.data import Dataset
+from couette_solver import cachedCouetteSolver, LazyCouetteVolume
 
 
 class MyFlowDataset(Dataset):
@@ -17,3 +18,48 @@ class MyFlowDataset(Dataset):
         image = torch.from_numpy(self.sample_images[idx])
         mask = torch.from_numpy(self.sample_masks[idx])
         return image, mask
+
+
+class MyCouetteDataset(Dataset):
+    # Procedural counterpart of MyFlowDataset for synthetic Couette flow. The
+    # analytical profiles are computed once per parameter set, the (image,
+    # mask) pair of index idx, i.e. the volumes of timesteps idx and idx+1, is
+    # generated on access. Memory is hence constant in the number of samples.
+    # Noise is counter-based, refer to LazyCouetteVolume: the same (seed,
+    # index) yields the same sample in every worker and on every access.
+    # set_epoch(epoch) switches to a fresh noise realization per epoch, which
+    # effectively provides unlimited training data. The training loops call it
+    # through utils.set_epoch, which also reaches into ConcatDatasets.
+    # PARAMETERS:
+    # timesteps, couette_dim, u_wall, sigma - refer to my3DCouetteSolver
+    # seed - base seed of the noise
+    # start, stop - range of timesteps used as images, stop=None -> all
+    # profiles - precomputed (t, h) profiles, e.g. from a sweep, refer to
+    # couette_sweep.py. If given, the solver parameters are ignored.
+    def __init__(self, timesteps, couette_dim, u_wall=10, sigma=0, seed=1, start=0, stop=None, profiles=None):
+        if profiles is None:
+            profiles = cachedCouetteSolver(
+                desired_timesteps=timesteps, u_wall=u_wall,
+                vertical_resolution=couette_dim)
+        # As in applyNoise, the noise level refers to u_wall=10 regardless
+        # of the actual wall speed.
+        self.volume = LazyCouetteVolume(profiles, sigma=sigma, seed=seed)
+        self.seed = seed
+        self.start = start
+        self.stop = len(profiles) - 1 if stop is None else min(
+            stop, len(profiles) - 1)
+
+    def set_epoch(self, epoch):
+        self.volume.seed = self.seed + (epoch << 32)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f'Index {idx} out of range for {len(self)} samples.')
+        image = torch.from_numpy(self.volume[self.start + idx])
+        mask = torch.from_numpy(self.volume[self.start + idx + 1])
+        return image, mask
@@ -1,7 +1,7 @@
 import numpy as np
 import csv
 import torch
-from couette_solver import my3DCouetteSolver
+from couette_solver import my3DCouetteSolver, analyticalReference
 from plotting import compareFlowProfile, compareUxFlowProfile, colorMap, showSample, plotLoss, plotLoss34
 
 
@@ -202,11 +202,9 @@ def testColorMap():
     w = 20
     n = 2
     v = 31
-    sigma = 0
-    seed = 1
-    analytical = my3DCouetteSolver(desired_timesteps=t, u_wall=u, wall_height=w,
-                                   nu=n, vertical_resolution=v, sigma=sigma, my_seed=seed)
-    u_1 = analytical[1, 0, :, :, :]
+    analytical = analyticalReference(desired_timesteps=t, u_wall=u, wall_height=w,
+                                     nu=n, vertical_resolution=v)
+    u_1 = analytical[1][0, :, :, :]
     '''
     u_2 = analytical[15, 0, :, :, :]
     u_3 = analytical[30, 0, :, :, :]
@@ -215,7 +213,7 @@ def testColorMap():
     u_6 = analytical[250, 0, :, :, :]
     u_7 = analytical[500, 0, :, :, :]
     '''
-    u_8 = analytical[1000-1, 0, :, :, :]
+    u_8 = analytical[1000-1][0, :, :, :]
     u = [u_1, u_8]
     colorMap(u)
 
@@ -227,9 +225,7 @@ def trial1():
         'predictions_1_MSE_5_3_32_32_32.csv', (5, 3, 32, 32, 32))
     target = load3D_RGBArrayFromFile(
         'targets_1_MAE_5_3_32_32_32.csv', (5, 3, 32, 32, 32))
-    analytical = load3D_RGBArrayFromFile(
-        'analytical_10_99_1_3_32_32_32.csv', (1, 3, 32, 32, 32))
-    analytical = analytical[0]
+    analytical = analyticalReference(u_wall=10, timestep=99)
 
     title = 'Trial 1'
     save_as = 'Trial_01'
@@ -267,9 +263,7 @@ def test1():
         'T_1_pred_MSE_5_3_32_32_32.csv', (5, 3, 32, 32, 32))
     target = load3D_RGBArrayFromFile(
         'T_1_target_MAE_5_3_32_32_32.csv', (5, 3, 32, 32, 32))
-    analytical = load3D_RGBArrayFromFile(
-        'analytical_10_99_1_3_32_32_32.csv', (1, 3, 32, 32, 32))
-    analytical = analytical[0]
+    analytical = analyticalReference(u_wall=10, timestep=99)
 
     title = 'Test 1: Different Random Seed'
     save_as = 'Test_01'
@@ -286,9 +280,7 @@ def test2():
         'T_2_pred_MSE_5_3_32_32_32.csv', (5, 3, 32, 32, 32))
     target = load3D_RGBArrayFromFile(
         'T_2_target_MAE_5_3_32_32_32.csv', (5, 3, 32, 32, 32))
-    analytical = load3D_RGBArrayFromFile(
-        'analytical_5_99_1_3_32_32_32.csv', (1, 3, 32, 32, 32))
-    analytical = analytical[0]
+    analytical = analyticalReference(u_wall=5, timestep=99)
 
     title = 'Test 2: Wall Speed $U = 5$'
     save_as = 'Test_02'
@@ -305,9 +297,7 @@ def test3():
         'T_3_pred_MSE_5_3_32_32_32.csv', (5, 3, 32, 32, 32))
     target = load3D_RGBArrayFromFile(
         'T_3_target_MAE_5_3_32_32_32.csv', (5, 3, 32, 32, 32))
-    analytical = load3D_RGBArrayFromFile(
-        'analytical_10_99_1_3_32_32_32.csv', (1, 3, 32, 32, 32))
-    analytical = analytical[0]
+    analytical = analyticalReference(u_wall=10, timestep=99)
 
     title = 'Test 3: Increased Noise $ \sigma = 0.5U$'
     save_as = 'Test_03'
@@ -324,9 +314,7 @@ def test4():
         'T_4_pred_MSE_5_3_64_64_64.csv', (5, 3, 64, 64, 64))
     target = load3D_RGBArrayFromFile(
         'T_4_target_MAE_5_3_64_64_64.csv', (5, 3, 64, 64, 64))
-    analytical = load3D_RGBArrayFromFile(
-        'analytical_10_99_1_3_64_64_64.csv', (1, 3, 64, 64, 64))
-    analytical = analytical[0]
+    analytical = analyticalReference(u_wall=10, vertical_resolution=63, timestep=99)
 
     title = 'Test 4: Increased Spatial Resolution 64 x 64 x 64'
     save_as = 'Test_04'
@@ -1,9 +1,5 @@
 import torch
 import torch.nn as nn
-from drawing_board import save3D_RGBArray2File
-import torchvision.transforms.functional as TF
-from torchsummary import summary
-from ptflops import get_model_complexity_info
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 use_cuda = torch.cuda.is_available()
@@ -613,6 +609,11 @@ class Hybrid_MD_LSTM_UNET(nn.Module):
 
 
 def test():
+    # The analysis tools are only needed here, so they are not imported at
+    # module level, where every (spawned) worker process would load them:
+    # from ptflops import get_model_complexity_info
+    # from torchsummary import summary
+    # from drawing_board import save3D_RGBArray2File
     # model = LSTM_MD_UNET(in_channels=3, out_channels=3, features=[4, 6, 8, 10])
     # model = UNET(in_channels=3, out_channels=3, features=[64, 128, 256, 512])
     # macs, params = get_model_complexity_info(
@@ -1,16 +1,13 @@
 import torch
 import numpy as np
 from tqdm import tqdm
-import matplotlib.pyplot as plt
 import torch.nn as nn
 import torch.optim as optim
 from model import UNET, RNN, GRU, LSTM, Hybrid_MD_RNN_UNET, Hybrid_MD_GRU_UNET, Hybrid_MD_LSTM_UNET
 import time
 # MSLELoss, check_accuracy, save3DArray2File
-from utils import get_loaders, get_5_loaders, get_loaders_test, losses2file, get_loaders_from_file, get_loaders_from_file2
-from drawing_board import save3D_RGBArray2File
+from utils import set_epoch, get_loaders, get_5_loaders, get_loaders_test, losses2file, get_loaders_from_file, get_loaders_from_file2
 
-plt.style.use(['science'])
 np.set_printoptions(precision=6)
 
 DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -306,6 +303,7 @@ def trial_1():
         losses = []
         start = time.time()
         for epoch in range(e):
+            set_epoch(train_loader, epoch)
             training_loss = train_fn(
                 train_loader, model, optimizer, loss_fn, scaler)
             losses.append(training_loss.item())
@@ -357,6 +355,7 @@ def trial_2():
         losses = []
         start = time.time()
         for epoch in range(e):
+            set_epoch(train_loader, epoch)
             training_loss = train_fn(
                 train_loader, model, optimizer, loss_fn, scaler)
             losses.append(training_loss)
@@ -412,6 +411,7 @@ def trial_3():
             losses = []
 
             for epoch in range(e):
+                set_epoch(train_loader, epoch)
                 training_loss = train_fn(
                     train_loader, model, optimizer, loss_fn, scaler)
                 losses.append(training_loss)
@@ -469,6 +469,7 @@ def trial_4():
             losses = []
 
             for epoch in range(e[j]):
+                set_epoch(train_loader, epoch)
                 training_loss = train_fn(
                     train_loader, model, optimizer, loss_fn, scaler)
                 losses.append(training_loss)
@@ -521,6 +522,7 @@ def trial_5():
         losses = []
 
         for epoch in range(e):
+            set_epoch(train_loader, epoch)
             training_loss = train_fn(
                 train_loader, model, optimizer, loss_fn, scaler)
             losses.append(training_loss)
@@ -572,6 +574,7 @@ def trial_6():
         losses = []
 
         for epoch in range(e):
+            set_epoch(train_loader, epoch)
             training_loss = train_fn(
                 train_loader, model, optimizer, loss_fn, scaler)
             losses.append(training_loss)
@@ -595,6 +598,8 @@ def trial_7():
     print('@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@')
     print('@@@@@@@@@@@@@@@            TRIAL 7           @@@@@@@@@@@@@@@')
     print('@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@')
+    # drawing_board pulls in matplotlib, hence it is only imported when needed
+    from drawing_board import save3D_RGBArray2File
     t = 1000                                            # Timesteps
     d = 31                                              # Vertical resolution
     s = 0.3                                             # Sigma
@@ -624,6 +629,7 @@ def trial_7():
 
         # Training cycle
         for epoch in range(e):
+            set_epoch(train_loader, epoch)
             training_loss = train_fn(
                 train_loader, model, optimizer, loss_fn, scaler)
 
@@ -1153,6 +1159,7 @@ def first_trial_hybrid():
 
             # Initiate training loop and append average epoch loss to container
             for epoch in range(1, (e+1)):
+                set_epoch(train_loader, epoch)
                 training_loss = train_hybrid(
                     train_loader, model, optimizer, loss_fn, scaler, epoch)
                 max_losses.append(training_loss[0])
@@ -1206,6 +1213,7 @@ def first_trial_hybrid():
 
             # Initiate training loop and append average epoch loss to container
             for epoch in range(1, (e+1)):
+                set_epoch(train_loader, epoch)
                 training_loss = train_hybrid(
                     train_loader, model, optimizer, loss_fn, scaler, epoch)
                 max_losses.append(training_loss[0])
@@ -1261,6 +1269,7 @@ def first_trial_hybrid():
 
             # Initiate training loop and append average epoch loss to container
             for epoch in range(1, (e+1)):
+                set_epoch(train_loader, epoch)
                 training_loss = train_hybrid(
                     train_loader, model, optimizer, loss_fn, scaler, epoch)
                 max_losses.append(training_loss[0])
@@ -1318,6 +1327,7 @@ def tests():
         epoch = 0
 
         while epoch < e:
+            set_epoch(train_loader, epoch)
             training_loss = train_fn(
                 train_loader, model, optimizer, loss_fn, scaler)
             losses.append(training_loss)
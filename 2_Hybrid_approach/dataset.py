@@ -28,3 +28,33 @@ class MyMamicoDataset(Dataset):
         image = torch.from_numpy(self.sample_images[idx])
         mask = torch.from_numpy(self.sample_masks[idx])
         return image, mask
+
+
+class MyMamicoChunkDataset(Dataset):
+    #
+    # This class is used for truncated-BPTT training of the hybrid models.
+    # It holds several trajectories (i.e. MaMiCo datasets) and splits each of
+    # them into consecutive chunks of chunk_length coupling cycles. Item idx
+    # is the idx-th chunk of every trajectory, stacked along a new leading
+    # dimension. As such, the chunks must be fed in order (shuffle=False) and
+    # the DataLoader must not batch again (batch_size=None). Images and masks
+    # are cropped as in MyMamicoDataset. All trajectories are truncated to
+    # the length of the shortest one. The final chunk may be shorter.
+    #
+    def __init__(self, my_images_list, chunk_length):
+        _length = min([len(my_images) for my_images in my_images_list])
+        self.sample_images = np.stack(
+            [my_images[:_length-1, :, 1:-1, 1:-1, 1:-1] for my_images in my_images_list])
+        self.sample_masks = np.stack(
+            [my_images[1:_length, :, 4:22, 4:22, 4:22] for my_images in my_images_list])
+        self.chunk_length = chunk_length
+
+    def __len__(self):
+        return -(-self.sample_images.shape[1] // self.chunk_length)
+
+    def __getitem__(self, idx):
+        _start = idx * self.chunk_length
+        _end = _start + self.chunk_length
+        image = torch.from_numpy(self.sample_images[:, _start:_end])
+        mask = torch.from_numpy(self.sample_masks[:, _start:_end])
+        return image, mask
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import queue
+import base64
+import threading
+import collections
+import numpy as np
+
+SEPARATOR = '::'            # separates store file and series name, e.g. 'Metrics_X.jsonl::Losses'
+FLUSH_INTERVAL = 1.0        # seconds between two flushes of the background writer
+
+
+def _store_name(file_name):
+    return file_name if file_name.endswith('.jsonl') else f'{file_name}.jsonl'
+
+
+def _encode(values):
+    return base64.b64encode(
+        np.ascontiguousarray(values, dtype='<f4').tobytes()).decode('ascii')
+
+
+def _decode(string):
+    return np.frombuffer(base64.b64decode(string), dtype='<f4')
+
+
+class MetricsWriter():
+    # BRIEF: The MetricsWriter buffers scalar series (e.g. the average loss per
+    # dataloader) and timelines (e.g. the loss of every coupling cycle) in
+    # memory and appends them asynchronously to a store file in the JSONL
+    # format, i.e. one record per line. Timelines are stored as base64 encoded
+    # float32 arrays to keep the store compact. Writing happens in a background
+    # thread, so that training never blocks on file I/O. A new writer
+    # truncates the store, unless resume is set. Records are only appended,
+    # i.e. a crashed run leaves all records up to the last flush intact.
+    # Failed writes are re-raised by flush and close.
+    # PARAMETERS:
+    # file_name - name of the store file, '.jsonl' is appended if missing
+    # flush_interval - max. seconds between logging and writing a record
+    # resume - if True, records are appended to an existing store
+    def __init__(self, file_name, flush_interval=FLUSH_INTERVAL, resume=False):
+        self.file_name = _store_name(file_name)
+        self.flush_interval = flush_interval
+        self.scalars = collections.defaultdict(list)
+        self.timelines = collections.defaultdict(list)
+        # The store is opened here, so that an invalid path fails at once.
+        _directory = os.path.dirname(self.file_name)
+        if _directory != '':
+            os.makedirs(_directory, exist_ok=True)
+        self._file = open(self.file_name, 'a' if resume else 'w')
+        self._error = None
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        _running = True
+        while _running:
+            _records = [self._queue.get()]
+            _deadline = time.time() + self.flush_interval
+            while _records[-1] is not None:
+                _timeout = _deadline - time.time()
+                if _timeout <= 0:
+                    break
+                try:
+                    _records.append(self._queue.get(timeout=_timeout))
+                except queue.Empty:
+                    break
+            if _records[-1] is None:
+                _running = False
+            # After a failed write, records are only drained, so that flush
+            # and close return and re-raise the error.
+            if self._error is None:
+                try:
+                    for _record in _records:
+                        if _record is not None:
+                            self._file.write(json.dumps(_record) + '\n')
+                    self._file.flush()
+                except Exception as e:
+                    self._error = e
+            for _ in _records:
+                self._queue.task_done()
+        self._file.close()
+
+    def _raise(self):
+        if self._error is not None:
+            raise RuntimeError(
+                f'MetricsWriter {self.file_name} failed to write.') from self._error
+
+    def _put(self, record):
+        if self._closed:
+            raise RuntimeError(f'MetricsWriter {self.file_name} is closed.')
+        self._raise()
+        record['time'] = round(time.time(), 3)
+        self._queue.put(record)
+
+    def scalar(self, name, value, step=None):
+        # BRIEF: Logs one value of a scalar series.
+        # PARAMETERS:
+        # name - name of the series
+        # value - value to be logged
+        # step - e.g. the epoch, defaults to the number of values logged so far
+        value = float(value)
+        if step is None:
+            step = len(self.scalars[name])
+        self.scalars[name].append(value)
+        self._put({'name': name, 'kind': 'scalar', 'step': int(step),
+                   'value': value})
+
+    def timeline(self, name, values, step=None):
+        # BRIEF: Logs a whole timeline at once, e.g. the loss of every coupling
+        # cycle of one dataloader.
+        # PARAMETERS:
+        # name - name of the timeline
+        # values - list or numpy array containing the timeline
+        # step - defaults to the number of timelines logged under this name
+        values = np.asarray(values, dtype=np.float32).ravel()
+        if step is None:
+            step = len(self.timelines[name])
+        self.timelines[name].append(values)
+        self._put({'name': name, 'kind': 'timeline', 'step': int(step),
+                   'length': len(values), 'values': _encode(values)})
+
+    def series(self, name):
+        # BRIEF: Returns the in-memory scalar series as numpy array.
+        return np.array(self.scalars[name])
+
+    def reference(self, name):
+        # BRIEF: Returns the string used by load_series to refer to a series.
+        return f'{self.file_name}{SEPARATOR}{name}'
+
+    def flush(self):
+        # BRIEF: Blocks until all logged records are written and re-raises a
+        # failed write.
+        self._queue.join()
+        self._raise()
+
+    def close(self):
+        # BRIEF: Flushes the store and stops the writer thread.
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._raise()
+        print(f'Saved metrics to file: {self.file_name}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _read_records(file_name):
+    _records = []
+    with open(_store_name(file_name)) as f:
+        for _line in f:
+            try:
+                _records.append(json.loads(_line))
+            except json.JSONDecodeError:
+                # A run that was killed mid-write may leave a partial line.
+                continue
+    return _records
+
+
+def read_scalars(file_name):
+    # BRIEF: Loads all scalar series of a store. If a step was logged more than
+    # once, the most recent value is kept.
+    # PARAMETERS:
+    # file_name - name of the store file
+    # RETURNS:
+    # scalars - dict mapping each series name to a numpy array ordered by step
+    _series = collections.defaultdict(dict)
+    for _record in _read_records(file_name):
+        if _record['kind'] == 'scalar':
+            _series[_record['name']][_record['step']] = _record['value']
+    return {_name: np.array([_steps[_s] for _s in sorted(_steps)])
+            for _name, _steps in _series.items()}
+
+
+def read_timelines(file_name):
+    # BRIEF: Loads all timelines of a store.
+    # PARAMETERS:
+    # file_name - name of the store file
+    # RETURNS:
+    # timelines - dict mapping each timeline name to a list of numpy arrays
+    _series = collections.defaultdict(dict)
+    for _record in _read_records(file_name):
+        if _record['kind'] == 'timeline':
+            _series[_record['name']][_record['step']] = _decode(
+                _record['values'])
+    return {_name: [_steps[_s] for _s in sorted(_steps)]
+            for _name, _steps in _series.items()}
+
+
+def load_series(references):
+    # BRIEF: Loads a list of series. Each reference is either a store reference
+    # of the form 'store.jsonl::name', see MetricsWriter.reference, or the name
+    # of a csv file as created by losses2file. For timelines, the most recent
+    # one is returned.
+    # PARAMETERS:
+    # references - list of strings
+    # RETURNS:
+    # results - list containing the series as numpy arrays
+    _stores = {}
+    _results = []
+    for _reference in references:
+        if SEPARATOR not in _reference:
+            _results.append(np.loadtxt(_reference))
+            continue
+        _file_name, _name = _reference.split(SEPARATOR, 1)
+        if _file_name not in _stores:
+            _stores[_file_name] = (read_scalars(_file_name),
+                                   read_timelines(_file_name))
+        _scalars, _timelines = _stores[_file_name]
+        if _name in _scalars:
+            _results.append(_scalars[_name])
+        elif _name in _timelines:
+            _results.append(_timelines[_name][-1])
+        else:
+            raise KeyError(f'Series {_name} not found in {_file_name}.')
+    return _results
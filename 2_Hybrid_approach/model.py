@@ -657,6 +657,96 @@ def resetPipeline(model):
     return
 
 
+def initSequence(model, batch_size):
+    # BRIEF: Creates the (empty) RNN sequence state for truncated-BPTT
+    # training via forward_chunk. As opposed to model.sequence, this state
+    # holds one FIFO pipeline per trajectory.
+    # PARAMETERS:
+    # model - one of Hybrid_MD_RNN_UNET, Hybrid_MD_GRU_UNET, Hybrid_MD_LSTM_UNET
+    # batch_size - number of trajectories that are trained concurrently
+    seq_length = model.sequence.size(0)
+    return torch.zeros(batch_size, seq_length, model.input_size).to(model.device)
+
+
+def forward_chunk(model, x, sequence):
+    # BRIEF: Batched forward pass of a hybrid model over a chunk of K
+    # consecutive coupling cycles for B trajectories at once. For every cycle,
+    # the result is identical to calling model(x) cycle by cycle, i.e. the
+    # RNN sees the 25 most recent bottlenecks including the current one. The
+    # FIFO pipeline however is not stored in model.sequence but passed in and
+    # returned explicitly, so that it can be carried across chunks. The
+    # returned state is detached, which truncates backpropagation through
+    # time at chunk boundaries.
+    # PARAMETERS:
+    # model - one of Hybrid_MD_RNN_UNET, Hybrid_MD_GRU_UNET, Hybrid_MD_LSTM_UNET
+    # x - input of shape (B, K, 3, 24, 24, 24)
+    # sequence - RNN sequence state of shape (B, 25, input_size), refer to
+    # initSequence
+    # RETURNS:
+    # out - predictions of shape (B, K, 3, 18, 18, 18)
+    # sequence - detached RNN sequence state to be passed to the next chunk
+    B, K = x.shape[:2]
+    seq_length = sequence.size(1)
+    x = torch.reshape(x, (B*K, *x.shape[2:]))
+
+    skip_connections = []
+
+    # Contracting side and bottleneck for all B*K cycles at once
+    for down in model.downs:
+        x = down(x)
+        skip_connections.append(x)
+        x = model.pool(x)
+
+    x = model.helper_down(x)
+    x = model.activation(x)
+    x = model.bottleneck(x)
+    x = model.activation(x)
+
+    # Build the RNN input: one sliding window of length 25 per cycle. Window
+    # k ends with the bottleneck of cycle k.
+    latents = torch.reshape(x, (B, K, model.input_size))
+    pipeline = torch.cat((sequence.to(latents.dtype), latents), dim=1)
+    windows = pipeline.unfold(1, seq_length, 1)[:, 1:]
+    windows = windows.permute(0, 1, 3, 2).reshape(
+        B*K, seq_length, model.input_size)
+
+    h0 = torch.zeros(model.num_layers, B*K,
+                     model.hidden_size).to(model.device)
+    if hasattr(model, 'lstm'):
+        c0 = torch.zeros(model.num_layers, B*K,
+                         model.hidden_size).to(model.device)
+        x, _ = model.lstm(windows, (h0, c0))
+    elif hasattr(model, 'gru'):
+        x, _ = model.gru(windows, h0)
+    else:
+        x, _ = model.rnn(windows, h0)
+
+    x = x[:, -1, :]
+    x = model.fc(x)
+
+    # Expanding side for all B*K cycles at once
+    x = torch.reshape(x, (B*K, int((model.input_size/8)), 2, 2, 2))
+    x = model.helper_up_1(x)
+    x = model.activation(x)
+    skip_connections = skip_connections[::-1]
+
+    for idx in range(0, len(model.ups), 2):
+        x = model.ups[idx](x)
+        skip_connection = skip_connections[idx//2]
+        concat_skip = torch.cat((skip_connection, x), dim=1)
+        x = model.ups[idx+1](concat_skip)
+
+    x = model.helper_up_2(x)
+    x = model.activation(x)
+
+    for i in range(2):
+        x = model.helper_up_3(x)
+        x = model.activation(x)
+
+    out = torch.reshape(x, (B, K, *x.shape[1:]))
+    return out, pipeline[:, -seq_length:].detach()
+
+
 def test():
     model = Hybrid_MD_RNN_UNET(
         device=device,
@@ -1,61 +1,81 @@
 from utils import mamico_csv2dataset
+import concurrent.futures
+import multiprocessing
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import torch
+from reductions import centerlines
 mpl.use('Agg')
 plt.style.use(['science'])
 np.set_printoptions(precision=2)
 
 
-def colorMap(dataset, dataset_name):
-    # BRIEF: This function is used to visualize a dataset in a 3D
-    # scatterplot, aka color map. Here, the use case is tailored
-    # to simulation results containing 1000 timesteps in a 26x26x26
-    # spatial domain. To this end, 8 timesteps will be considered:
-    # [0, 25, 50, 100, 200, 400, 800, 999]
+def volumeImage(volume, mode='slice', downsample=1):
+    # BRIEF: Projects a single velocity component [x, y, z] onto one 2D image
+    # that tiles the three orthogonal views (X-Y, X-Z, Y-Z) side by side,
+    # separated by an empty column.
+    #
+    # PARAMETERS:
+    # volume - numpy array or torch tensor [x, y, z]
+    # mode - 'slice' for the central slices, 'max' for max. projections
+    # downsample - stride applied to every spatial axis
+    #
+    # RETURNS:
+    # image - numpy array [x, 3*y+2]
+
+    if torch.is_tensor(volume):
+        volume = volume.detach().cpu().numpy()
+    volume = np.asarray(volume)[::downsample, ::downsample, ::downsample]
+    d, h, w = volume.shape
+    if mode == 'max':
+        views = [volume.max(axis=2), volume.max(axis=1), volume.max(axis=0)]
+    else:
+        views = [volume[:, :, int(w/2)], volume[:, int(h/2), :],
+                 volume[int(d/2), :, :]]
+    gap = np.full((views[0].shape[0], 1), np.nan)
+    return np.hstack([views[0], gap, views[1], gap, views[2]])
+
+
+def colorMap(dataset, dataset_name, mode='slice', downsample=1, vmin=-4, vmax=4):
+    # BRIEF: This function is used to visualize a dataset as color map.
+    # Instead of scattering every cell in 3D, the orthogonal central slices
+    # (or max. projections) of u_x are rasterized via imshow, which keeps
+    # rendering time and file size independent of the number of cells.
+    # Here, the use case is tailored to simulation results containing 1000
+    # timesteps in a 26x26x26 spatial domain. To this end, 9 timesteps will
+    # be considered: [0, 25, 50, 100, 200, 400, 600, 800, 999]
     #
     # PARAMETERS:
     # dataset - contains the MaMiCoDataset [1000, 3, 26, 26, 26]
     # dataset_name - refers to a unique numeric identifier
+    # mode - 'slice' or 'max', refer to volumeImage
+    # downsample - stride applied to every spatial axis
+    # vmin, vmax - range of the color map
 
-    t, c, d, h, w = dataset.shape
-    steps = np.arange(0, h).tolist()
-    X, Y, Z = np.meshgrid(steps, steps, steps)
-    counter = 0
     t = [0, 25, 50, 100, 200, 400, 600, 800, 999]
 
     # Creating color map
-    cm = plt.cm.get_cmap('Spectral')
+    cm = plt.get_cmap('Spectral')
 
     # Creating figure
-    fig = plt.figure()
-    fig.suptitle(f'Visualization of Dataset: {dataset_name}', fontsize=16)
+    fig, axs = plt.subplots(3, 3, constrained_layout=True)
+    title = 'Max. Projections' if mode == 'max' else 'Central Slices'
+    fig.suptitle(f'{title} of Dataset: {dataset_name}', fontsize=16)
 
     # Creating subplots
-    while counter < 9:
-        ax = fig.add_subplot(3, 3, (counter+1), projection='3d')
+    for counter, ax in enumerate(axs.ravel()):
         ax.set_title(f't={t[counter]}', fontsize=10)
-        sc = ax.scatter3D(X, Y, Z, c=dataset[t[counter], 0, :, :, :],
-                          alpha=0.8, marker='.', s=0.25, vmin=-4, vmax=4, cmap=cm)
+        im = ax.imshow(volumeImage(dataset[t[counter], 0], mode, downsample),
+                       cmap=cm, vmin=vmin, vmax=vmax, interpolation='nearest')
 
-        if counter == 4:
-            ax.set_xlabel("X", fontsize=7, fontweight='bold')
-            ax.set_ylabel("Y", fontsize=7, fontweight='bold')
-            ax.set_zlabel("Z", fontsize=7, fontweight='bold')
-            ax.xaxis.labelpad = -10
-            ax.yaxis.labelpad = -10
-            ax.zaxis.labelpad = -10
+        if counter == 7:
+            ax.set_xlabel("X-Y | X-Z | Y-Z", fontsize=7, fontweight='bold')
 
         ax.set_xticks([])
         ax.set_yticks([])
-        ax.set_zticks([])
-        ax.grid(False)
-        counter += 1
 
-    fig.subplots_adjust(right=0.8)
-    cbar_ax = fig.add_axes([0.85, 0.15, 0.05, 0.7])
-    fig.colorbar(sc, cax=cbar_ax)
+    fig.colorbar(im, ax=axs, shrink=0.7)
     # fig.set_size_inches(3.5, 2)
     fig.savefig(f'Colormap_Visualization_Dataset_{dataset_name}.png')
     # fig.savefig('myfig.eps', format='eps')
@@ -79,8 +99,8 @@ def flowProfile(dataset, dataset_name, u_wall=1):
     t, c, d, h, w = dataset.shape
     steps = np.arange(0, h).tolist()
 
-    mid = int(h/2)
     samples = [0, 25, 50, 100, 200, 400, 600, 800, 999]
+    lines = centerlines(dataset, samples)
 
     fig, (ax1, ax2, ax3) = plt.subplots(
         3, sharey=True, constrained_layout=True)  # sharex=True
@@ -97,10 +117,10 @@ def flowProfile(dataset, dataset_name, u_wall=1):
     ax3.set_xlabel("Z")
     ax3.set_ylabel("$u_x$")
 
-    for time in samples:
-        ax1.plot(steps, dataset[time, 0, :, mid, mid], label=f't = {time}')
-        ax2.plot(steps, dataset[time, 0, mid, :, mid], label=f't = {time}')
-        ax3.plot(steps, dataset[time, 0, mid, mid, :], label=f't = {time}')
+    for k, time in enumerate(samples):
+        ax1.plot(steps, lines[k, 0, 0], label=f't = {time}')
+        ax2.plot(steps, lines[k, 0, 1], label=f't = {time}')
+        ax3.plot(steps, lines[k, 0, 2], label=f't = {time}')
 
     plt.yticks(range(int(-u_wall), int(u_wall*(2)+1), 10))
     # plt.xlabel('Spatial Dimension')
@@ -110,28 +130,37 @@ def flowProfile(dataset, dataset_name, u_wall=1):
     plt.close()
 
 
-def visualizeMaMiCoDataset(filenames, dataset_names, u_wall):
+def _visualizeDataset(file_name, dataset_name, u_wall, mode, downsample):
+    # Worker of visualizeMaMiCoDataset. Each worker loads its own dataset, so
+    # that no volumes are pickled between processes.
+    _dataset = mamico_csv2dataset(file_name)
+    colorMap(_dataset, dataset_name, mode=mode, downsample=downsample)
+    flowProfile(_dataset, dataset_name, u_wall)
+    return dataset_name
+
+
+def visualizeMaMiCoDataset(filenames, dataset_names, u_wall, mode='slice', downsample=1, max_workers=None):
     # BRIEF: This function is used to visualize the MaMiCo generated simulation
     # data. It loads the dataset from a csv file.
     # Here, the use case is tailored to simulation results containing 1000
     # timesteps in a 26 x 26 x 26 spatial domain. Hence the default values.
+    # The datasets of the catalogue are loaded and rendered in parallel, one
+    # worker process per dataset.
     # PARAMETERS:
     # filename -  the name of the file of interest including file suffix,
     # e.g. 'my_values.csv'
-
-    for i in range(len(filenames)):
-        # Load dataset from csv
-        print('Loading Dataset.')
-        _dataset = mamico_csv2dataset(filenames[i])
-        print('Complete.')
-        # Create 3D scatterplot for meaningful timesteps.
-        print('Creating ColorMap.')
-        colorMap(_dataset, dataset_names[i])
-        print('Complete.')
-
-        print('Creating flowProfile.')
-        flowProfile(_dataset, dataset_names[i], u_wall[i])
-        print('Complete.')
+    # mode, downsample - refer to colorMap
+    # max_workers - number of worker processes, defaults to the number of CPUs
+
+    print(f'Visualizing {len(filenames)} datasets.')
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [executor.submit(_visualizeDataset, filenames[i],
+                                   dataset_names[i], u_wall[i], mode, downsample)
+                   for i in range(len(filenames))]
+        for future in concurrent.futures.as_completed(futures):
+            print(f'Completed ColorMap and flowProfile: {future.result()}')
     return
 
 
@@ -194,18 +223,24 @@ def plotMinMaxAvgLoss(min_losses, avg_losses, max_losses, file_name=0):
 
 
 def compareFlowProfile(preds, targs, model_descriptor):
-    # BRIEF:
+    # BRIEF: Compares the u_x centerline profiles of prediction and target at
+    # eight timesteps.
     #
     # PARAMETERS:
-    # preds -
-    # targs -
-    # model_descriptor -
+    # preds - either the predictions [t, 3, x, y, z] or their centerlines
+    # [t, 3, 3, x], refer to reductions.centerlines
+    # targs - same as preds for the targets
+    # model_descriptor - used for the file name
 
-    t, c, d, h, w = preds.shape
-    steps = np.arange(0, h).tolist()
+    steps = np.arange(0, preds.shape[-1]).tolist()
     samples = [0, 25, 50, 100, 200, 400, 800, 999]
     time_list = [0, 4, 1, 5, 2, 6, 3, 7]
-    mid = int(h/2)
+    if preds.ndim == 5:
+        pred_lines = centerlines(preds, time_list)
+        targ_lines = centerlines(targs, time_list)
+    else:
+        pred_lines = preds[time_list]
+        targ_lines = targs[time_list]
 
     fig, axs = plt.subplots(4, 2, sharex=True, sharey=True)
     fig.suptitle('Target and Prediction Comparison', fontsize=16)
@@ -219,10 +254,8 @@ def compareFlowProfile(preds, targs, model_descriptor):
     plt.xticks([])
 
     for i in range(8):
-        axs[i].plot(steps, preds[time_list[i], 0, :,
-                    mid, mid], label=f'Prediction')
-        axs[i].plot(steps, targs[time_list[i], 0,
-                    mid, :, mid], label=f'Target')
+        axs[i].plot(steps, pred_lines[i, 0, 0], label=f'Prediction')
+        axs[i].plot(steps, targ_lines[i, 0, 1], label=f'Target')
         axs[i].set_title(f't={samples[time_list[i]]}', fontsize=12)
 
     # plt.xlabel('Spatial Dimension')
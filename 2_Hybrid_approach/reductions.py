@@ -0,0 +1,69 @@
+import torch
+import numpy as np
+
+
+def _to_numpy(x):
+    if torch.is_tensor(x):
+        return x.detach().float().cpu().numpy()
+    return np.asarray(x)
+
+
+def _select(volumes, timesteps):
+    if timesteps is None:
+        return volumes
+    return volumes[list(timesteps)]
+
+
+def plane_averages(volumes, timesteps=None):
+    # BRIEF: Averages every velocity component over the x-y planes, i.e. yields
+    # the flow profile along the z-direction, for all selected timesteps in one
+    # operation. Torch tensors are reduced on their device and only the reduced
+    # array is transferred.
+    # PARAMETERS:
+    # volumes - numpy array or torch tensor [t, c, x, y, z]
+    # timesteps - list of timesteps to reduce, None reduces all timesteps
+    # RETURNS:
+    # profiles - numpy array [len(timesteps), c, z]
+    _volumes = _select(volumes, timesteps)
+    if torch.is_tensor(_volumes):
+        return _to_numpy(_volumes.mean(dim=(2, 3)))
+    return _volumes.mean(axis=(2, 3))
+
+
+def centerlines(volumes, timesteps=None):
+    # BRIEF: Extracts the velocity components along the three lines through the
+    # domain center parallel to the x-, y- and z-axis.
+    # PARAMETERS:
+    # volumes - numpy array or torch tensor [t, c, x, y, z] with x = y = z
+    # timesteps - list of timesteps to reduce, None reduces all timesteps
+    # RETURNS:
+    # lines - numpy array [len(timesteps), c, 3, x], the third axis selects the
+    # line along x, y or z
+    _volumes = _select(volumes, timesteps)
+    _mid = int(_volumes.shape[-1]/2)
+    _lines = [_volumes[:, :, :, _mid, _mid],
+              _volumes[:, :, _mid, :, _mid],
+              _volumes[:, :, _mid, _mid, :]]
+    if torch.is_tensor(_volumes):
+        return _to_numpy(torch.stack(_lines, dim=2))
+    return np.stack(_lines, axis=2)
+
+
+def line_statistics(volumes, component=0):
+    # BRIEF: Reduces every timestep to mean and standard deviation of one
+    # velocity component along the central y-axis and its local value at the
+    # domain center. Meant to be applied batch by batch during validation.
+    # PARAMETERS:
+    # volumes - numpy array or torch tensor [t, c, x, y, z]
+    # component - velocity component to reduce
+    # RETURNS:
+    # statistics - numpy array [t, 3] containing mean, std and local value
+    _mid = int(volumes.shape[2]/2)
+    _line = volumes[:, component, _mid, :, _mid]
+    _local = volumes[:, component, _mid, _mid, _mid]
+    if torch.is_tensor(volumes):
+        _line = _line.float()
+        return _to_numpy(torch.stack(
+            [_line.mean(dim=1), _line.std(dim=1, unbiased=False),
+             _local.float()], dim=1))
+    return np.stack([_line.mean(axis=1), _line.std(axis=1), _local], axis=1)
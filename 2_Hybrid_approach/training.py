@@ -4,10 +4,13 @@ import numpy as np
 import matplotlib.pyplot as plt
 import torch.nn as nn
 import torch.optim as optim
-from model import Hybrid_MD_RNN_UNET, Hybrid_MD_GRU_UNET, Hybrid_MD_LSTM_UNET, resetPipeline
+from model import Hybrid_MD_RNN_UNET, Hybrid_MD_GRU_UNET, Hybrid_MD_LSTM_UNET, resetPipeline, initSequence, forward_chunk
 import time
-from utils import get_mamico_loaders, losses2file, checkUserModelSpecs, dataset2csv
+from utils import get_mamico_loaders, get_mamico_chunk_loaders, checkUserModelSpecs, dataset2csv
+from metrics import MetricsWriter
 from plotting import plotMinMaxAvgLoss, compareFlowProfile
+from reductions import centerlines
+from render_queue import RenderQueue
 
 plt.style.use(['science'])
 np.set_printoptions(precision=6)
@@ -16,9 +19,12 @@ device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 NUM_WORKERS = 4             # guideline: 4* num_GPU
 PIN_MEMORY = True
 LOAD_MODEL = False
+TBPTT_CHUNK_LENGTH = 0      # coupling cycles per chunk, 0 -> train cycle by cycle
+LOG_INTERVAL = 100          # batches between two progress prints, all losses go to the metrics store
+RENDER_WORKERS = 1          # background plotting processes, 0 renders inline
 
 
-def train_hybrid(loader, model, optimizer, criterion, scaler, current_epoch):
+def train_hybrid(loader, model, optimizer, criterion, scaler, current_epoch, metrics=None):
     # BRIEF: The train function completes one epoch of the training cycle.
     # PARAMETERS:
     # loader - object of PyTorch-type DataLoader to automatically feed dataset
@@ -26,6 +32,8 @@ def train_hybrid(loader, model, optimizer, criterion, scaler, current_epoch):
     # optimizer - the optimization algorithm applied during training
     # criterion - the loss function applied to quantify the error
     # scaler -
+    # metrics - optional MetricsWriter that receives the loss of every batch
+    # as timeline, refer to metrics.py
     losses = []
     # @losses - container for each individually calculated loss
     counter = 0
@@ -58,16 +66,14 @@ def train_hybrid(loader, model, optimizer, criterion, scaler, current_epoch):
             max_loss = loss
             time_buffer = counter
 
-        if counter < 10:
-            num = '000'
-        elif counter < 100:
-            num = '00'
-        elif counter < 1000:
-            num = '0'
         duration = time.time() - start_time
 
-        print(
-            f'Progress: {num}{counter}/1000     Error: {loss:.7f}     Duration: {duration:.3f}')
+        if counter % LOG_INTERVAL == 0:
+            print(
+                f'Progress: {counter:04d}/{len(loader):04d}     Error: {losses[-1]:.7f}     Duration: {duration:.3f}')
+
+    if metrics is not None:
+        metrics.timeline('Training_Error_Timeline', losses)
 
     # Saving error values
     max_loss = max(losses)
@@ -88,7 +94,75 @@ def train_hybrid(loader, model, optimizer, criterion, scaler, current_epoch):
     return [max_loss, min_loss, final_loss, average_loss]
 
 
-def valid_hybrid(loader, model, criterion, scaler):
+def train_hybrid_tbptt(loader, model, optimizer, criterion, scaler, current_epoch, metrics=None):
+    # BRIEF: The truncated-BPTT variant of train_hybrid. It completes one epoch
+    # of the training cycle over all trajectories at once. Each batch is one
+    # chunk of consecutive coupling cycles from every trajectory, refer to
+    # MyMamicoChunkDataset. The RNN sequence state is carried from chunk to
+    # chunk, while gradients are truncated at chunk boundaries. Refer to
+    # forward_chunk for more details.
+    # PARAMETERS:
+    # loader - object of PyTorch-type DataLoader yielding chunks in order
+    # model - the model to be trained
+    # optimizer - the optimization algorithm applied during training
+    # criterion - the loss function applied to quantify the error
+    # scaler -
+    # metrics - optional MetricsWriter, refer to train_hybrid
+    losses = []
+    # @losses - container for each individually calculated (chunk) loss
+    sequence = None
+    # @sequence - RNN sequence state carried between chunks
+    max_loss = 0
+    # @max_loss - stores the largest loss in this epoch
+    time_buffer = 0
+    # @time_buffer - used to track the chunk at which max_loss occurs
+
+    for batch_idx, (data, targets) in enumerate(loader):
+        start_time = time.time()
+        data = data.float().to(device)
+        targets = targets.float().to(device)
+
+        if sequence is None:
+            sequence = initSequence(model, data.size(0))
+
+        # forward
+        with torch.cuda.amp.autocast():
+            scores, sequence = forward_chunk(model, data, sequence)
+            loss = criterion(scores, targets)
+            losses.append(loss.item())
+
+        # backward
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+
+        # Check for max error
+        if losses[-1] > max_loss:
+            max_loss = losses[-1]
+            time_buffer = batch_idx
+        duration = time.time() - start_time
+
+        if (batch_idx+1) % LOG_INTERVAL == 0:
+            print(
+                f'Progress: {batch_idx+1:04d}/{len(loader):04d}     Error: {losses[-1]:.7f}     Duration: {duration:.3f}')
+
+    if metrics is not None:
+        metrics.timeline('Training_Error_Timeline', losses)
+
+    # Saving error values
+    max_loss = max(losses)
+    min_loss = min(losses)
+    final_loss = losses[-1]
+    average_loss = sum(losses)/len(losses)
+    print('------------------------------------------------------------')
+    print(
+        f'Max loss at chunk={time_buffer}: {max_loss:.7f}, Min loss: {min_loss:.7f}')
+    print(f'Final loss: {final_loss:.7f}, Average loss: {average_loss:.7f}.')
+    print('------------------------------------------------------------')
+    return [max_loss, min_loss, final_loss, average_loss]
+
+
+def valid_hybrid(loader, model, criterion, scaler, metrics=None):
     # BRIEF: The valid function completes an epoch using the validation
     # loader WITHOUT updating the model. It is used as a performance metric.
     # PARAMETERS:
@@ -96,6 +170,7 @@ def valid_hybrid(loader, model, criterion, scaler):
     # model - the model to be validated
     # criterion - the loss function applied to quantify the error
     # scaler -
+    # metrics - optional MetricsWriter, refer to train_hybrid
 
     losses = []
     # @losses - container for each individually calculated loss
@@ -132,14 +207,12 @@ def valid_hybrid(loader, model, criterion, scaler):
             max_loss = loss
             time_buffer = counter
 
-        if counter < 10:
-            num = '000'
-        elif counter < 100:
-            num = '00'
-        elif counter < 1000:
-            num = '0'
+        if counter % LOG_INTERVAL == 0:
+            print(
+                f'Progress: {counter:04d}/{len(loader):04d}     Error: {losses[-1]:.7f}')
 
-        print(f'Progress: {num}{counter}/1000     Error: {loss:.7f}')
+    if metrics is not None:
+        metrics.timeline('Validation_Error_Timeline', losses)
 
     # Saving error values
     max_loss = max(losses)
@@ -159,7 +232,7 @@ def test_hybrid():
     pass
 
 
-def training_factory(user_input):
+def training_factory(user_input, chunk_length=TBPTT_CHUNK_LENGTH):
     # BRIEF: The training factory enables to train each hybrid model with
     # specified hyperparameters.
     # PARAMETERS:
@@ -167,6 +240,9 @@ def training_factory(user_input):
     # the user to define the training hyperparameters. It consists of:
     # [model_name, rnn_layers, hid_size, learning_rate]
     # _model_names =['Hybrid_MD_RNN_UNET', 'Hybrid_MD_GRU_UNET', 'Hybrid_MD_LSTM_UNET']
+    # chunk_length - if > 0, the model is trained via truncated BPTT on chunks
+    # of chunk_length coupling cycles from all training trajectories at once.
+    # Refer to train_hybrid_tbptt for more details.
 
     _model_name, _rnn_layer, _hid_size, _learning_rate = user_input
 
@@ -186,7 +262,12 @@ def training_factory(user_input):
     # @_batch_size - other batch sizes are not possible. Refer to model description for more intuition
     _num_epochs = 1
     # @_num_epochs - the amount of times the model will train with each dataset
-    _train_loaders, _valid_loaders = get_mamico_loaders()
+    if chunk_length > 0:
+        _train_loader, _valid_loaders = get_mamico_chunk_loaders(
+            chunk_length=chunk_length)
+        _train_loaders = [_train_loader]
+    else:
+        _train_loaders, _valid_loaders = get_mamico_loaders()
     # @_train_loaders - container to hold the dataloaders for each dataset
     _scaler = torch.cuda.amp.GradScaler()
     # @_scaler - @@@@@@@@@@@@
@@ -238,30 +319,36 @@ def training_factory(user_input):
 
     _optimizer = optim.Adam(_model.parameters(),
                             lr=_learning_rates[_learning_rate])
+    _metrics = MetricsWriter(f'Metrics_{_file_suffix}')
+    # @_metrics - asynchronous store for all losses, refer to metrics.py
+    _renderer = RenderQueue(max_workers=RENDER_WORKERS)
+    # @_renderer - renders all figures in the background, refer to render_queue.py
     # Training
     for _epoch in range(_num_epochs):
         for _train_loader in _train_loaders:
             resetPipeline(_model)
-            _interim_loss = train_hybrid(
+            _train = train_hybrid_tbptt if chunk_length > 0 else train_hybrid
+            _interim_loss = _train(
                 loader=_train_loader,
                 model=_model,
                 optimizer=_optimizer,
                 criterion=_criterion,
                 scaler=_scaler,
-                current_epoch=_epoch
+                current_epoch=_epoch,
+                metrics=_metrics
             )
             _max_losses.append(_interim_loss[0])
             _min_losses.append(_interim_loss[1])
             _average_losses.append(_interim_loss[3])
-
-    losses2file(_average_losses, f'Avg_Error_Training_{_file_suffix}')
-    losses2file(_max_losses, f'Max_Error_Training_{_file_suffix}')
-    losses2file(_min_losses, f'Min_Error_Training_{_file_suffix}')
-    # @losses2file is used to evaluate the development of the models loss.
-    # Here, not only the average loss is tracked, but also the min and max
-    # losses in order to track the deviation from the average.
-
-    plotMinMaxAvgLoss(
+            _metrics.scalar('Avg_Error_Training', _interim_loss[3])
+            _metrics.scalar('Max_Error_Training', _interim_loss[0])
+            _metrics.scalar('Min_Error_Training', _interim_loss[1])
+            # @_metrics is used to evaluate the development of the models loss.
+            # Here, not only the average loss is tracked, but also the min and
+            # max losses in order to track the deviation from the average.
+
+    _renderer.submit(
+        plotMinMaxAvgLoss,
         min_losses=_min_losses,
         avg_losses=_average_losses,
         max_losses=_max_losses,
@@ -282,11 +369,15 @@ def training_factory(user_input):
             loader=_valid_loader,
             model=_model,
             criterion=_criterion,
-            scaler=_scaler
+            scaler=_scaler,
+            metrics=_metrics
         )
         _max_valid_losses.append(_results[0])
         _min_valid_losses.append(_results[1])
         _avg_valid_losses.append(_results[2])
+        _metrics.scalar('Max_Error_Validation', _results[0])
+        _metrics.scalar('Min_Error_Validation', _results[1])
+        _metrics.scalar('Avg_Error_Validation', _results[2])
         dataset2csv(
             dataset=_results[3],
             model_descriptor=_file_suffix,
@@ -298,15 +389,15 @@ def training_factory(user_input):
             dataset_name='targs',
             counter=_counter)
         _counter += 1
-        compareFlowProfile(
-            preds=_results[3],
-            targs=_results[4],
+        _renderer.submit(
+            compareFlowProfile,
+            preds=centerlines(_results[3]),
+            targs=centerlines(_results[4]),
             model_descriptor=_file_suffix
         )
 
-    losses2file(_max_valid_losses, f'Max_Error_Validation_{_file_suffix}')
-    losses2file(_min_valid_losses, f'Min_Error_Validation_{_file_suffix}')
-    losses2file(_avg_valid_losses, f'Avg_Error_Validation_{_file_suffix}')
+    _metrics.close()
+    _renderer.close()
 
     model_performance(
         model_name=_model_name,
@@ -2,7 +2,7 @@ import torch
 import numpy as np
 import time
 import csv
-from dataset import MyMamicoDataset
+from dataset import MyMamicoDataset, MyMamicoChunkDataset
 from torch.utils.data import DataLoader
 
 
@@ -180,6 +180,72 @@ def get_mamico_loaders(file_names=0, num_workers=4):
     return dataloaders_train, dataloaders_valid
 
 
+def get_mamico_chunk_loaders(file_names=0, chunk_length=25, num_workers=4):
+    #
+    # This function creates the dataloaders needed for truncated-BPTT
+    # training of the hybrid models. As opposed to get_mamico_loaders, all
+    # training datasets are combined into a single dataloader that yields
+    # chunks of chunk_length coupling cycles for every trajectory at once.
+    # Refer to MyMamicoChunkDataset for more details. The validation
+    # dataloaders are identical to those of get_mamico_loaders.
+    #
+    _train_datasets = []
+    dataloaders_valid = []
+
+    if file_names == 0:
+        _train_files = [
+            'clean_couette_test_combined_domain_0_5_top.csv',
+        ]
+
+        _valid_files = [
+            'clean_couette_test_combined_domain_3_0_top.csv',
+        ]
+
+        for file_name in _valid_files:
+            print(f'Loading validation dataset as loader: {file_name}')
+            dataset = mamico_csv2dataset(f'{file_name}')
+            dataset = MyMamicoDataset(dataset)
+            dataloader = DataLoader(
+                dataset=dataset,
+                batch_size=1,
+                shuffle=False,
+                num_workers=num_workers
+                )
+            dataloaders_valid.append(dataloader)
+            print('Completed loading validation dataset.')
+
+        for file_name in _train_files:
+            print(f'Loading training dataset: {file_name}')
+            _train_datasets.append(mamico_csv2dataset(f'{file_name}'))
+    else:
+        for i in range(5):
+            print('Loading ---> RANDOM <--- training dataset.')
+            _train_datasets.append(np.random.rand(25, 3, 26, 26, 26))
+        for i in range(3):
+            print('Loading ---> RANDOM <--- validation dataset as loader.')
+            dataset = np.random.rand(25, 3, 26, 26, 26)
+            dataset = MyMamicoDataset(dataset)
+            dataloader = DataLoader(
+                dataset=dataset,
+                batch_size=1,
+                shuffle=False,
+                num_workers=num_workers
+                )
+            dataloaders_valid.append(dataloader)
+
+    dataset = MyMamicoChunkDataset(_train_datasets, chunk_length)
+    dataloader_train = DataLoader(
+        dataset=dataset,
+        batch_size=None,
+        shuffle=False,
+        num_workers=num_workers
+        )
+    print(f'Completed loading {len(_train_datasets)} training datasets '
+          f'as {len(dataset)} chunks of length {chunk_length}.')
+
+    return dataloader_train, dataloaders_valid
+
+
 def checkUserModelSpecs(user_input):
     # BRIEF: This allows to verify that the user command line arguments are
     # valid and adhere to the coding convention.
@@ -0,0 +1,340 @@
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import torch
+import numpy as np
+import torch.nn as nn
+from model import AE, UNET_AE, RNN, GRU, LSTM, Hybrid_MD_RNN_UNET, resetPipeline
+from dataset import MyMamicoDataset_UNET_AE, MyMamicoDataset_RNN, MyMamicoDataset_Hybrid
+from utils_new import mamico_csv2dataset
+
+DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+TOLERANCE = 0.10            # relative change that is flagged as a regression
+
+
+def _synchronize():
+    if DEVICE.type == 'cuda':
+        torch.cuda.synchronize()
+
+
+def _time_it(function, repeats, warmup=1):
+    """The _time_it function calls function warmup times without and repeats
+    times with timing and returns the individual durations in seconds."""
+    for _ in range(warmup):
+        function()
+    _synchronize()
+    _durations = []
+    for _ in range(repeats):
+        _start = time.perf_counter()
+        function()
+        _synchronize()
+        _durations.append(time.perf_counter() - _start)
+    return np.array(_durations)
+
+
+def _result(value, unit, higher_is_better):
+    return {'value': float(value), 'unit': unit,
+            'higher_is_better': higher_is_better}
+
+
+def benchmark_csv2dataset(num_cycles=20):
+    """The benchmark_csv2dataset function measures the ingestion throughput of
+    the mamico_csv2dataset function in csv rows per second. A synthetic csv
+    file of num_cycles coupling cycles in the MaMiCo format is used.
+
+    Args:
+        num_cycles:
+          Object of integer type specifying the number of coupling cycles.
+
+    Returns:
+        results:
+          Object of dict type containing the benchmark results.
+    """
+    with tempfile.TemporaryDirectory() as _dir:
+        _file_name = os.path.join(_dir, 'clean_benchmark.csv')
+        _rows = 0
+        with open(_file_name, 'w') as f:
+            for _t in range(1, num_cycles+1):
+                for _x in range(1, 27):
+                    for _y in range(1, 27):
+                        for _z in range(1, 27):
+                            f.write(f'{_t};{_x};{_y};{_z};0.1;0.2;0.3;0\n')
+                            _rows += 1
+        _durations = _time_it(lambda: mamico_csv2dataset(_file_name),
+                              repeats=1, warmup=0)
+    return {'csv2dataset_rows_per_s': _result(
+        _rows/_durations.min(), 'rows/s', True)}
+
+
+def benchmark_datasets(num_items=1000):
+    """The benchmark_datasets function measures the __getitem__ throughput of
+    the UNET_AE, RNN and Hybrid datasets in items per second.
+
+    Args:
+        num_items:
+          Object of integer type specifying the number of items per dataset.
+
+    Returns:
+        results:
+          Object of dict type containing the benchmark results.
+    """
+    _md = np.random.rand(100, 3, 26, 26, 26)
+    _datasets = {
+        'UNET_AE': MyMamicoDataset_UNET_AE(_md),
+        'RNN': MyMamicoDataset_RNN(np.random.rand(1000, 256), 25),
+        'Hybrid': MyMamicoDataset_Hybrid(_md)
+    }
+    _results = {}
+    for _name, _dataset in _datasets.items():
+        _length = len(_dataset)
+
+        def _iterate():
+            for _i in range(num_items):
+                _dataset[_i % _length]
+
+        _durations = _time_it(_iterate, repeats=3)
+        _results[f'dataset_{_name}_items_per_s'] = _result(
+            num_items/np.median(_durations), 'items/s', True)
+    return _results
+
+
+def benchmark_autoencoders(batch_sizes=[1, 8, 32], repeats=5):
+    """The benchmark_autoencoders function measures the forward and the
+    forward+backward latency of UNET_AE and AE at 24^3 for several batch
+    sizes. The median latency in milliseconds is reported.
+
+    Args:
+        batch_sizes:
+          Object of list type containing the batch sizes to benchmark.
+        repeats:
+          Object of integer type specifying the number of timed repetitions.
+
+    Returns:
+        results:
+          Object of dict type containing the benchmark results.
+    """
+    _results = {}
+    for _model_class in [UNET_AE, AE]:
+        _model = _model_class(
+            device=DEVICE,
+            in_channels=3,
+            out_channels=3,
+            features=[4, 8, 16],
+            activation=nn.ReLU(inplace=True)
+        ).to(DEVICE)
+        _name = _model_class.__name__
+
+        for _batch_size in batch_sizes:
+            _input = torch.rand(_batch_size, 3, 24, 24, 24).to(DEVICE)
+
+            def _forward():
+                with torch.no_grad():
+                    _model(_input)
+
+            def _backward():
+                _model(_input).mean().backward()
+                _model.zero_grad(set_to_none=True)
+
+            _results[f'{_name}_forward_b{_batch_size}_ms'] = _result(
+                1000*np.median(_time_it(_forward, repeats)), 'ms', False)
+            _results[f'{_name}_backward_b{_batch_size}_ms'] = _result(
+                1000*np.median(_time_it(_backward, repeats)), 'ms', False)
+    return _results
+
+
+def benchmark_recurrent(seq_lengths=[15, 25], batch_sizes=[1, 32], repeats=20):
+    """The benchmark_recurrent function measures the forward latency of the
+    RNN, GRU and LSTM models for several sequence lengths and batch sizes. The
+    median latency in milliseconds is reported.
+
+    Args:
+        seq_lengths:
+          Object of list type containing the sequence lengths to benchmark.
+        batch_sizes:
+          Object of list type containing the batch sizes to benchmark.
+        repeats:
+          Object of integer type specifying the number of timed repetitions.
+
+    Returns:
+        results:
+          Object of dict type containing the benchmark results.
+    """
+    _results = {}
+    for _model_class in [RNN, GRU, LSTM]:
+        for _seq_length in seq_lengths:
+            _model = _model_class(
+                input_size=256,
+                hidden_size=256,
+                seq_size=_seq_length,
+                num_layers=1,
+                device=DEVICE
+            ).to(DEVICE)
+            _name = _model_class.__name__
+
+            for _batch_size in batch_sizes:
+                _input = torch.rand(_batch_size, _seq_length, 256).to(DEVICE)
+
+                def _forward():
+                    with torch.no_grad():
+                        _model(_input)
+
+                _results[f'{_name}_forward_s{_seq_length}_b{_batch_size}_ms'] = \
+                    _result(1000*np.median(_time_it(_forward, repeats)),
+                            'ms', False)
+    return _results
+
+
+def benchmark_hybrid(num_cycles=100):
+    """The benchmark_hybrid function measures the end-to-end latency of a
+    single coupling cycle of the Hybrid_MD_RNN_UNET model, i.e. encoder, FIFO
+    pipeline, RNN and decoder. Median and 99th percentile are reported.
+
+    Args:
+        num_cycles:
+          Object of integer type specifying the number of coupling cycles.
+
+    Returns:
+        results:
+          Object of dict type containing the benchmark results.
+    """
+    _model_unet = UNET_AE(
+        device=DEVICE,
+        in_channels=3,
+        out_channels=3,
+        features=[4, 8, 16],
+        activation=nn.ReLU(inplace=True)
+    ).to(DEVICE)
+    _model_rnn = LSTM(
+        input_size=256,
+        hidden_size=256,
+        seq_size=25,
+        num_layers=1,
+        device=DEVICE
+    ).to(DEVICE)
+    _model_hybrid = Hybrid_MD_RNN_UNET(
+        device=DEVICE,
+        UNET_Model=_model_unet,
+        RNN_Model=_model_rnn,
+        seq_length=25
+    ).to(DEVICE)
+    resetPipeline(_model_hybrid)
+    _input = torch.rand(1, 3, 24, 24, 24).to(DEVICE)
+
+    def _cycle():
+        with torch.no_grad():
+            _model_hybrid(_input)
+
+    _durations = 1000*_time_it(_cycle, num_cycles, warmup=5)
+    return {
+        'Hybrid_MD_RNN_UNET_cycle_p50_ms': _result(
+            np.percentile(_durations, 50), 'ms', False),
+        'Hybrid_MD_RNN_UNET_cycle_p99_ms': _result(
+            np.percentile(_durations, 99), 'ms', False)
+    }
+
+
+def run_benchmarks(out_file, quick=False):
+    """The run_benchmarks function runs the entire benchmark suite and writes
+    the results alongside some metadata to out_file in JSON format.
+
+    Args:
+        out_file:
+          Object of string type containing the name of the output file.
+        quick:
+          Object of boolean type. If True, fewer repetitions are performed.
+
+    Returns:
+        results:
+          Object of dict type containing metadata and benchmark results.
+    """
+    torch.manual_seed(10)
+    np.random.seed(10)
+    _results = {}
+    _results.update(benchmark_csv2dataset(num_cycles=2 if quick else 20))
+    _results.update(benchmark_datasets(num_items=100 if quick else 1000))
+    _results.update(benchmark_autoencoders(repeats=2 if quick else 5))
+    _results.update(benchmark_recurrent(repeats=5 if quick else 20))
+    _results.update(benchmark_hybrid(num_cycles=20 if quick else 100))
+
+    _output = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'torch': torch.__version__,
+            'numpy': np.__version__,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'device': DEVICE.type,
+            'num_threads': torch.get_num_threads(),
+            'quick': quick
+        },
+        'results': _results
+    }
+    with open(out_file, 'w') as f:
+        json.dump(_output, f, indent=2)
+
+    for _name, _entry in _results.items():
+        print(f'{_name:<45} {_entry["value"]:>14.3f} {_entry["unit"]}')
+    return _output
+
+
+def compare_benchmarks(baseline_file, current_file, tolerance=TOLERANCE):
+    """The compare_benchmarks function compares two benchmark result files
+    and flags every benchmark whose result got worse by more than tolerance
+    relative to the baseline.
+
+    Args:
+        baseline_file:
+          Object of string type containing the name of the baseline file.
+        current_file:
+          Object of string type containing the name of the current file.
+        tolerance:
+          A double value indicating the accepted relative deterioration.
+
+    Returns:
+        regressions:
+          Object of list type containing the names of regressed benchmarks.
+    """
+    with open(baseline_file) as f:
+        _baseline = json.load(f)['results']
+    with open(current_file) as f:
+        _current = json.load(f)['results']
+
+    _regressions = []
+    print(f'{"Benchmark":<45} {"Baseline":>12} {"Current":>12} {"Change":>9}')
+    for _name, _entry in _current.items():
+        if _name not in _baseline:
+            print(f'{_name:<45} {"-":>12} {_entry["value"]:>12.3f}       new')
+            continue
+        _old = _baseline[_name]['value']
+        _new = _entry['value']
+        _change = (_new - _old) / _old
+        # Positive values of _deterioration always indicate a slowdown.
+        _deterioration = -_change if _entry['higher_is_better'] else _change
+        _flag = ''
+        if _deterioration > tolerance:
+            _flag = '  REGRESSION'
+            _regressions.append(_name)
+        print(f'{_name:<45} {_old:>12.3f} {_new:>12.3f} '
+              f'{100*_change:>+8.1f}%{_flag}')
+
+    print('------------------------------------------------------------')
+    print(f'{len(_regressions)} regression(s) beyond {100*tolerance:.0f}%.')
+    return _regressions
+
+
+if __name__ == "__main__":
+    # python benchmark.py run <out.json> [quick]
+    # python benchmark.py compare <baseline.json> <current.json> [tolerance]
+    if len(sys.argv) > 2 and sys.argv[1] == 'run':
+        run_benchmarks(sys.argv[2], quick='quick' in sys.argv[3:])
+    elif len(sys.argv) > 3 and sys.argv[1] == 'compare':
+        _tolerance = float(sys.argv[4]) if len(sys.argv) > 4 else TOLERANCE
+        if compare_benchmarks(sys.argv[2], sys.argv[3], _tolerance):
+            sys.exit(1)
+    else:
+        print('Usage: python benchmark.py run <out.json> [quick]')
+        print('       python benchmark.py compare <baseline.json> '
+              '<current.json> [tolerance]')
@@ -0,0 +1,339 @@
+import os
+import sys
+import time
+import hashlib
+import contextlib
+import torch
+import torch.nn as nn
+from model import AE, UNET_AE, RNN, GRU, LSTM, Hybrid_MD_RNN_UNET, resetPipeline
+
+DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+COMPILE_CACHE_DIR = '/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/' + \
+    '3_Constituent_Hybrid_approach/CompileCache/'
+
+
+def compile_config_key(model, input_shape, dtype, mode=None):
+    """The compile_config_key function creates the key under which compiled
+    artifacts of a model are cached. The key covers the model architecture,
+    input shape, dtype, compile mode and torch version, but NOT the model
+    weights, since compiled graphs do not depend on them.
+
+    Args:
+        model:
+          Object of PyTorch Module class, i.e. the model to be compiled.
+        input_shape:
+          Object of tuple type containing the shape of the model input.
+        dtype:
+          Object of torch.dtype type of the model input.
+        mode:
+          Object of string type passed on to torch.compile, or None.
+
+    Returns:
+        key:
+          Object of string type uniquely identifying the configuration.
+    """
+    _config = f'{repr(model)}|{tuple(input_shape)}|{dtype}|{mode}|' + \
+        f'{torch.__version__}|{DEVICE.type}'
+    _digest = hashlib.sha256(_config.encode()).hexdigest()[:16]
+    return f'{type(model).__name__}_{_digest}'
+
+
+def _load_artifacts(artifact_file):
+    if not os.path.isfile(artifact_file):
+        return False
+    with open(artifact_file, 'rb') as f:
+        torch.compiler.load_cache_artifacts(f.read())
+    return True
+
+
+def _artifact_scope():
+    # torch.compiler.save_cache_artifacts returns every artifact recorded in
+    # the process so far. A fresh scope per compiled configuration limits its
+    # artifact file to the artifacts of that configuration.
+    try:
+        from torch.compiler._cache import CacheArtifactManager
+        return CacheArtifactManager.with_fresh_cache()
+    except (ImportError, AttributeError):
+        return contextlib.nullcontext()
+
+
+def _save_artifacts(artifact_file):
+    _artifacts = torch.compiler.save_cache_artifacts()
+    if _artifacts is None:
+        return
+    # Written via a temporary file so concurrent workers never read partially
+    # written artifacts.
+    _tmp = f'{artifact_file}.{os.getpid()}.tmp'
+    with open(_tmp, 'wb') as f:
+        f.write(_artifacts[0])
+    os.replace(_tmp, artifact_file)
+
+
+def explain_graph_breaks(model, example_input):
+    """The explain_graph_breaks function traces the model with torch._dynamo
+    and prints the number of graphs and graph breaks alongside the reasons
+    for each break. Graph breaks split the model into several compiled
+    regions, which reduces the benefit of compilation.
+
+    Args:
+        model:
+          Object of PyTorch Module class, i.e. the model to be analyzed.
+        example_input:
+          Object of PyTorch Tensor class used to trace the model.
+
+    Returns:
+        explanation:
+          Object of torch._dynamo ExplainOutput class.
+    """
+    _explanation = torch._dynamo.explain(model)(example_input)
+    print('------------------------------------------------------------')
+    print('                   Graph Break Summary                      ')
+    print(f'Model\t\t: {type(model).__name__}')
+    print(f'Graphs\t\t= {_explanation.graph_count}')
+    print(f'Graph breaks\t= {_explanation.graph_break_count}')
+    for _idx, _reason in enumerate(_explanation.break_reasons):
+        print(f'Break {_idx+1}\t: {_reason.reason}')
+    print('------------------------------------------------------------')
+    torch._dynamo.reset()
+    return _explanation
+
+
+def compile_model(model, example_input, train=False, mode=None, cache_dir=COMPILE_CACHE_DIR, report=False):
+    """The compile_model function compiles a model via torch.compile for the
+    given input shape and warms it up once. The batch dimension is compiled
+    as dynamic, i.e. batches of any size reuse the same graph. Compiled
+    artifacts are cached per (model, shape, dtype) configuration in cache_dir.
+    As such, only the first process to compile a configuration pays the full
+    compile cost, while e.g. spawned sweep workers load the cached artifacts
+    instead.
+
+    Note that the returned module shares its parameters with the given model.
+    Checkpoints should still be created from the given (uncompiled) model so
+    that the state_dict keys remain unchanged.
+
+    Args:
+        model:
+          Object of PyTorch Module class, i.e. the model to be compiled.
+        example_input:
+          Object of PyTorch Tensor class of the shape and dtype used later on,
+          apart from the batch size.
+        train:
+          Object of boolean type. If True, the backward pass is warmed up and
+          cached as well.
+        mode:
+          Object of string type passed on to torch.compile, or None.
+        cache_dir:
+          Object of string type containing the path of the cache directory.
+        report:
+          Object of boolean type. If True, graph breaks are printed first.
+
+    Returns:
+        compiled_model:
+          Object of PyTorch Module class, i.e. the compiled model.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR',
+                          os.path.join(cache_dir, 'inductor'))
+
+    if report:
+        explain_graph_breaks(model, example_input)
+
+    # The batch dimension is dynamic, so that e.g. the partial last batch of
+    # a loader does not trigger a recompile. Hence, it is not part of the key.
+    _key = compile_config_key(model, ('batch',) + tuple(example_input.shape[1:]),
+                              example_input.dtype, mode)
+    _artifact_file = os.path.join(cache_dir, f'{_key}.bin')
+
+    with _artifact_scope():
+        _cached = _load_artifacts(_artifact_file)
+        _compiled_model = torch.compile(model, mode=mode)
+        torch._dynamo.mark_dynamic(example_input, 0)
+
+        _start = time.time()
+        if train:
+            _compiled_model(example_input).float().mean().backward()
+            model.zero_grad(set_to_none=True)
+        else:
+            with torch.no_grad():
+                _compiled_model(example_input)
+        _duration = time.time() - _start
+        print(f'Compiled {_key} ({"cached" if _cached else "cold"}) '
+              f'in {_duration:.1f}s.')
+
+        if not _cached:
+            _save_artifacts(_artifact_file)
+
+    return _compiled_model
+
+
+def compile_hybrid(model, cache_dir=COMPILE_CACHE_DIR, report=False):
+    """The compile_hybrid function compiles the constituent models of a
+    Hybrid_MD_RNN_UNET or Hybrid_MD_RNN_AE for inference. The FIFO pipeline
+    mutates the hybrid model's state on every coupling cycle, hence only the
+    stateless constituents are compiled. Artifacts are cached per hybrid
+    configuration, refer to compile_model. The hybrid is modified in place.
+
+    Args:
+        model:
+          Object of PyTorch Module class, i.e. the hybrid model.
+        cache_dir:
+          Object of string type containing the path of the cache directory.
+        report:
+          Object of boolean type. If True, graph breaks are printed first.
+
+    Returns:
+        model:
+          Object of PyTorch Module class, i.e. the hybrid model.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR',
+                          os.path.join(cache_dir, 'inductor'))
+
+    _name = 'unet' if hasattr(model, 'unet') else 'AE'
+    _input = torch.zeros(1, 3, 24, 24, 24).to(model.device)
+
+    if report:
+        explain_graph_breaks(model.rnn, torch.zeros(
+            1, model.seq_length, 256).to(model.device))
+
+    _key = compile_config_key(model, _input.shape, _input.dtype)
+    _artifact_file = os.path.join(cache_dir, f'{_key}.bin')
+
+    # The coupling cycle always processes a batch of one, i.e. all shapes
+    # are static.
+    with _artifact_scope():
+        _cached = _load_artifacts(_artifact_file)
+        setattr(model, _name, torch.compile(getattr(model, _name), dynamic=False))
+        model.rnn = torch.compile(model.rnn, dynamic=False)
+
+        # Warm-up: traces the encoder, the RNN and the decoder once.
+        _start = time.time()
+        _sequence = model.sequence
+        with torch.no_grad():
+            model(_input)
+        model.sequence = _sequence
+        _duration = time.time() - _start
+        print(f'Compiled {_key} ({"cached" if _cached else "cold"}) '
+              f'in {_duration:.1f}s.')
+
+        if not _cached:
+            _save_artifacts(_artifact_file)
+    return model
+
+
+def benchmark_compile(model, example_input, num_steps=20, train=True, cache_dir=COMPILE_CACHE_DIR):
+    """The benchmark_compile function compares the steps per second of the
+    eager and the compiled model. A training step comprises forward pass,
+    backward pass and optimizer step, an inference step only the forward pass.
+    Compilation and warm-up are excluded from the measurement.
+
+    Args:
+        model:
+          Object of PyTorch Module class, i.e. the model to be benchmarked.
+        example_input:
+          Object of PyTorch Tensor class used as input.
+        num_steps:
+          Object of integer type specifying the number of timed steps.
+        train:
+          Object of boolean type to benchmark training or inference steps.
+        cache_dir:
+          Object of string type containing the path of the cache directory.
+
+    Returns:
+        results:
+          Object of dict type containing the steps per second in eager and
+          compiled mode as well as the speedup.
+    """
+    _optimizer = torch.optim.Adam(model.parameters(), lr=0.0001)
+
+    def _steps_per_second(_model):
+        def _step():
+            if train:
+                _model(example_input).float().mean().backward()
+                _optimizer.step()
+                _optimizer.zero_grad()
+            else:
+                with torch.no_grad():
+                    _model(example_input)
+
+        _step()
+        if DEVICE.type == 'cuda':
+            torch.cuda.synchronize()
+        _start = time.perf_counter()
+        for _ in range(num_steps):
+            _step()
+        if DEVICE.type == 'cuda':
+            torch.cuda.synchronize()
+        return num_steps / (time.perf_counter() - _start)
+
+    _eager = _steps_per_second(model)
+    _compiled = _steps_per_second(compile_model(
+        model, example_input, train=train, cache_dir=cache_dir))
+
+    print(f'{type(model).__name__} {"training" if train else "inference"} '
+          f'{tuple(example_input.shape)}: eager {_eager:.2f} steps/s, '
+          f'compiled {_compiled:.2f} steps/s, speedup {_compiled/_eager:.2f}x')
+    return {'eager': _eager, 'compiled': _compiled,
+            'speedup': _compiled/_eager}
+
+
+def benchmark_compile_all(cache_dir=COMPILE_CACHE_DIR):
+    """The benchmark_compile_all function runs benchmark_compile for the
+    UNET_AE, AE and the recurrent models in their training configuration as
+    well as for the Hybrid_MD_RNN_UNET in inference.
+
+    Args:
+        cache_dir:
+          Object of string type containing the path of the cache directory.
+
+    Returns:
+        NONE:
+    """
+    _models = [
+        UNET_AE(device=DEVICE, in_channels=3, out_channels=3,
+                features=[4, 8, 16], activation=nn.ReLU(inplace=True)),
+        AE(device=DEVICE, in_channels=3, out_channels=3,
+           features=[4, 8, 16], activation=nn.ReLU(inplace=True))
+    ]
+    for _model in _models:
+        benchmark_compile(_model.to(DEVICE),
+                          torch.rand(32, 3, 24, 24, 24).to(DEVICE),
+                          cache_dir=cache_dir)
+
+    for _model_class in [RNN, GRU, LSTM]:
+        _model = _model_class(input_size=256, hidden_size=256, seq_size=25,
+                              num_layers=1, device=DEVICE).to(DEVICE)
+        benchmark_compile(_model, torch.rand(32, 25, 256).to(DEVICE),
+                          cache_dir=cache_dir)
+
+    _model_unet = UNET_AE(device=DEVICE, in_channels=3, out_channels=3,
+                          features=[4, 8, 16],
+                          activation=nn.ReLU(inplace=True)).to(DEVICE)
+    _model_rnn = LSTM(input_size=256, hidden_size=256, seq_size=25,
+                      num_layers=1, device=DEVICE).to(DEVICE)
+    _input = torch.rand(1, 3, 24, 24, 24).to(DEVICE)
+
+    _results = []
+    for _compile in [False, True]:
+        _model_hybrid = Hybrid_MD_RNN_UNET(
+            device=DEVICE, UNET_Model=_model_unet, RNN_Model=_model_rnn,
+            seq_length=25).to(DEVICE)
+        if _compile:
+            compile_hybrid(_model_hybrid, cache_dir=cache_dir)
+        resetPipeline(_model_hybrid)
+        with torch.no_grad():
+            _model_hybrid(_input)
+            _start = time.perf_counter()
+            for _ in range(100):
+                _model_hybrid(_input)
+        _results.append(100 / (time.perf_counter() - _start))
+    print(f'Hybrid_MD_RNN_UNET inference: eager {_results[0]:.2f} cycles/s, '
+          f'compiled {_results[1]:.2f} cycles/s, '
+          f'speedup {_results[1]/_results[0]:.2f}x')
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        benchmark_compile_all(cache_dir=sys.argv[1])
+    else:
+        benchmark_compile_all()
@@ -0,0 +1,366 @@
+import time
+import weakref
+import torch
+import torch.nn as nn
+from model import AE, UNET_AE, RNN, GRU, LSTM, Hybrid_MD_RNN_UNET, Hybrid_MD_RNN_AE
+
+DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+# Number of gates per recurrent cell, i.e. the number of hidden_size wide
+# affine transforms applied to [x_t, h_t-1] per time step.
+_GATES = {nn.RNN: 1, nn.GRU: 3, nn.LSTM: 4}
+
+
+def _tensor_bytes(tensors):
+    if isinstance(tensors, torch.Tensor):
+        return tensors.numel() * tensors.element_size()
+    if isinstance(tensors, (tuple, list)):
+        return sum(_tensor_bytes(_t) for _t in tensors)
+    return 0
+
+
+def _first_tensor(tensors):
+    if isinstance(tensors, torch.Tensor):
+        return tensors
+    for _t in tensors:
+        _first = _first_tensor(_t)
+        if _first is not None:
+            return _first
+    return None
+
+
+def layer_macs(module, inputs, output):
+    """The layer_macs function analytically computes the multiply-accumulate
+    operations of a single layer call from its input and output shapes. Only
+    Conv3d, ConvTranspose3d, Linear and the recurrent layers contribute.
+    Activations and pooling are considered free in terms of MACs, their cost
+    is dominated by memory traffic.
+
+    Args:
+        module:
+          Object of PyTorch Module class, i.e. the (leaf) layer.
+        inputs:
+          Object of tuple type containing the layer inputs.
+        output:
+          The layer output.
+
+    Returns:
+        macs:
+          Object of integer type containing the MACs of this call.
+    """
+    _x = _first_tensor(inputs)
+    _y = _first_tensor(output)
+
+    if isinstance(module, nn.Conv3d):
+        _k = module.kernel_size[0] * module.kernel_size[1] * \
+            module.kernel_size[2]
+        return _y.numel() * (module.in_channels // module.groups) * _k
+
+    if isinstance(module, nn.ConvTranspose3d):
+        _k = module.kernel_size[0] * module.kernel_size[1] * \
+            module.kernel_size[2]
+        return _x.numel() * (module.out_channels // module.groups) * _k
+
+    if isinstance(module, nn.Linear):
+        return (_x.numel() // module.in_features) * module.in_features * \
+            module.out_features
+
+    if type(module) in _GATES:
+        _gates = _GATES[type(module)]
+        _directions = 2 if module.bidirectional else 1
+        _batch, _seq = (_x.shape[0], _x.shape[1]) if module.batch_first \
+            else (_x.shape[1], _x.shape[0])
+        _macs = 0
+        for _layer in range(module.num_layers):
+            _in = module.input_size if _layer == 0 else \
+                module.hidden_size * _directions
+            _macs += _gates * module.hidden_size * (_in + module.hidden_size)
+        return _macs * _batch * _seq * _directions
+
+    return 0
+
+
+def measure_roofline(size=1024, repeats=10):
+    """The measure_roofline function measures the attainable peak compute
+    (matrix multiplication) and memory bandwidth (tensor copy) of the current
+    device. These serve as the roof of the roofline model.
+
+    Args:
+        size:
+          Object of integer type specifying the matrix dimension.
+        repeats:
+          Object of integer type specifying the number of timed repetitions.
+
+    Returns:
+        peak_macs_per_s:
+          A double value indicating the attainable MACs per second.
+        bytes_per_s:
+          A double value indicating the attainable memory bandwidth.
+    """
+    def _best_time(function):
+        function()
+        _best = float('inf')
+        for _ in range(repeats):
+            if DEVICE.type == 'cuda':
+                torch.cuda.synchronize()
+            _start = time.perf_counter()
+            function()
+            if DEVICE.type == 'cuda':
+                torch.cuda.synchronize()
+            _best = min(_best, time.perf_counter() - _start)
+        return _best
+
+    _a = torch.rand(size, size, device=DEVICE)
+    _b = torch.rand(size, size, device=DEVICE)
+    _peak_macs_per_s = size**3 / _best_time(lambda: torch.mm(_a, _b))
+
+    _src = torch.rand(64 * 1024 * 1024 // 4, device=DEVICE)
+    _dst = torch.empty_like(_src)
+    _bytes_per_s = 2 * _tensor_bytes(_src) / _best_time(
+        lambda: _dst.copy_(_src))
+    return _peak_macs_per_s, _bytes_per_s
+
+
+def cost_model(model, example_input, train=False, repeats=5, roofline=None):
+    """The cost_model function creates a per-layer cost report for the given
+    model and input. Every call of a leaf layer is recorded with its MACs,
+    parameter bytes, output activation bytes and measured time. Layers that
+    are called several times (e.g. shared activations) appear once per call.
+
+    The peak activation memory is derived from tensor lifetimes: an output
+    stays live until it is freed, so skip connections (and, with train=True,
+    tensors saved for the backward pass) are accounted for.
+
+    Finally, a roofline prediction max(MACs / peak, bytes / bandwidth) per
+    layer is compared with the measured time, yielding the efficiency.
+
+    Args:
+        model:
+          Object of PyTorch Module class, i.e. the model to be analyzed.
+        example_input:
+          Object of PyTorch Tensor class used as model input.
+        train:
+          Object of boolean type. If True, the forward pass records the
+          autograd graph as in training.
+        repeats:
+          Object of integer type specifying the number of timed repetitions.
+        roofline:
+          Object of tuple type as returned by measure_roofline. Measured on
+          demand if not provided.
+
+    Returns:
+        report:
+          Object of dict type containing 'layers' and 'total'.
+    """
+    if roofline is None:
+        roofline = measure_roofline()
+    _peak_macs_per_s, _bytes_per_s = roofline
+
+    # Leaf layers may be shared (e.g. one activation instance for all
+    # DoubleConvs), hence they are named after the container that calls them.
+    _leaves = []
+    _containers = {}
+    for _name, _module in model.named_modules():
+        if len(list(_module.children())) == 0:
+            _leaves.append(_module)
+        else:
+            _containers[_module] = _name
+    _stack = []
+
+    def _leaf_name(_module):
+        # Children of uncalled containers such as ModuleList are found via
+        # the calling module's descendants.
+        _parent = _stack[-1]
+        _key = next(_k for _k, _v in _parent.named_modules(
+            remove_duplicate=False) if _v is _module)
+        _prefix = _containers[_parent]
+        return f'{_prefix}.{_key}' if _prefix else _key
+
+    def _push(_module, _inputs):
+        _stack.append(_module)
+
+    def _pop(_module, _inputs, _output):
+        _stack.pop()
+
+    _layers = []
+    _state = {'record': False, 'call': 0, 'start': 0.0}
+    _live = {}
+    _timeline = []
+
+    def _free(_ptr):
+        _live.pop(_ptr, None)
+
+    def _pre_hook(_module, _inputs):
+        if DEVICE.type == 'cuda':
+            torch.cuda.synchronize()
+        _state['start'] = time.perf_counter()
+
+    def _post_hook(_module, _inputs, _output):
+        if DEVICE.type == 'cuda':
+            torch.cuda.synchronize()
+        _duration = time.perf_counter() - _state['start']
+        _call = _state['call']
+        _state['call'] += 1
+
+        if not _state['record']:
+            _layers[_call]['times'].append(_duration)
+            return
+
+        _y = _first_tensor(_output)
+        _ptr = _y.untyped_storage().data_ptr()
+        if _ptr not in _live:
+            _live[_ptr] = _tensor_bytes(_y)
+            weakref.finalize(_y.untyped_storage(), _free, _ptr)
+        _timeline.append(sum(_live.values()))
+
+        _param_bytes = sum(_tensor_bytes(_p)
+                           for _p in _module.parameters(recurse=False))
+        _layers.append({
+            'name': _leaf_name(_module),
+            'type': type(_module).__name__,
+            'output_shape': tuple(_y.shape),
+            'macs': layer_macs(_module, _inputs, _output),
+            'param_bytes': _param_bytes,
+            'activation_bytes': _tensor_bytes(_output),
+            'traffic_bytes': _tensor_bytes(_inputs) + _tensor_bytes(_output)
+            + _param_bytes,
+            'times': [_duration]
+        })
+
+    _handles = []
+    for _module in _containers:
+        _handles.append(_module.register_forward_pre_hook(_push))
+        _handles.append(_module.register_forward_hook(_pop))
+    for _module in _leaves:
+        _handles.append(_module.register_forward_pre_hook(_pre_hook))
+        _handles.append(_module.register_forward_hook(_post_hook))
+
+    _sequence = getattr(model, 'sequence', None)
+    _total_times = []
+    try:
+        with torch.set_grad_enabled(train):
+            _input_bytes = _tensor_bytes(example_input)
+            for _repeat in range(repeats):
+                _state['record'] = _repeat == 0
+                _state['call'] = 0
+                _start = time.perf_counter()
+                _output = model(example_input)
+                if DEVICE.type == 'cuda':
+                    torch.cuda.synchronize()
+                _total_times.append(time.perf_counter() - _start)
+                del _output
+    finally:
+        for _handle in _handles:
+            _handle.remove()
+        if _sequence is not None:
+            model.sequence = _sequence
+
+    for _layer in _layers:
+        _times = sorted(_layer.pop('times'))
+        _layer['measured_s'] = _times[len(_times)//2]
+        _layer['predicted_s'] = max(_layer['macs'] / _peak_macs_per_s,
+                                    _layer['traffic_bytes'] / _bytes_per_s)
+        _layer['efficiency'] = _layer['predicted_s'] / _layer['measured_s']
+
+    _total_times = sorted(_total_times)
+    _total = {
+        'macs': sum(_l['macs'] for _l in _layers),
+        'param_bytes': sum(_tensor_bytes(_p) for _p in model.parameters()),
+        'peak_activation_bytes': _input_bytes + max(_timeline),
+        'predicted_s': sum(_l['predicted_s'] for _l in _layers),
+        'measured_s': _total_times[len(_total_times)//2],
+        'peak_macs_per_s': _peak_macs_per_s,
+        'bytes_per_s': _bytes_per_s
+    }
+    _total['efficiency'] = _total['predicted_s'] / _total['measured_s']
+    # Time spent outside of leaf layers, e.g. the FIFO pipeline or reshapes.
+    _total['unattributed_s'] = _total['measured_s'] - \
+        sum(_l['measured_s'] for _l in _layers)
+    return {'layers': _layers, 'total': _total}
+
+
+def print_cost_report(report, title=''):
+    """The print_cost_report function prints a cost report as created by the
+    cost_model function to the terminal.
+
+    Args:
+        report:
+          Object of dict type as returned by cost_model.
+        title:
+          Object of string type printed as the report header.
+
+    Returns:
+        NONE
+    """
+    print('------------------------------------------------------------')
+    print(f'Cost report: {title}')
+    print(f'{"Layer":<28} {"Type":<16} {"Output":<22} {"MMACs":>9} '
+          f'{"Params[kB]":>10} {"Act[kB]":>9} {"Meas[ms]":>9} '
+          f'{"Pred[ms]":>9} {"Eff":>6}')
+    for _l in report['layers']:
+        print(f'{_l["name"]:<28} {_l["type"]:<16} {str(_l["output_shape"]):<22} '
+              f'{_l["macs"]/1e6:>9.3f} {_l["param_bytes"]/1024:>10.2f} '
+              f'{_l["activation_bytes"]/1024:>9.1f} '
+              f'{1000*_l["measured_s"]:>9.3f} {1000*_l["predicted_s"]:>9.3f} '
+              f'{100*_l["efficiency"]:>5.1f}%')
+    _t = report['total']
+    print(f'Total MACs\t\t= {_t["macs"]/1e6:.3f} M')
+    print(f'Parameter memory\t= {_t["param_bytes"]/1024:.2f} kB')
+    print(f'Peak activations\t= {_t["peak_activation_bytes"]/1024:.1f} kB')
+    print(f'Measured / predicted\t= {1000*_t["measured_s"]:.3f} ms / '
+          f'{1000*_t["predicted_s"]:.3f} ms '
+          f'(efficiency {100*_t["efficiency"]:.1f}%, unattributed '
+          f'{1000*_t["unattributed_s"]:.3f} ms)')
+    print(f'Roofline\t\t= {_t["peak_macs_per_s"]/1e9:.2f} GMAC/s, '
+          f'{_t["bytes_per_s"]/1e9:.2f} GB/s')
+
+
+def cost_report_all(batch_size=1, seq_length=25):
+    """The cost_report_all function prints the cost reports of all models of
+    this approach, i.e. UNET_AE, AE, RNN, GRU, LSTM and the hybrids.
+
+    Args:
+        batch_size:
+          Object of integer type specifying the batch size.
+        seq_length:
+          Object of integer type specifying the RNN sequence length.
+
+    Returns:
+        NONE
+    """
+    _roofline = measure_roofline()
+    _input = torch.rand(batch_size, 3, 24, 24, 24).to(DEVICE)
+    _autoencoders = {}
+
+    for _model_class in [UNET_AE, AE]:
+        _model = _model_class(device=DEVICE, in_channels=3, out_channels=3,
+                              features=[4, 8, 16],
+                              activation=nn.ReLU(inplace=True)).to(DEVICE)
+        _autoencoders[_model_class.__name__] = _model
+        print_cost_report(cost_model(_model, _input, roofline=_roofline),
+                          f'{_model_class.__name__} {tuple(_input.shape)}')
+
+    for _model_class in [RNN, GRU, LSTM]:
+        _model = _model_class(input_size=256, hidden_size=256,
+                              seq_size=seq_length, num_layers=1,
+                              device=DEVICE).to(DEVICE)
+        _sequence = torch.rand(batch_size, seq_length, 256).to(DEVICE)
+        print_cost_report(cost_model(_model, _sequence, roofline=_roofline),
+                          f'{_model_class.__name__} {tuple(_sequence.shape)}')
+
+    _model_rnn = LSTM(input_size=256, hidden_size=256, seq_size=seq_length,
+                      num_layers=1, device=DEVICE).to(DEVICE)
+    _hybrids = [
+        Hybrid_MD_RNN_UNET(device=DEVICE, UNET_Model=_autoencoders['UNET_AE'],
+                           RNN_Model=_model_rnn, seq_length=seq_length),
+        Hybrid_MD_RNN_AE(device=DEVICE, AE_Model=_autoencoders['AE'],
+                         RNN_Model=_model_rnn, seq_length=seq_length)
+    ]
+    for _model in _hybrids:
+        print_cost_report(
+            cost_model(_model, _input[:1], roofline=_roofline),
+            f'{type(_model).__name__} {tuple(_input[:1].shape)}')
+
+
+if __name__ == "__main__":
+    cost_report_all()
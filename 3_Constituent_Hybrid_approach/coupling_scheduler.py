@@ -0,0 +1,199 @@
+import sys
+import time
+import asyncio
+import collections
+import concurrent.futures
+import torch
+import numpy as np
+from model import resetPipeline
+from coupling_server import INNER_CELLS, GHOST_CELLS, hybrid_model, replay_frames
+
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+LOOK_AHEAD = 2              # predictions in flight before submit waits
+MD_STEP = 0.03              # seconds of the simulated MD step, refer to compare_pipelining
+
+
+class CouplingScheduler():
+    """This class pipelines the predictions of a Hybrid_MD_RNN_UNET model with
+    the MD solver's work. Frames are submitted as they arrive and the forward
+    passes run on a dedicated thread pool, while the event loop, i.e. the MD
+    side, continues. Since the model's latent sequence is stateful, the
+    forward passes of one scheduler always run in the order of submission.
+    Hence, one scheduler serves one coupling session.
+
+    Back-pressure: at most look_ahead predictions are in flight. Further
+    calls to submit wait until the oldest one has completed.
+
+    Usage:
+        async with CouplingScheduler(hybrid_model()) as _scheduler:
+            _future = await _scheduler.submit(frame)
+            ...  # MD step
+            _prediction = await _future
+
+    Args:
+        model:
+          Object of Hybrid_MD_RNN_UNET class.
+        look_ahead:
+          Object of integer type specifying the maximum number of predictions
+          in flight.
+        executor:
+          Object of concurrent.futures.Executor class running the forward
+          passes. If None, the scheduler owns a single dedicated thread.
+    """
+
+    def __init__(self, model, look_ahead=LOOK_AHEAD, executor=None):
+        self.model = model
+        self.look_ahead = look_ahead
+        self._owns_executor = executor is None
+        self._executor = executor or concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='coupling_scheduler')
+        self._slots = asyncio.Semaphore(look_ahead)
+        self._last = None
+
+    def _predict(self, frame, previous):
+        # Runs on the executor. The forward pass of the previous cycle was
+        # submitted earlier, hence it is running or ahead in the queue.
+        if previous is not None:
+            concurrent.futures.wait([previous])
+        _frame = torch.as_tensor(frame, dtype=torch.float32)
+        if _frame.shape[-1] != INNER_CELLS:
+            _g = GHOST_CELLS
+            _frame = _frame[:, _g:-_g, _g:-_g, _g:-_g]
+        with torch.inference_mode():
+            return self.model(_frame[None].to(device))[0].float().cpu().numpy()
+
+    async def submit(self, frame):
+        """The submit function enqueues the frame of the next coupling cycle.
+        The forward pass is dispatched to the executor at once, i.e. it also
+        proceeds while the caller blocks the event loop, e.g. in the MD step.
+        It only waits if look_ahead predictions are in flight. The frame must
+        not be modified until its prediction has completed.
+
+        Args:
+            frame:
+              Object of numpy array or PyTorch Tensor type of shape
+              (3, 24, 24, 24) or (3, 26, 26, 26).
+
+        Returns:
+            future:
+              Object of asyncio.Future type resolving to the prediction, i.e.
+              a numpy array of shape (3, 24, 24, 24).
+        """
+        await self._slots.acquire()
+        _loop = asyncio.get_running_loop()
+        self._last = self._executor.submit(self._predict, frame, self._last)
+        self._last.add_done_callback(
+            lambda _: _loop.call_soon_threadsafe(self._slots.release))
+        return asyncio.wrap_future(self._last)
+
+    async def predict(self, frame):
+        """The predict function submits the frame and awaits its prediction,
+        i.e. it is the synchronous step-by-step coupling."""
+        return await (await self.submit(frame))
+
+    async def drain(self):
+        """The drain function waits until all submitted frames are predicted."""
+        if self._last is not None:
+            await asyncio.wait([asyncio.wrap_future(self._last)])
+
+    async def close(self):
+        await self.drain()
+        if self._owns_executor:
+            self._executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+async def _replay_sync(scheduler, frames, md_step):
+    _predictions = []
+    for _frame in frames:
+        _predictions.append(await scheduler.predict(_frame))
+        time.sleep(md_step)
+    return _predictions
+
+
+async def _replay_pipelined(scheduler, frames, md_step):
+    _predictions = []
+    _pending = collections.deque()
+    for _frame in frames:
+        _pending.append(await scheduler.submit(_frame))
+        time.sleep(md_step)
+        while len(_pending) >= scheduler.look_ahead:
+            _predictions.append(await _pending.popleft())
+    while _pending:
+        _predictions.append(await _pending.popleft())
+    return _predictions
+
+
+def compare_pipelining(dataset, cycles=100, md_step=MD_STEP, look_ahead=LOOK_AHEAD, model=None):
+    """The compare_pipelining function measures the coupling loop with the
+    dataset replay stand-in for the MD solver, once synchronously, i.e. every
+    prediction is awaited before the MD step, and once pipelined, i.e. the MD
+    step overlaps the inference. The MD step is simulated by sleeping for
+    md_step seconds, which, like a native MD solver, releases the GIL.
+
+    Args:
+        dataset:
+          Object of string type or numpy array type, refer to
+          coupling_server.replay_frames.
+        cycles:
+          Object of integer type limiting the number of cycles.
+        md_step:
+          Object of float type specifying the duration of the MD step.
+        look_ahead:
+          Object of integer type, refer to CouplingScheduler.
+        model:
+          Object of Hybrid_MD_RNN_UNET class. If None, refer to
+          coupling_server.hybrid_model.
+
+    Returns:
+        results:
+          Object of dict type containing the wall time per coupling cycle in
+          ms of both loops and the speedup.
+    """
+    if model is None:
+        model = hybrid_model()
+    _frames = list(replay_frames(dataset, cycles))
+    _results = {}
+    _predictions = {}
+
+    async def _measure(_name, _replay):
+        resetPipeline(model)
+        async with CouplingScheduler(model, look_ahead) as _scheduler:
+            # Warm up the executor thread and the model
+            await _scheduler.predict(_frames[0])
+            resetPipeline(model)
+            _start = time.perf_counter()
+            _predictions[_name] = await _replay(_scheduler, _frames, md_step)
+            _results[f'{_name}_ms_per_cycle'] = \
+                1000*(time.perf_counter() - _start)/len(_frames)
+
+    asyncio.run(_measure('sync', _replay_sync))
+    asyncio.run(_measure('pipelined', _replay_pipelined))
+    _results['speedup'] = _results['sync_ms_per_cycle'] / \
+        _results['pipelined_ms_per_cycle']
+    _deviation = max(float(np.abs(_a - _b).max()) for _a, _b in zip(
+        _predictions['sync'], _predictions['pipelined']))
+    print(f'Coupling {len(_frames)} cycles with a {1000*md_step:.0f} ms MD '
+          f'step: synchronous {_results["sync_ms_per_cycle"]:.2f} ms/cycle, '
+          f'pipelined (look-ahead {look_ahead}) '
+          f'{_results["pipelined_ms_per_cycle"]:.2f} ms/cycle, speedup '
+          f'{_results["speedup"]:.2f}x, max deviation {_deviation:.2e}.')
+    return _results
+
+
+if __name__ == "__main__":
+    # python coupling_scheduler.py <csv_file> [cycles] [md_step] [look_ahead]
+    if len(sys.argv) > 1:
+        compare_pipelining(
+            sys.argv[1],
+            cycles=int(sys.argv[2]) if len(sys.argv) > 2 else 100,
+            md_step=float(sys.argv[3]) if len(sys.argv) > 3 else MD_STEP,
+            look_ahead=int(sys.argv[4]) if len(sys.argv) > 4 else LOOK_AHEAD)
+    else:
+        print('Usage: python coupling_scheduler.py <csv_file> [cycles] '
+              '[md_step] [look_ahead]')
@@ -0,0 +1,396 @@
+import os
+import sys
+import time
+import struct
+import socket
+import threading
+import socketserver
+import torch
+import numpy as np
+import torch.nn as nn
+from model import UNET_AE, LSTM, Hybrid_MD_RNN_UNET
+
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+COUPLING_ADDRESS = '/tmp/md_ml_coupling.sock'  # Unix socket path or (host, port) for TCP
+MAGIC = b'MDML'
+VERSION = 1
+# magic, version, message type, cells per side, coupling cycle, payload bytes
+HEADER = struct.Struct('<4sBBHII')
+FRAME, PREDICTION, RESET, ERROR = 1, 2, 3, 4
+INNER_CELLS = 24            # cells per side the hybrid model operates on
+GHOST_CELLS = 1             # ghost cells per side of a full MaMiCo frame, refer to dataset.py
+
+
+def hybrid_model(unet_file=None, rnn_file=None, num_layers=2, seq_length=25):
+    """The hybrid_model function creates the Hybrid_MD_RNN_UNET model served
+    by the coupling server, i.e. the UNET_AE and LSTM configuration of
+    trial_5. Without model files, the weights remain randomly initialized,
+    which suffices to measure latencies.
+
+    Args:
+        unet_file:
+          Object of string type containing the state dict of the UNET_AE.
+        rnn_file:
+          Object of string type containing the state dict of the LSTM.
+        num_layers:
+          Object of integer type specifying the number of LSTM layers.
+        seq_length:
+          Object of integer type specifying the length of the latent sequence.
+
+    Returns:
+        model:
+          Object of Hybrid_MD_RNN_UNET class in eval mode.
+    """
+    _model_unet = UNET_AE(
+        device=device,
+        in_channels=3,
+        out_channels=3,
+        features=[4, 8, 16],
+        activation=nn.ReLU(inplace=True)
+    )
+    _model_rnn = LSTM(
+        input_size=256,
+        hidden_size=256,
+        seq_size=seq_length,
+        num_layers=num_layers,
+        device=device
+    )
+    if unet_file is not None:
+        _model_unet.load_state_dict(torch.load(unet_file, map_location=device))
+    if rnn_file is not None:
+        _model_rnn.load_state_dict(torch.load(rnn_file, map_location=device))
+    return Hybrid_MD_RNN_UNET(
+        device=device,
+        UNET_Model=_model_unet.to(device),
+        RNN_Model=_model_rnn.to(device),
+        seq_length=seq_length
+    ).to(device).eval()
+
+
+def parse_address(text):
+    """The parse_address function converts 'host:port' to a TCP address and
+    any other string to a Unix socket path."""
+    _host, _, _port = text.rpartition(':')
+    if _host and _port.isdigit():
+        return (_host, int(_port))
+    return text
+
+
+def _recv_into(sock, view):
+    # Fills view completely, returns False if the peer closed the connection.
+    while len(view):
+        _n = sock.recv_into(view)
+        if _n == 0:
+            return False
+        view = view[_n:]
+    return True
+
+
+def _send(sock, message_type, cells=0, cycle=0, payload=b''):
+    sock.sendall(HEADER.pack(MAGIC, VERSION, message_type, cells, cycle,
+                             len(payload)) + payload)
+
+
+def _receive(sock, buffer):
+    # Reads one message into buffer. Returns (message type, cells, cycle,
+    # payload view) or None if the peer closed the connection.
+    _header = bytearray(HEADER.size)
+    if not _recv_into(sock, memoryview(_header)):
+        return None
+    _magic, _version, _type, _cells, _cycle, _size = HEADER.unpack(_header)
+    if _magic != MAGIC or _version != VERSION:
+        raise ValueError(f'Invalid message header: {bytes(_header)!r}')
+    if _size > len(buffer):
+        raise ValueError(f'Message of {_size} bytes exceeds the buffer.')
+    _payload = memoryview(buffer)[:_size]
+    if not _recv_into(sock, _payload):
+        return None
+    return _type, _cells, _cycle, _payload
+
+
+def _frame_bytes(cells):
+    return 3*cells**3*4
+
+
+class _SessionHandler(socketserver.BaseRequestHandler):
+    # One handler thread per client connection, i.e. per coupling session.
+    # Every session keeps its own latent sequence, while the model weights
+    # are shared. Forward passes are serialized by the server's lock.
+
+    def setup(self):
+        if self.request.family != socket.AF_UNIX:
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sequence = torch.zeros(self.server.model.sequence.shape)
+        self.buffer = bytearray(_frame_bytes(INNER_CELLS + 2*GHOST_CELLS))
+
+    def handle(self):
+        while True:
+            try:
+                _message = _receive(self.request, self.buffer)
+            except ValueError as e:
+                _send(self.request, ERROR, payload=str(e).encode())
+                return
+            if _message is None:
+                return
+            _type, _cells, _cycle, _payload = _message
+
+            if _type == RESET:
+                self.sequence = torch.zeros(self.sequence.shape)
+                _send(self.request, RESET, cycle=_cycle)
+            elif _type == FRAME and _cells in [INNER_CELLS, INNER_CELLS + 2*GHOST_CELLS] \
+                    and len(_payload) == _frame_bytes(_cells):
+                _prediction = self.predict(_payload, _cells)
+                _send(self.request, PREDICTION, INNER_CELLS, _cycle,
+                      _prediction.tobytes())
+            else:
+                _send(self.request, ERROR, cycle=_cycle, payload=(
+                    f'Invalid message: type {_type}, {_cells} cells, '
+                    f'{len(_payload)} bytes').encode())
+
+    def predict(self, payload, cells):
+        # The payload is wrapped without copies, ghost cells are cropped.
+        _frame = torch.from_numpy(np.frombuffer(
+            payload, dtype='<f4').reshape(1, 3, cells, cells, cells))
+        if cells != INNER_CELLS:
+            _g = GHOST_CELLS
+            _frame = _frame[:, :, _g:-_g, _g:-_g, _g:-_g]
+        _frame = _frame.to(device)
+        _model = self.server.model
+        with self.server.lock, torch.inference_mode():
+            _model.sequence = self.sequence
+            _prediction = _model(_frame)
+            self.sequence = _model.sequence
+        return _prediction[0].float().cpu().numpy()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class CouplingServer():
+    """This class serves coupling cycle predictions of a Hybrid_MD_RNN_UNET
+    model to local MD solvers, e.g. MaMiCo, via a Unix socket or TCP on
+    localhost. Every connection is one coupling session with its own latent
+    sequence. Per cycle, the client sends a FRAME message containing the cell
+    velocities of shape (3, 24, 24, 24) or (3, 26, 26, 26) including ghost
+    cells, and receives a PREDICTION message of shape (3, 24, 24, 24) for the
+    next cycle. A RESET message clears the session's latent sequence.
+
+    Every message consists of HEADER, i.e. magic, version, message type,
+    cells per side, coupling cycle and payload size, followed by the payload.
+    Frames are little-endian float32 arrays in C order.
+
+    Usage:
+        with CouplingServer(hybrid_model()) as _server:
+            _server.serve_forever()
+
+    Args:
+        model:
+          Object of Hybrid_MD_RNN_UNET class.
+        address:
+          Object of string type containing a Unix socket path, or of tuple
+          type containing host and port for TCP.
+    """
+
+    def __init__(self, model, address=COUPLING_ADDRESS):
+        self.address = address
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.remove(address)
+            self._server = _UnixServer(address, _SessionHandler)
+        else:
+            self._server = _TCPServer(address, _SessionHandler)
+            self.address = self._server.server_address
+        self._server.model = model
+        self._server.lock = threading.Lock()
+        self._thread = None
+
+    def serve_forever(self):
+        """The serve_forever function handles requests until close is called
+        from another thread or the process is interrupted."""
+        self._server.serve_forever()
+
+    def start(self):
+        """The start function handles requests in a background thread."""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """The close function stops the server and removes the socket file."""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class CouplingClient():
+    """This class is the client side of CouplingServer, i.e. it stands in for
+    the MD solver's coupling interface.
+
+    Args:
+        address:
+          Object of string type containing a Unix socket path, or of tuple
+          type containing host and port for TCP.
+    """
+
+    def __init__(self, address=COUPLING_ADDRESS):
+        if isinstance(address, str):
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket.connect(address)
+        self._buffer = bytearray(_frame_bytes(INNER_CELLS))
+
+    def _reply(self, message_type, cycle):
+        _message = _receive(self._socket, self._buffer)
+        if _message is None:
+            raise ConnectionError('Coupling server closed the connection.')
+        _type, _cells, _cycle, _payload = _message
+        if _type == ERROR:
+            raise RuntimeError(bytes(_payload).decode())
+        if _type != message_type or _cycle != cycle:
+            raise RuntimeError(f'Unexpected reply: type {_type}, cycle {_cycle}')
+        return _cells, _payload
+
+    def predict(self, frame, cycle=0):
+        """The predict function sends one frame and waits for the prediction.
+
+        Args:
+            frame:
+              Object of numpy array or PyTorch Tensor type of shape
+              (3, 24, 24, 24) or (3, 26, 26, 26).
+            cycle:
+              Object of integer type containing the coupling cycle.
+
+        Returns:
+            prediction:
+              Object of numpy array type of shape (3, 24, 24, 24).
+        """
+        if torch.is_tensor(frame):
+            frame = frame.detach().cpu().numpy()
+        _frame = np.ascontiguousarray(frame, dtype='<f4')
+        _send(self._socket, FRAME, _frame.shape[-1], cycle,
+              memoryview(_frame).cast('B'))
+        _cells, _payload = self._reply(PREDICTION, cycle)
+        return np.frombuffer(_payload, dtype='<f4').reshape(
+            3, _cells, _cells, _cells).copy()
+
+    def reset(self):
+        """The reset function clears the latent sequence of this session."""
+        _send(self._socket, RESET)
+        self._reply(RESET, 0)
+
+    def close(self):
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def replay_frames(dataset, cycles=None):
+    """The replay_frames function yields the frames of a MaMiCo dataset one
+    coupling cycle at a time, i.e. it stands in for the MD solver.
+
+    Args:
+        dataset:
+          Object of string type containing a (cleaned) MaMiCo csv file, or of
+          numpy array type of shape (t, 3, 26, 26, 26).
+        cycles:
+          Object of integer type limiting the number of cycles.
+
+    Returns:
+        frames:
+          Generator of numpy arrays of shape (3, 26, 26, 26) and dtype float32.
+    """
+    if isinstance(dataset, str):
+        from utils_new import mamico_csv2dataset
+        dataset = mamico_csv2dataset(dataset)
+    for _t in range(len(dataset) if cycles is None else min(cycles, len(dataset))):
+        yield np.ascontiguousarray(dataset[_t], dtype=np.float32)
+
+
+def replay(dataset, address=COUPLING_ADDRESS, cycles=None):
+    """The replay function streams a MaMiCo dataset to a coupling server as a
+    stand-in MD solver and measures the round trip latency of every coupling
+    cycle. The prediction of cycle t is compared to the inner cells of the
+    frame of cycle t+1.
+
+    Args:
+        dataset:
+          Object of string type or numpy array type, refer to replay_frames.
+        address:
+          Object of string or tuple type, refer to CouplingServer.
+        cycles:
+          Object of integer type limiting the number of cycles.
+
+    Returns:
+        results:
+          Object of dict type containing the numpy arrays 'latency_ms' and
+          'MAE' holding one value per coupling cycle.
+    """
+    _g = GHOST_CELLS
+    _latencies = []
+    _errors = []
+    _prediction = None
+    with CouplingClient(address) as _client:
+        _client.reset()
+        for _t, _frame in enumerate(replay_frames(dataset, cycles)):
+            if _prediction is not None:
+                _errors.append(np.abs(
+                    _prediction - _frame[:, _g:-_g, _g:-_g, _g:-_g]).mean())
+            _start = time.perf_counter()
+            _prediction = _client.predict(_frame, _t)
+            _latencies.append(time.perf_counter() - _start)
+
+    _latencies = 1000*np.array(_latencies)
+    print(f'Replayed {len(_latencies)} coupling cycles: round trip latency '
+          f'p50 {np.percentile(_latencies, 50):.2f} ms, '
+          f'p99 {np.percentile(_latencies, 99):.2f} ms, '
+          f'max {_latencies.max():.2f} ms.')
+    return {'latency_ms': _latencies, 'MAE': np.array(_errors)}
+
+
+if __name__ == "__main__":
+    # python coupling_server.py serve [address] [unet_file rnn_file]
+    # python coupling_server.py replay <csv_file> [address] [cycles]
+    # Addresses are Unix socket paths or host:port, e.g. localhost:5555
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        _address = parse_address(
+            sys.argv[2]) if len(sys.argv) > 2 else COUPLING_ADDRESS
+        _files = sys.argv[3:5] if len(sys.argv) > 4 else [None, None]
+        with CouplingServer(hybrid_model(*_files), _address) as _server:
+            print(f'Serving Hybrid_MD_RNN_UNET on {_server.address}')
+            try:
+                _server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    elif len(sys.argv) > 2 and sys.argv[1] == 'replay':
+        _address = parse_address(
+            sys.argv[3]) if len(sys.argv) > 3 else COUPLING_ADDRESS
+        _cycles = int(sys.argv[4]) if len(sys.argv) > 4 else None
+        replay(sys.argv[2], _address, _cycles)
+    else:
+        print('Usage: python coupling_server.py serve [address] '
+              '[unet_file rnn_file]')
+        print('       python coupling_server.py replay <csv_file> '
+              '[address] [cycles]')
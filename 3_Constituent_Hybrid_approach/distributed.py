@@ -0,0 +1,324 @@
+import os
+import sys
+import time
+import torch
+import numpy as np
+import torch.nn as nn
+import torch.optim as optim
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.utils.data import DataLoader, ConcatDataset
+from torch.utils.data.distributed import DistributedSampler
+from torch.nn.parallel import DistributedDataParallel as DDP
+from model import UNET_AE
+from utils_new import get_UNET_AE_loaders
+from metrics import MetricsWriter
+
+device = torch.device('cpu')
+BUCKET_CAP_MB = 1           # UNET_AE holds ~0.1 MB of gradients in total
+MASTER_ADDR = 'localhost'
+MASTER_PORT = '29500'
+
+
+def setup_process_group(rank, world_size, master_addr=MASTER_ADDR, master_port=MASTER_PORT):
+    """The setup_process_group function initializes the default process group
+    via the gloo backend, which supports CPU-only clusters. Note that the
+    environment variables set by torchrun take precedence over the function
+    parameters.
+
+    Args:
+        rank:
+          Object of integer type specifying the global rank of this process.
+        world_size:
+          Object of integer type specifying the total number of processes.
+        master_addr:
+          Object of string type containing the address of the rank 0 node.
+        master_port:
+          Object of string type containing a free port on the rank 0 node.
+
+    Returns:
+        NONE:
+    """
+    os.environ.setdefault('MASTER_ADDR', master_addr)
+    os.environ.setdefault('MASTER_PORT', master_port)
+    dist.init_process_group(backend='gloo', rank=rank, world_size=world_size)
+
+
+def get_distributed_loaders(data_distribution, rank, world_size, batch_size=32, num_workers=0):
+    """The get_distributed_loaders function retrieves one training and one
+    validation loader per process. All datasets are concatenated, so that the
+    DistributedSampler can partition the combined coupling cycle index across
+    the processes. Each process thus only sees 1/world_size of all cycles per
+    epoch. Refer to get_UNET_AE_loaders for the available datasets.
+
+    Args:
+        data_distribution:
+          Object of string type to differentiate between loading couette, kvs,
+          both or random valued datasets:
+          ['get_couette', 'get_KVS', 'get_both', 'get_random']
+        rank:
+          Object of integer type specifying the global rank of this process.
+        world_size:
+          Object of integer type specifying the total number of processes.
+        batch_size:
+          Object of integer type that specifies the per-process batch size.
+        num_workers:
+          Object of integer type that specifies the number of loader workers.
+
+    Returns:
+        _dataloader_train:
+          Object of PyTorch-type DataLoader to automatically feed training datasets.
+        _dataloader_valid:
+          Object of PyTorch-type DataLoader to automatically feed validation datasets.
+    """
+    # All ranks have to hold identical datasets, in particular for 'get_random'.
+    np.random.seed(10)
+    _train_loaders, _valid_loaders = get_UNET_AE_loaders(
+        data_distribution=data_distribution,
+        batch_size=batch_size,
+        shuffle=False
+    )
+    _dataset_train = ConcatDataset([_l.dataset for _l in _train_loaders])
+    _dataset_valid = ConcatDataset([_l.dataset for _l in _valid_loaders])
+
+    _dataloader_train = DataLoader(
+        dataset=_dataset_train,
+        batch_size=batch_size,
+        sampler=DistributedSampler(
+            _dataset_train, num_replicas=world_size, rank=rank, shuffle=True,
+            seed=10),
+        num_workers=num_workers
+    )
+    _dataloader_valid = DataLoader(
+        dataset=_dataset_valid,
+        batch_size=batch_size,
+        sampler=DistributedSampler(
+            _dataset_valid, num_replicas=world_size, rank=rank, shuffle=False),
+        num_workers=num_workers
+    )
+    return _dataloader_train, _dataloader_valid
+
+
+def _all_reduce_mean(loss_sum, counter):
+    _buffer = torch.tensor([loss_sum, counter], dtype=torch.float64)
+    dist.all_reduce(_buffer, op=dist.ReduceOp.SUM)
+    return (_buffer[0] / _buffer[1]).item()
+
+
+def train_AE_distributed(loader, model, optimizer, criterion):
+    """The train_AE_distributed function trains the DDP wrapped model for one
+    epoch on the local partition of the training set. Gradients are averaged
+    across all processes during the backward pass via bucketed all-reduce.
+
+    Args:
+        loader:
+          Object of PyTorch-type DataLoader to automatically feed dataset
+        model:
+          Object of DistributedDataParallel class, i.e. the wrapped model.
+        optimizer:
+          The optimization algorithm applied during training.
+        criterion:
+          The loss function applied to quantify the error.
+
+    Returns:
+        avg_loss:
+          A double value indicating the average training loss across all
+          processes for the current epoch.
+    """
+    _epoch_loss = 0
+    _counter = 0
+
+    for _batch_idx, (_data, _targets) in enumerate(loader):
+        _data = _data.float().to(device=device)
+        _targets = _targets.float().to(device=device)
+
+        _predictions = model(_data)
+        _loss = criterion(_predictions, _targets)
+        _epoch_loss += _loss.item()
+        _counter += 1
+
+        _loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+
+    return _all_reduce_mean(_epoch_loss, _counter)
+
+
+def valid_AE_distributed(loader, model, criterion):
+    """The valid_AE_distributed function computes the average loss on the
+    local partition of the validation set and averages it across all
+    processes.
+
+    Args:
+        loader:
+          Object of PyTorch-type DataLoader to automatically feed dataset
+        model:
+          Object of DistributedDataParallel class, i.e. the wrapped model.
+        criterion:
+          The loss function applied to quantify the error.
+
+    Returns:
+        avg_loss:
+          A double value indicating the average validation loss across all
+          processes for the current epoch.
+    """
+    _epoch_loss = 0
+    _counter = 0
+
+    with torch.no_grad():
+        for _batch_idx, (_data, _targets) in enumerate(loader):
+            _data = _data.float().to(device=device)
+            _targets = _targets.float().to(device=device)
+
+            _predictions = model.module(_data)
+            _loss = criterion(_predictions, _targets)
+            _epoch_loss += _loss.item()
+            _counter += 1
+
+    return _all_reduce_mean(_epoch_loss, _counter)
+
+
+def trial_1_UNET_AE_distributed(rank, world_size, alpha=0.0005, alpha_string='0_0005', num_epochs=50, batch_size=32, data_distribution='get_couette', num_threads=0, file_prefix=''):
+    """The trial_1_UNET_AE_distributed function is the data-parallel
+    counterpart of trial_1_UNET_AE. It is executed once per process. The model
+    is replicated on every process and wrapped in DistributedDataParallel.
+    Only rank 0 logs to the terminal, writes the metrics store and saves the
+    checkpoint.
+
+    Args:
+        rank:
+          Object of integer type specifying the global rank of this process.
+        world_size:
+          Object of integer type specifying the total number of processes.
+        alpha:
+          A double value indicating the chosen learning rate.
+        alpha_string:
+          Object of type string used as a model identifier.
+        num_epochs:
+          Object of integer type specifying the number of epochs.
+        batch_size:
+          Object of integer type that specifies the per-process batch size.
+          The effective batch size is batch_size * world_size.
+        data_distribution:
+          Object of string type, refer to get_UNET_AE_loaders.
+        num_threads:
+          Object of integer type specifying the number of intra-op threads per
+          process. If 0, the available cores are split evenly between the
+          processes of this node.
+        file_prefix:
+          Object of string type containing the output directory.
+
+    Returns:
+        NONE:
+    """
+    setup_process_group(rank, world_size)
+    torch.manual_seed(10)
+
+    _local_world_size = int(os.environ.get('LOCAL_WORLD_SIZE', world_size))
+    if num_threads == 0:
+        num_threads = max(1, os.cpu_count() // _local_world_size)
+    torch.set_num_threads(num_threads)
+
+    if file_prefix == '':
+        file_prefix = '/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/' + \
+            '3_Constituent_Hybrid_approach/Results/1_UNET_AE/'
+    _model_identifier = f'LR{alpha_string}_DDP{world_size}'
+    _is_main = rank == 0
+
+    _train_loader, _valid_loader = get_distributed_loaders(
+        data_distribution=data_distribution,
+        rank=rank,
+        world_size=world_size,
+        batch_size=batch_size
+    )
+
+    _model = UNET_AE(
+        device=device,
+        in_channels=3,
+        out_channels=3,
+        features=[4, 8, 16],
+        activation=nn.ReLU(inplace=True)
+    ).to(device)
+    _ddp_model = DDP(_model, bucket_cap_mb=BUCKET_CAP_MB)
+
+    _criterion = nn.L1Loss()
+    _optimizer = optim.Adam(_ddp_model.parameters(), lr=alpha)
+    _metrics = None
+
+    if _is_main:
+        _metrics = MetricsWriter(
+            f'{file_prefix}Metrics_UNET_AE_{_model_identifier}')
+        print(f'Beginning training: {world_size} processes, '
+              f'{num_threads} threads each.')
+
+    for _epoch in range(num_epochs):
+        _start_time = time.time()
+        _train_loader.sampler.set_epoch(_epoch)
+        _avg_loss = train_AE_distributed(
+            loader=_train_loader,
+            model=_ddp_model,
+            optimizer=_optimizer,
+            criterion=_criterion
+        )
+        _avg_valid = valid_AE_distributed(
+            loader=_valid_loader,
+            model=_ddp_model,
+            criterion=_criterion
+        )
+
+        if _is_main:
+            _metrics.scalar('Losses_UNET_AE', _avg_loss, step=_epoch)
+            _metrics.scalar('Valids_UNET_AE', _avg_valid, step=_epoch)
+            print('------------------------------------------------------------')
+            print(f'{_model_identifier} Epoch: {_epoch+1} -> Training Loss: '
+                  f'{_avg_loss:.5f}, Validation Loss: {_avg_valid:.5f}, '
+                  f'Duration: {time.time()-_start_time:.1f}s')
+            torch.save(
+                _model.state_dict(),
+                f'{file_prefix}Model_UNET_AE_{_model_identifier}'
+            )
+
+    if _is_main:
+        _metrics.close()
+
+    dist.barrier()
+    dist.destroy_process_group()
+
+
+def launch_local(world_size, **kwargs):
+    """The launch_local function spawns world_size processes on the local node
+    to run trial_1_UNET_AE_distributed. It is primarily used for testing.
+
+    Args:
+        world_size:
+          Object of integer type specifying the number of processes.
+        kwargs:
+          Keyword arguments passed on to trial_1_UNET_AE_distributed.
+
+    Returns:
+        NONE:
+    """
+    mp.spawn(
+        _launch_local_worker,
+        args=(world_size, kwargs),
+        nprocs=world_size,
+        join=True
+    )
+
+
+def _launch_local_worker(rank, world_size, kwargs):
+    trial_1_UNET_AE_distributed(rank, world_size, **kwargs)
+
+
+if __name__ == "__main__":
+    # Multi-node: launched once per process by torchrun, e.g.
+    #   torchrun --nnodes=2 --nproc_per_node=2 --rdzv_backend=c10d \
+    #     --rdzv_endpoint=<host>:29500 distributed.py
+    # Single node: python distributed.py <num_processes>
+    if 'RANK' in os.environ:
+        trial_1_UNET_AE_distributed(
+            rank=int(os.environ['RANK']),
+            world_size=int(os.environ['WORLD_SIZE'])
+        )
+    else:
+        launch_local(int(sys.argv[1]) if len(sys.argv) > 1 else 2)
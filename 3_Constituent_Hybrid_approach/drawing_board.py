@@ -1,15 +1,67 @@
 import numpy as np
 import torch
 import torch.nn as nn
-import glob
 # , compareErrorTimeline
 from plotting import compareAvgLoss, compareAvgLossRNN, compareLossVsValidRNN, compareFlowProfile3x3, compareLossVsValid
 from model import UNET_AE, LSTM, Hybrid_MD_RNN_UNET
 from utils import get_UNET_AE_loaders, get_Hybrid_loaders
+from results_db import ResultsDB
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
 
+def _depth_and_seq(run):
+    return run['config']['layers'], run['config']['seq_length']
+
+
+def _lr_string(run):
+    # e.g. 1e-05 -> '0.00001'
+    return np.format_float_positional(run['config']['lr'], trim='-')
+
+
+def query_runs(db, trial, model, **config):
+    # BRIEF: Queries the runs of a model within a trial from the results
+    # database, excluding variants such as curriculum or DDP runs.
+    # RETURNS: the list of runs in descending order of the learning rate
+    _runs = [_r for _r in db.runs(trial=trial, model=model, **config)
+             if 'variant' not in _r['config']]
+    return sorted(_runs, key=lambda _r: -_r['config']['lr'])
+
+
+def avg_loss_references(db, trial, model, alpha):
+    # BRIEF: Queries the training losses of all RNN depths and sequence lengths
+    # trained with the given learning rate from the results database.
+    # RETURNS: the list of series references and the list of labels
+    _runs = sorted(query_runs(db, trial, model, lr=alpha), key=_depth_and_seq)
+    files = [db.reference(_r, 'Losses') for _r in _runs]
+    labels = [f'Lay:{_r["config"]["layers"]} Seq:{_r["config"]["seq_length"]}'
+              for _r in _runs]
+    return files, labels
+
+
+def loss_vs_valid_references(db, trial, model, alpha):
+    # BRIEF: Queries training and validation losses of all RNN depths and
+    # sequence lengths trained with the given learning rate, grouped by depth.
+    # RETURNS: one list of series references and one list of labels per depth
+    _list_of_list_f = []
+    _list_of_list_l = []
+    _runs = sorted(query_runs(db, trial, model, lr=alpha), key=_depth_and_seq)
+    for _depth in sorted({_r['config']['layers'] for _r in _runs}):
+        files = []
+        labels = []
+        for _r in _runs:
+            if _r['config']['layers'] != _depth:
+                continue
+            _seq_length = _r['config']['seq_length']
+            files.append(db.reference(_r, 'Losses'))
+            labels.append(f'Training Seq:{_seq_length}')
+            files.append(db.reference(_r, 'Valids'))
+            labels.append(f'Validation Seq:{_seq_length}')
+        _list_of_list_f.append(files)
+        _list_of_list_l.append(labels)
+    return _list_of_list_f, _list_of_list_l
+
+
 def trial_1_UNET_AE_plots():
     model_names = [
         'Model_UNET_AE_LR0_005',
@@ -28,52 +80,34 @@ def trial_1_UNET_AE_plots():
     ]
     model_directory = '/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/3_Constituent_Hybrid_approach/Results/0_UNET_AE/'
 
-    loss_prefix = 'Losses_UNET_AE_LR'
-
-    loss_files = [
-        f'{model_directory}{loss_prefix}0_01.csv',
-        f'{model_directory}{loss_prefix}0_001.csv',
-        f'{model_directory}{loss_prefix}0_0001.csv',
-        f'{model_directory}{loss_prefix}0_005.csv',
-        f'{model_directory}{loss_prefix}0_0005.csv',
-        f'{model_directory}{loss_prefix}0_00005.csv'
-    ]
-    loss_labels = [
-        'Learning Rate = 0.01',
-        'Learning Rate = 0.001',
-        'Learning Rate = 0.0001',
-        'Learning Rate = 0.005',
-        'Learning Rate = 0.0005',
-        'Learning Rate = 0.00005'
-    ]
-    '''
-    compareAvgLoss(
-        loss_files=loss_files,
-        loss_labels=loss_labels,
-        file_prefix=model_directory,
-        file_name='UNET_AE'
-    )
-    '''
-    lossVsValidFiles = [
-        f'{model_directory}Losses_UNET_AE_LR0_001.csv',
-        f'{model_directory}Valids_UNET_AE_LR0_001.csv',
-        f'{model_directory}Losses_UNET_AE_LR0_0005.csv',
-        f'{model_directory}Valids_UNET_AE_LR0_0005.csv'
-    ]
-    lossVsValidLabels = [
-        'Training Loss   LR = 0.001',
-        'Validation Loss LR = 0.001',
-        'Training Loss   LR = 0.0005',
-        'Validation Loss LR = 0.0005'
-    ]
-    '''
-    compareLossVsValid(
-        loss_files=lossVsValidFiles,
-        loss_labels=lossVsValidLabels,
-        file_prefix=model_directory,
-        file_name='Model_UNET_AE_LR0_001_and_LR0_0005'
-    )
-    '''
+    with ResultsDB(readonly=True) as _db:
+        _runs = query_runs(_db, '1_UNET_AE', 'UNET_AE')
+        loss_files = [_db.reference(_r, 'Losses') for _r in _runs]
+        loss_labels = [f'Learning Rate = {_lr_string(_r)}' for _r in _runs]
+        '''
+        compareAvgLoss(
+            loss_files=loss_files,
+            loss_labels=loss_labels,
+            file_prefix=model_directory,
+            file_name='UNET_AE'
+        )
+        '''
+        lossVsValidFiles = []
+        lossVsValidLabels = []
+        for _alpha in [0.001, 0.0005]:
+            for _r in query_runs(_db, '1_UNET_AE', 'UNET_AE', lr=_alpha):
+                lossVsValidFiles.append(_db.reference(_r, 'Losses'))
+                lossVsValidLabels.append(f'Training Loss   LR = {_lr_string(_r)}')
+                lossVsValidFiles.append(_db.reference(_r, 'Valids'))
+                lossVsValidLabels.append(f'Validation Loss LR = {_lr_string(_r)}')
+        '''
+        compareLossVsValid(
+            loss_files=lossVsValidFiles,
+            loss_labels=lossVsValidLabels,
+            file_prefix=model_directory,
+            file_name='Model_UNET_AE_LR0_001_and_LR0_0005'
+        )
+        '''
     _, valid_loaders = get_UNET_AE_loaders(file_names=-1)
     for i in range(1, 3):
 
@@ -119,116 +153,67 @@ def trial_2_RNN_plots():
     _alphas = [0.001, 0.0005, 0.0001, 0.00005, 0.00001, 0.000005]
     _alpha_strings = ['0_001', '0_0005', '0_0001',
                       '0_00005', '0_00001', '0_000005']
-    _rnn_depths = [1, 2, 3]
-    _seq_lengths = [5, 15, 25]
     _directory = '/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/3_Constituent_Hybrid_approach/Results/1_RNN/'
 
-    _list_of_list_f = []
-    _list_of_list_l = []
-    '''
-    for idx, _alpha in enumerate(_alphas):
-        files = []
-        labels = []
-        for _rnn_depth in _rnn_depths:
-            for _seq_length in _seq_lengths:
-                files.append(
-                    f'{_directory}Losses_RNN_LR{_alpha_strings[idx]}_Lay{_rnn_depth}_Seq{_seq_length}.csv')
-                labels.append(
-                    f'Lay:{_rnn_depth} Seq:{_seq_length}')
-        _list_of_list_f.append(files)
-        _list_of_list_l.append(labels)
-
-    compareAvgLossRNN(
-        l_of_l_files=_list_of_list_f,
-        l_of_l_labels=_list_of_list_l,
-        file_prefix=_directory,
-        file_name='RNN'
-    )
-    '''
-
-    _list_of_list_f = []
-    _list_of_list_l = []
+    with ResultsDB(readonly=True) as _db:
+        '''
+        _list_of_list_f = []
+        _list_of_list_l = []
+        for _alpha in _alphas:
+            files, labels = avg_loss_references(_db, '2_RNN', 'RNN', _alpha)
+            _list_of_list_f.append(files)
+            _list_of_list_l.append(labels)
 
-    for _rnn_depth in _rnn_depths:
-        files = []
-        labels = []
-        for _seq_length in _seq_lengths:
-            files.append(
-                f'{_directory}Losses_RNN_LR{_alpha_strings[-2]}_Lay{_rnn_depth}_Seq{_seq_length}.csv')
-            labels.append(
-                f'Training Seq:{_seq_length}')
-            files.append(
-                f'{_directory}Valids_RNN_LR{_alpha_strings[-2]}_Lay{_rnn_depth}_Seq{_seq_length}.csv')
-            labels.append(
-                f'Validation Seq:{_seq_length}')
-        _list_of_list_f.append(files)
-        _list_of_list_l.append(labels)
+        compareAvgLossRNN(
+            l_of_l_files=_list_of_list_f,
+            l_of_l_labels=_list_of_list_l,
+            file_prefix=_directory,
+            file_name='RNN'
+        )
+        '''
+        _list_of_list_f, _list_of_list_l = loss_vs_valid_references(
+            _db, '2_RNN', 'RNN', _alphas[-2])
 
-    compareLossVsValidRNN(
-        l_of_l_files=_list_of_list_f,
-        l_of_l_labels=_list_of_list_l,
-        file_prefix=_directory,
-        file_name=f'And_Valids_RNN_LR{_alpha_strings[-2]}'
-    )
+        compareLossVsValidRNN(
+            l_of_l_files=_list_of_list_f,
+            l_of_l_labels=_list_of_list_l,
+            file_prefix=_directory,
+            file_name=f'And_Valids_RNN_LR{_alpha_strings[-2]}'
+        )
     pass
 
 
 def trial_3_GRU_plots():
-
     _alphas = [0.001, 0.0005, 0.0001, 0.00005, 0.00001, 0.000005]
     _alpha_strings = ['0_001', '0_0005', '0_0001',
                       '0_00005', '0_00001', '0_000005']
-    _rnn_depths = [1, 2, 3]
-    _seq_lengths = [5, 15, 25]
     _directory = '/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/3_Constituent_Hybrid_approach/Results/2_GRU/'
 
-    _list_of_list_f = []
-    _list_of_list_l = []
-    for idx, _alpha in enumerate(_alphas):
-        files = []
-        labels = []
-        for _rnn_depth in _rnn_depths:
-            for _seq_length in _seq_lengths:
-                files.append(
-                    f'{_directory}Losses_GRU_LR{_alpha_strings[idx]}_Lay{_rnn_depth}_Seq{_seq_length}.csv')
-                labels.append(
-                    f'Lay:{_rnn_depth} Seq:{_seq_length}')
-        _list_of_list_f.append(files)
-        _list_of_list_l.append(labels)
-
-    compareAvgLossRNN(
-        l_of_l_files=_list_of_list_f,
-        l_of_l_labels=_list_of_list_l,
-        file_prefix=_directory,
-        file_name='GRU'
-    )
-
-    for _alpha_string in _alpha_strings:
+    with ResultsDB(readonly=True) as _db:
         _list_of_list_f = []
         _list_of_list_l = []
-        for _rnn_depth in _rnn_depths:
-            files = []
-            labels = []
-            for _seq_length in _seq_lengths:
-                # if _rnn_depth == 1 and _seq_length != 5:
-                #     continue
-                files.append(
-                    f'{_directory}Losses_GRU_LR{_alpha_string}_Lay{_rnn_depth}_Seq{_seq_length}.csv')
-                labels.append(
-                    f'Training Seq:{_seq_length}')
-                files.append(
-                    f'{_directory}Valids_GRU_LR{_alpha_string}_Lay{_rnn_depth}_Seq{_seq_length}.csv')
-                labels.append(
-                    f'Validation Seq:{_seq_length}')
+        for _alpha in _alphas:
+            files, labels = avg_loss_references(_db, '3_GRU', 'GRU', _alpha)
             _list_of_list_f.append(files)
             _list_of_list_l.append(labels)
 
-        compareLossVsValidRNN(
+        compareAvgLossRNN(
             l_of_l_files=_list_of_list_f,
             l_of_l_labels=_list_of_list_l,
             file_prefix=_directory,
-            file_name=f'And_Valids_GRU_LR{_alpha_string}'
+            file_name='GRU'
         )
+
+        for idx, _alpha in enumerate(_alphas):
+            _list_of_list_f, _list_of_list_l = loss_vs_valid_references(
+                _db, '3_GRU', 'GRU', _alpha)
+
+            compareLossVsValidRNN(
+                l_of_l_files=_list_of_list_f,
+                l_of_l_labels=_list_of_list_l,
+                file_prefix=_directory,
+                file_name=f'And_Valids_GRU_LR{_alpha_strings[idx]}'
+            )
     pass
 
 
@@ -236,57 +221,33 @@ def trial_4_LSTM_plots():
     _alphas = [0.001, 0.0005, 0.0001, 0.00005, 0.00001, 0.000005]
     _alpha_strings = ['0_001', '0_0005', '0_0001',
                       '0_00005', '0_00001', '0_000005']
-    _rnn_depths = [1, 2, 3]
-    _seq_lengths = [5, 15, 25]
     _directory = '/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/3_Constituent_Hybrid_approach/Results/3_LSTM/'
 
-    _list_of_list_f = []
-    _list_of_list_l = []
-    for idx, _alpha in enumerate(_alphas):
-        files = []
-        labels = []
-        for _rnn_depth in _rnn_depths:
-            for _seq_length in _seq_lengths:
-                files.append(
-                    f'{_directory}Losses_LSTM_LR{_alpha_strings[idx]}_Lay{_rnn_depth}_Seq{_seq_length}.csv')
-                labels.append(
-                    f'Lay:{_rnn_depth} Seq:{_seq_length}')
-        _list_of_list_f.append(files)
-        _list_of_list_l.append(labels)
-
-    compareAvgLossRNN(
-        l_of_l_files=_list_of_list_f,
-        l_of_l_labels=_list_of_list_l,
-        file_prefix=_directory,
-        file_name='LSTM'
-    )
-
-    for _alpha_string in _alpha_strings:
+    with ResultsDB(readonly=True) as _db:
         _list_of_list_f = []
         _list_of_list_l = []
-        for _rnn_depth in _rnn_depths:
-            files = []
-            labels = []
-            for _seq_length in _seq_lengths:
-                # if _rnn_depth == 1 and _seq_length != 5:
-                #     continue
-                files.append(
-                    f'{_directory}Losses_LSTM_LR{_alpha_string}_Lay{_rnn_depth}_Seq{_seq_length}.csv')
-                labels.append(
-                    f'Training Seq:{_seq_length}')
-                files.append(
-                    f'{_directory}Valids_LSTM_LR{_alpha_string}_Lay{_rnn_depth}_Seq{_seq_length}.csv')
-                labels.append(
-                    f'Validation Seq:{_seq_length}')
+        for _alpha in _alphas:
+            files, labels = avg_loss_references(_db, '4_LSTM', 'LSTM', _alpha)
             _list_of_list_f.append(files)
             _list_of_list_l.append(labels)
 
-        compareLossVsValidRNN(
+        compareAvgLossRNN(
             l_of_l_files=_list_of_list_f,
             l_of_l_labels=_list_of_list_l,
             file_prefix=_directory,
-            file_name=f'And_Valids_LSTM_LR{_alpha_string}'
+            file_name='LSTM'
         )
+
+        for idx, _alpha in enumerate(_alphas):
+            _list_of_list_f, _list_of_list_l = loss_vs_valid_references(
+                _db, '4_LSTM', 'LSTM', _alpha)
+
+            compareLossVsValidRNN(
+                l_of_l_files=_list_of_list_f,
+                l_of_l_labels=_list_of_list_l,
+                file_prefix=_directory,
+                file_name=f'And_Valids_LSTM_LR{_alpha_strings[idx]}'
+            )
     pass
 
 
@@ -361,85 +322,54 @@ def trial_5_Hybrid_plots():
 def trial_6_Hybrid_kvs_plots():
     _model_directory = '/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/' + \
         '3_Constituent_Hybrid_approach/Results/6_Hybrid_KVS/'
-    _lossVsValidFiles = [
-        f'{_model_directory}Losses_KVS_RNN_LR0_00001_Lay1_Seq25.csv',
-        f'{_model_directory}Valids_KVS_RNN_LR0_00001_Lay1_Seq25.csv',
-        f'{_model_directory}Losses_KVS_GRU_LR0_00001_Lay2_Seq25.csv',
-        f'{_model_directory}Valids_KVS_GRU_LR0_00001_Lay2_Seq25.csv',
-        f'{_model_directory}Losses_KVS_LSTM_LR0_00001_Lay2_Seq25.csv',
-        f'{_model_directory}Valids_KVS_LSTM_LR0_00001_Lay2_Seq25.csv',
-    ]
-    _lossVsValidLabels = [
-        'Train. Loss   RNN',
-        'Valid. Loss   RNN',
-        'Train. Loss   GRU',
-        'Valid. Loss   GRU',
-        'Train. Loss   LSTM',
-        'Valid. Loss   LSTM'
-    ]
-
-    compareLossVsValid(
-        loss_files=_lossVsValidFiles,
-        loss_labels=_lossVsValidLabels,
-        file_prefix=_model_directory,
-        file_name='Model_RNNs'
-    )
-
-    '''
-    _alphas = [0.00001]
-    _alpha_strings = ['0_00001']
-    _rnn_depths = [1, 2, 3]
-    _seq_lengths = [5, 15, 25]
-    _directory = '/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/3_Constituent_Hybrid_approach/Results/5_Hybrid_KVS/'
-
-    _list_of_list_f = []
-    _list_of_list_l = []
-    for idx, _alpha in enumerate(_alphas):
-        files = []
-        labels = []
-        for _rnn_depth in _rnn_depths:
-            for _seq_length in _seq_lengths:
-                files.append(
-                    f'{_directory}Losses_LSTM_LR{_alpha_strings[idx]}_Lay{_rnn_depth}_Seq{_seq_length}.csv')
-                labels.append(
-                    f'Lay:{_rnn_depth} Seq:{_seq_length}')
-        _list_of_list_f.append(files)
-        _list_of_list_l.append(labels)
+    _lossVsValidFiles = []
+    _lossVsValidLabels = []
+
+    with ResultsDB(readonly=True) as _db:
+        for _model in ['KVS_RNN', 'KVS_GRU', 'KVS_LSTM']:
+            for _r in query_runs(_db, '6_Hybrid_KVS', _model, lr=0.00001):
+                _lossVsValidFiles.append(_db.reference(_r, 'Losses'))
+                _lossVsValidLabels.append(f'Train. Loss   {_model[4:]}')
+                _lossVsValidFiles.append(_db.reference(_r, 'Valids'))
+                _lossVsValidLabels.append(f'Valid. Loss   {_model[4:]}')
+
+        compareLossVsValid(
+            loss_files=_lossVsValidFiles,
+            loss_labels=_lossVsValidLabels,
+            file_prefix=_model_directory,
+            file_name='Model_RNNs'
+        )
 
-    compareAvgLossRNN(
-        l_of_l_files=_list_of_list_f,
-        l_of_l_labels=_list_of_list_l,
-        file_prefix=_directory,
-        file_name='LSTM-Hybrid'
-    )
+        '''
+        _alphas = [0.00001]
+        _alpha_strings = ['0_00001']
 
-    for _alpha_string in _alpha_strings:
         _list_of_list_f = []
         _list_of_list_l = []
-        for _rnn_depth in _rnn_depths:
-            files = []
-            labels = []
-            for _seq_length in _seq_lengths:
-                # if _rnn_depth == 1 and _seq_length != 5:
-                #     continue
-                files.append(
-                    f'{_directory}Losses_LSTM_LR{_alpha_string}_Lay{_rnn_depth}_Seq{_seq_length}.csv')
-                labels.append(
-                    f'Training Seq:{_seq_length}')
-                files.append(
-                    f'{_directory}Valids_LSTM_LR{_alpha_string}_Lay{_rnn_depth}_Seq{_seq_length}.csv')
-                labels.append(
-                    f'Validation Seq:{_seq_length}')
+        for _alpha in _alphas:
+            files, labels = avg_loss_references(
+                _db, '6_Hybrid_KVS', 'KVS_LSTM', _alpha)
             _list_of_list_f.append(files)
             _list_of_list_l.append(labels)
 
-        compareLossVsValidRNN(
+        compareAvgLossRNN(
             l_of_l_files=_list_of_list_f,
             l_of_l_labels=_list_of_list_l,
-            file_prefix=_directory,
-            file_name=f'And_Valids_LSTM_LR{_alpha_string}'
+            file_prefix=_model_directory,
+            file_name='LSTM-Hybrid'
         )
-    '''
+
+        for idx, _alpha in enumerate(_alphas):
+            _list_of_list_f, _list_of_list_l = loss_vs_valid_references(
+                _db, '6_Hybrid_KVS', 'KVS_LSTM', _alpha)
+
+            compareLossVsValidRNN(
+                l_of_l_files=_list_of_list_f,
+                l_of_l_labels=_list_of_list_l,
+                file_prefix=_model_directory,
+                file_name=f'And_Valids_LSTM_LR{_alpha_strings[idx]}'
+            )
+        '''
 
     pass
 
@@ -448,118 +378,46 @@ def trial_7_Hybrid_KVS_non_UNET_plots():
     print('Trial 7: Hybrid KVS non UNET (plotting)')
     _model_directory = '/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/' + \
         '3_Constituent_Hybrid_approach/Results/7_Hybrid_KVS_non_UNET/'
-    _lossVsValidFiles = [
-        f'{_model_directory}Losses_AE_Both_LR0_0005.csv',
-        f'{_model_directory}Valids_AE_Both_LR0_0005.csv',
-        f'{_model_directory}Losses_AE_Both_LR0_0001.csv',
-        f'{_model_directory}Valids_AE_Both_LR0_0001.csv',
-        f'{_model_directory}Losses_AE_Both_LR0_00005.csv',
-        f'{_model_directory}Valids_AE_Both_LR0_00005.csv',
-        f'{_model_directory}Losses_AE_Both_LR0_00001.csv',
-        f'{_model_directory}Valids_AE_Both_LR0_00001.csv',
-        f'{_model_directory}Losses_AE_Both_LR0_000005.csv',
-        f'{_model_directory}Valids_AE_Both_LR0_000005.csv',
-        f'{_model_directory}Losses_AE_Both_LR0_000001.csv',
-        f'{_model_directory}Valids_AE_Both_LR0_000001.csv',
-    ]
-    _lossVsValidLabels = [
-        'Train. Loss LR 0.0005',
-        'Valid. Loss LR 0.0005',
-        'Train. Loss LR 0.0001',
-        'Valid. Loss LR 0.0001',
-        'Train. Loss LR 0.00005',
-        'Valid. Loss LR 0.00005',
-        'Train. Loss LR 0.00001',
-        'Valid. Loss LR 0.00001',
-        'Train. Loss LR 0.000005',
-        'Valid. Loss LR 0.000005',
-        'Train. Loss LR 0.000001',
-        'Valid. Loss LR 0.000001'
-    ]
-
-    compareLossVsValid(
-        loss_files=_lossVsValidFiles,
-        loss_labels=_lossVsValidLabels,
-        file_prefix=_model_directory,
-        file_name='Model_AE_non_UNET'
-    )
+    _lossVsValidFiles = []
+    _lossVsValidLabels = []
+
+    with ResultsDB(readonly=True) as _db:
+        for _r in query_runs(_db, '7_Hybrid_KVS_non_UNET', 'AE_Both'):
+            _lossVsValidFiles.append(_db.reference(_r, 'Losses'))
+            _lossVsValidLabels.append(f'Train. Loss LR {_lr_string(_r)}')
+            _lossVsValidFiles.append(_db.reference(_r, 'Valids'))
+            _lossVsValidLabels.append(f'Valid. Loss LR {_lr_string(_r)}')
+
+        compareLossVsValid(
+            loss_files=_lossVsValidFiles,
+            loss_labels=_lossVsValidLabels,
+            file_prefix=_model_directory,
+            file_name='Model_AE_non_UNET'
+        )
 
     pass
 
 
 def analysis_2_plots():
     _alphas = [0.001, 0.0005, 0.0001, 0.00005, 0.00001, 0.000005]
-    _alpha_strings = ['0_001', '0_0005', '0_0001',
-                      '0_00005', '0_00001', '0_000005']
-    _rnn_depths = [1, 2, 3]
-    _seq_lengths = [5, 15, 25]
     _directory = '/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/3_Constituent_Hybrid_approach/Results/8_Analysis_2_Larger_Time_Intervals/'
 
-    _list_of_list_f = []
-    _list_of_list_l = []
-
-    for idx, _alpha in enumerate(_alphas):
-        files = []
-        labels = []
-        for _rnn_depth in _rnn_depths:
-            for _seq_length in _seq_lengths:
-                files.append(
-                    f'{_directory}Losses_RNN_LR{_alpha_strings[idx]}_Lay{_rnn_depth}_Seq{_seq_length}.csv')
-                labels.append(
-                    f'Lay:{_rnn_depth} Seq:{_seq_length}')
-        _list_of_list_f.append(files)
-        _list_of_list_l.append(labels)
-
-    compareAvgLossRNN(
-        l_of_l_files=_list_of_list_f,
-        l_of_l_labels=_list_of_list_l,
-        file_prefix=_directory,
-        file_name='RNN'
-    )
-
-    _list_of_list_f = []
-    _list_of_list_l = []
-
-    for idx, _alpha in enumerate(_alphas):
-        files = []
-        labels = []
-        for _rnn_depth in _rnn_depths:
-            for _seq_length in _seq_lengths:
-                files.append(
-                    f'{_directory}Losses_GRU_LR{_alpha_strings[idx]}_Lay{_rnn_depth}_Seq{_seq_length}.csv')
-                labels.append(
-                    f'Lay:{_rnn_depth} Seq:{_seq_length}')
-        _list_of_list_f.append(files)
-        _list_of_list_l.append(labels)
-
-    compareAvgLossRNN(
-        l_of_l_files=_list_of_list_f,
-        l_of_l_labels=_list_of_list_l,
-        file_prefix=_directory,
-        file_name='GRU'
-    )
-
-    _list_of_list_f = []
-    _list_of_list_l = []
-
-    for idx, _alpha in enumerate(_alphas):
-        files = []
-        labels = []
-        for _rnn_depth in _rnn_depths:
-            for _seq_length in _seq_lengths:
-                files.append(
-                    f'{_directory}Losses_LSTM_LR{_alpha_strings[idx]}_Lay{_rnn_depth}_Seq{_seq_length}.csv')
-                labels.append(
-                    f'Lay:{_rnn_depth} Seq:{_seq_length}')
-        _list_of_list_f.append(files)
-        _list_of_list_l.append(labels)
-
-    compareAvgLossRNN(
-        l_of_l_files=_list_of_list_f,
-        l_of_l_labels=_list_of_list_l,
-        file_prefix=_directory,
-        file_name='LSTM'
-    )
+    with ResultsDB(readonly=True) as _db:
+        for _model in ['RNN', 'GRU', 'LSTM']:
+            _list_of_list_f = []
+            _list_of_list_l = []
+            for _alpha in _alphas:
+                files, labels = avg_loss_references(
+                    _db, '8_Analysis_2_Larger_Time_Intervals', _model, _alpha)
+                _list_of_list_f.append(files)
+                _list_of_list_l.append(labels)
+
+            compareAvgLossRNN(
+                l_of_l_files=_list_of_list_f,
+                l_of_l_labels=_list_of_list_l,
+                file_prefix=_directory,
+                file_name=_model
+            )
     pass
 
 
@@ -581,56 +439,33 @@ def analysis_3_plots():
         'C_5_0_B'
     ]
     model_directory = '/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/3_Constituent_Hybrid_approach/Results/9_Analysis_3_non_UNET/AE/'
-    loss_prefix = 'Losses_AE_LR'
-
-    loss_files = [
-        f'{model_directory}{loss_prefix}0_0005.csv',
-        f'{model_directory}{loss_prefix}0_0001.csv',
-        f'{model_directory}{loss_prefix}0_00005.csv',
-        f'{model_directory}{loss_prefix}0_00001.csv',
-        f'{model_directory}{loss_prefix}0_000001.csv',
-    ]
-    loss_labels = [
-        'Learning Rate = 0.0005',
-        'Learning Rate = 0.0001',
-        'Learning Rate = 0.00005',
-        'Learning Rate = 0.00001',
-        'Learning Rate = 0.000001',
-    ]
 
-    compareAvgLoss(
-        loss_files=loss_files,
-        loss_labels=loss_labels,
-        file_prefix=model_directory,
-        file_name='NON_UNET_AE'
-    )
+    with ResultsDB(readonly=True) as _db:
+        _runs = query_runs(_db, '9_Analysis_3_non_UNET/AE', 'AE')
+        loss_files = [_db.reference(_r, 'Losses') for _r in _runs]
+        loss_labels = [f'Learning Rate = {_lr_string(_r)}' for _r in _runs]
+
+        compareAvgLoss(
+            loss_files=loss_files,
+            loss_labels=loss_labels,
+            file_prefix=model_directory,
+            file_name='NON_UNET_AE'
+        )
 
 
 if __name__ == "__main__":
-    _directory = '/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/' + \
-                 '3_Constituent_Hybrid_approach/Results/9_Analysis_3_non_UNET/RNNs/'
     _models = ['RNN', 'GRU', 'LSTM']
     _items = ['Losses', 'Valids']
 
-    for _model in _models:
-        for _item in _items:
-            _csv_files = glob.glob(
-                f"{_directory}{_item}_{_model}_LR0_*")
-            _losses = []
-            for _file in _csv_files:
-                with open(_file, 'r') as f:
-                    last_line = f.readlines()[-1]
-                    # print(_file)
-                    # print(last_line)
-                    _losses.append(float(last_line))
-
-            _min_loss = 5
-            for _loss in _losses:
-                _loss = float(_loss)
-                if _loss < _min_loss and _loss > 0:
-                    _min_loss = _loss
-            _min_indx = _losses.index(_min_loss)
-            _min_name = _csv_files[_min_indx].replace(_directory, '')
-            print(f'Model: {_min_name}')
-            print(f'Min Loss: {_min_loss}')
-            print('------------------------------------------------------------')
+    with ResultsDB(readonly=True) as _db:
+        for _model in _models:
+            for _item in _items:
+                _curves = _db.curves(
+                    _item, trial='9_Analysis_3_non_UNET/RNNs', model=_model)
+                _final = {_name: float(_curve[-1])
+                          for _name, _curve in _curves.items()
+                          if len(_curve) > 0 and _curve[-1] > 0}
+                _min_name = min(_final, key=_final.get)
+                print(f'Model: {_item}_{_min_name.split("/")[-1]}')
+                print(f'Min Loss: {_final[_min_name]}')
+                print('------------------------------------------------------------')
@@ -0,0 +1,109 @@
+import torch
+
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+OUTER_CELLS = 3             # outer cells per side around the inner MD region, refer to dataset.py
+METRICS = ['MAE', 'MSE', 'Max_Error', 'MAE_u_x', 'MAE_u_y', 'MAE_u_z',
+           'MAE_Inner', 'MAE_Outer']
+
+
+def cycle_errors(predictions, targets, outer_cells=OUTER_CELLS):
+    """The cycle_errors function computes all error metrics of every sample,
+    i.e. coupling cycle, of a batch at once. The errors remain on the device
+    of the inputs.
+
+    Args:
+        predictions:
+          Object of PyTorch Tensor type of shape (b, 3, x, y, z).
+        targets:
+          Object of PyTorch Tensor type of shape (b, 3, x, y, z).
+        outer_cells:
+          Object of integer type specifying the number of outer cells per side
+          that surround the inner MD region, i.e. 0 < outer_cells < side/2.
+
+    Returns:
+        errors:
+          Object of PyTorch Tensor type of shape (b, len(METRICS)) containing
+          the metrics in the order of METRICS.
+    """
+    _o = outer_cells
+    if not 0 < 2*_o < min(predictions.shape[2:]):
+        raise ValueError(
+            f'outer_cells={_o} leaves no inner or outer region in a volume '
+            f'of shape {tuple(predictions.shape[2:])}.')
+    _diff = predictions.float() - targets.float()
+    _abs = _diff.abs()
+    _inner = _abs[(slice(None), slice(None)) + tuple(
+        slice(_o, _side - _o) for _side in _abs.shape[2:])]
+    _n_all = _abs[0].numel()
+    _n_inner = _inner[0].numel()
+    _sum_all = _abs.sum(dim=(1, 2, 3, 4))
+    _sum_inner = _inner.sum(dim=(1, 2, 3, 4))
+    return torch.cat([
+        (_sum_all / _n_all)[:, None],
+        _diff.square().mean(dim=(1, 2, 3, 4))[:, None],
+        _abs.amax(dim=(1, 2, 3, 4))[:, None],
+        _abs.mean(dim=(2, 3, 4)),
+        (_sum_inner / _n_inner)[:, None],
+        ((_sum_all - _sum_inner) / (_n_all - _n_inner))[:, None]
+    ], dim=1)
+
+
+def evaluate_timelines(loader, models, outer_cells=OUTER_CELLS):
+    """The evaluate_timelines function computes the error timelines of several
+    models in a single pass over the loader. All metrics are accumulated on
+    the device and transferred to the host once at the end, i.e. there is no
+    host synchronization per coupling cycle. Stateful models, such as the
+    hybrid models, are fed the cycles in chronological order.
+
+    Args:
+        loader:
+          Object of PyTorch-type DataLoader to automatically feed dataset
+        models:
+          Object of list type containing objects of PyTorch Module class.
+        outer_cells:
+          Object of integer type, refer to cycle_errors.
+
+    Returns:
+        timelines:
+          Object of list type containing one dict per model, which maps every
+          metric name of METRICS to a numpy array holding one value per cycle.
+    """
+    _errors = [[] for _ in models]
+
+    with torch.inference_mode():
+        for _data, _targets in loader:
+            _data = _data.float().to(device=device, non_blocking=True)
+            _targets = _targets.float().to(device=device, non_blocking=True)
+
+            for _i, _model in enumerate(models):
+                with torch.cuda.amp.autocast():
+                    _predictions = _model(_data)
+                _errors[_i].append(cycle_errors(
+                    _predictions, _targets, outer_cells))
+
+    _timelines = []
+    for _e in _errors:
+        _values = torch.cat(_e).cpu().numpy()
+        _timelines.append(
+            {_name: _values[:, _j] for _j, _name in enumerate(METRICS)})
+    return _timelines
+
+
+def log_timelines(metrics, timelines, prefix):
+    """The log_timelines function writes every metric of a model's error
+    timelines to the metrics store.
+
+    Args:
+        metrics:
+          Object of MetricsWriter class.
+        timelines:
+          Object of dict type as returned by evaluate_timelines for one model.
+        prefix:
+          Object of string type preceding each metric name, e.g.
+          'Valid_Error_Timeline_C_3_0_T' yields 'Valid_Error_Timeline_C_3_0_T_MAE'.
+
+    Returns:
+        NONE
+    """
+    for _name, _values in timelines.items():
+        metrics.timeline(f'{prefix}_{_name}', _values)
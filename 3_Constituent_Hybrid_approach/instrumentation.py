@@ -0,0 +1,461 @@
+import os
+import sys
+import math
+import subprocess
+import multiprocessing
+import time
+import collections
+import torch
+import numpy as np
+
+STAGES = ['encode', 'fifo', 'predict', 'decode']
+PHASES = ['fetch', 'h2d', 'forward', 'backward', 'optimizer']
+
+
+class StageTimer():
+    """This class records the wall time and the allocations of every stage of
+    a hybrid coupling cycle (encode, fifo, predict, decode) into a rolling
+    window. It is attached to Hybrid_MD_RNN_UNET or Hybrid_MD_RNN_AE via
+    model.timer = StageTimer(...) and detached via model.timer = None. While
+    detached, the hybrid models do not call into this class at all.
+
+    On CUDA devices, the allocation of a stage is the peak memory allocated
+    during the stage beyond the memory allocated ahead of it. On CPU, it is
+    the size of the tensors returned by the stage.
+
+    Optionally, a torch.profiler trace is recorded for a window of cycles and
+    exported in the chrome trace format.
+
+    Args:
+        window:
+          Object of integer type specifying the number of most recent cycles
+          that are kept per stage.
+        profile_start:
+          Object of integer type specifying the cycle at which profiling
+          starts. Negative values turn profiling off.
+        profile_cycles:
+          Object of integer type specifying the number of profiled cycles.
+        trace_file:
+          Object of string type containing the name of the trace file.
+    """
+
+    def __init__(self, window=1000, profile_start=-1, profile_cycles=10, trace_file='hybrid_trace.json'):
+        self.window = window
+        self.profile_start = profile_start
+        self.profile_cycles = profile_cycles
+        self.trace_file = trace_file
+        self.num_cycles = 0
+        self.profiler = None
+        self.times = {_stage: collections.deque(maxlen=window)
+                      for _stage in STAGES + ['cycle']}
+        self.allocations = {_stage: collections.deque(maxlen=window)
+                            for _stage in STAGES}
+
+    def _synchronize(self, device):
+        if torch.device(device).type == 'cuda':
+            torch.cuda.synchronize(device)
+
+    def _run_stage(self, name, device, function, *args):
+        _cuda = torch.device(device).type == 'cuda'
+        if _cuda:
+            torch.cuda.reset_peak_memory_stats(device)
+            _allocated = torch.cuda.memory_allocated(device)
+
+        _start = time.perf_counter()
+        with torch.profiler.record_function(name):
+            _output = function(*args)
+        self._synchronize(device)
+        self.times[name].append(time.perf_counter() - _start)
+
+        if _cuda:
+            self.allocations[name].append(
+                torch.cuda.max_memory_allocated(device) - _allocated)
+        else:
+            _tensors = _output if isinstance(_output, (tuple, list)) \
+                else [_output]
+            _bytes = 0
+            for _tensor in _tensors:
+                if isinstance(_tensor, (tuple, list)):
+                    _bytes += sum(_t.nbytes for _t in _tensor)
+                else:
+                    _bytes += _tensor.nbytes
+            self.allocations[name].append(_bytes)
+        return _output
+
+    def _update_profiler(self):
+        if self.profile_start < 0:
+            return
+        if self.num_cycles == self.profile_start:
+            _activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                _activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.profiler = torch.profiler.profile(
+                activities=_activities, record_shapes=True,
+                profile_memory=True)
+            self.profiler.start()
+        elif self.num_cycles == self.profile_start + self.profile_cycles \
+                and self.profiler is not None:
+            self.profiler.stop()
+            self.profiler.export_chrome_trace(self.trace_file)
+            print(f'Exported profiler trace: {os.path.abspath(self.trace_file)}')
+            self.profiler = None
+
+    def cycle(self, model, x):
+        """The cycle function performs one instrumented coupling cycle of the
+        given hybrid model. It is called by the model's forward function.
+
+        Args:
+            model:
+              Object of PyTorch Module class, i.e. the hybrid model.
+            x:
+              Object of PyTorch Tensor class, i.e. the model input.
+
+        Returns:
+            x:
+              Object of PyTorch Tensor class, i.e. the model output.
+        """
+        self._update_profiler()
+        _device = model.device
+        self._synchronize(_device)
+        _start = time.perf_counter()
+
+        x, _skip_connections = self._run_stage(
+            'encode', _device, model.encode, x)
+        _x_shape = x.shape
+        x = self._run_stage('fifo', _device, model.fifo, x)
+        x = self._run_stage('predict', _device, model.predict, x)
+        x = self._run_stage('decode', _device, model.decode,
+                            x, _x_shape, _skip_connections)
+
+        self.times['cycle'].append(time.perf_counter() - _start)
+        self.num_cycles += 1
+        return x
+
+    def summary(self):
+        """The summary function computes the median and 99th percentile of
+        the wall time as well as the mean allocation of every stage over the
+        rolling window.
+
+        Args:
+            NONE
+
+        Returns:
+            summary:
+              Object of dict type mapping each stage to its statistics.
+        """
+        _summary = {}
+        for _stage, _times in self.times.items():
+            if len(_times) == 0:
+                continue
+            _ms = 1000 * np.array(_times)
+            _summary[_stage] = {
+                'count': len(_times),
+                'p50_ms': float(np.percentile(_ms, 50)),
+                'p99_ms': float(np.percentile(_ms, 99)),
+            }
+            if _stage in self.allocations:
+                _summary[_stage]['mean_alloc_bytes'] = float(
+                    np.mean(self.allocations[_stage]))
+        return _summary
+
+    def print_summary(self):
+        """The print_summary function prints the summary to the terminal.
+
+        Args:
+            NONE
+
+        Returns:
+            NONE
+        """
+        print('------------------------------------------------------------')
+        print('                  Hybrid Stage Latency                      ')
+        print(f'Cycles recorded\t= {self.num_cycles}')
+        print(f'{"Stage":<10} {"p50 [ms]":>10} {"p99 [ms]":>10} {"alloc [kB]":>12}')
+        for _stage, _stats in self.summary().items():
+            _alloc = _stats.get('mean_alloc_bytes')
+            _alloc = f'{_alloc/1024:>12.1f}' if _alloc is not None else \
+                f'{"-":>12}'
+            print(f'{_stage:<10} {_stats["p50_ms"]:>10.3f} '
+                  f'{_stats["p99_ms"]:>10.3f} {_alloc}')
+        print('------------------------------------------------------------')
+
+
+class PhaseTimer():
+    """This class splits every training step into the phases fetch (waiting
+    for the DataLoader), h2d (host-to-device copy), forward, backward and
+    optimizer. Per epoch, it reports the time spent in each phase and the input
+    stall percentage, i.e. the share of time spent waiting on data. Based on
+    the measured phase times, it recommends a number of loader workers and a
+    prefetch factor.
+
+    Usage within a training function:
+        profiler.begin(loader)
+        for _data, _targets in loader:
+            profiler.mark('fetch')
+            ...
+            profiler.mark('optimizer')
+    followed by profiler.end_epoch() once all loaders of an epoch are done.
+
+    Args:
+        device:
+          Object of torch.device type used to synchronize CUDA kernels, so
+          that asynchronous execution is attributed to the correct phase.
+    """
+
+    def __init__(self, device=torch.device('cpu')):
+        self.device = torch.device(device)
+        self.num_workers = 0
+        self.prefetch_factor = None
+        self.history = []
+        self._reset()
+
+    def _reset(self):
+        self.times = {_phase: [] for _phase in PHASES}
+        self._last = time.perf_counter()
+
+    def begin(self, loader):
+        """The begin function is called ahead of iterating over a loader."""
+        self.num_workers = loader.num_workers
+        self.prefetch_factor = loader.prefetch_factor
+        self._last = time.perf_counter()
+
+    def mark(self, phase):
+        """The mark function attributes the time since the previous mark to
+        the given phase."""
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+        _now = time.perf_counter()
+        self.times[phase].append(_now - self._last)
+        self._last = _now
+
+    def recommend(self, summary):
+        """The recommend function derives a worker count and prefetch factor
+        from an epoch summary. The per-batch loading cost of a single worker
+        is estimated from the fetch time: without workers, it is the fetch time
+        itself. With stalling workers, the loader delivers one batch per step,
+        hence each worker needs num_workers steps per batch. Enough workers are
+        recommended to hide the loading cost behind the compute time, while
+        the prefetch factor buffers the slowest observed fetches.
+
+        Args:
+            summary:
+              Object of dict type as created by end_epoch.
+
+        Returns:
+            num_workers:
+              Object of integer type containing the recommended worker count.
+            prefetch_factor:
+              Object of integer type containing the recommended prefetch factor.
+        """
+        _compute = summary['compute_per_step_s']
+        _fetch = summary['fetch_per_step_s']
+        _max_workers = max(1, (os.cpu_count() or 1) - 1)
+
+        if summary['stall_percent'] < 5:
+            return self.num_workers, self.prefetch_factor or 2
+
+        if self.num_workers == 0:
+            _load = _fetch
+        else:
+            _load = self.num_workers * (_fetch + _compute)
+        _workers = min(_max_workers, math.ceil(_load / max(_compute, 1e-9)) + 1)
+        _prefetch = min(8, max(2, math.ceil(
+            summary['fetch_max_s'] / max(_compute, 1e-9))))
+        return _workers, _prefetch
+
+    def end_epoch(self, epoch=None, verbose=True):
+        """The end_epoch function summarizes the phases of all steps since
+        the previous call, prints the report and resets the phase times.
+
+        Args:
+            epoch:
+              Object of integer type used for terminal output.
+            verbose:
+              Object of boolean type to turn terminal output on.
+
+        Returns:
+            summary:
+              Object of dict type containing the total time per phase, the
+              stall percentage and the recommendations.
+        """
+        _totals = {_phase: sum(_t) for _phase, _t in self.times.items()}
+        _steps = max(1, len(self.times['fetch']))
+        _total = sum(_totals.values())
+        _compute = _total - _totals['fetch']
+        _summary = {
+            'steps': len(self.times['fetch']),
+            'totals_s': _totals,
+            'total_s': _total,
+            'stall_percent': 100 * _totals['fetch'] / max(_total, 1e-9),
+            'fetch_per_step_s': _totals['fetch'] / _steps,
+            'fetch_max_s': max(self.times['fetch'], default=0.0),
+            'compute_per_step_s': _compute / _steps,
+            'num_workers': self.num_workers,
+            'prefetch_factor': self.prefetch_factor
+        }
+        _summary['recommended_num_workers'], \
+            _summary['recommended_prefetch_factor'] = self.recommend(_summary)
+        self.history.append(_summary)
+
+        if verbose:
+            print('------------------------------------------------------------')
+            print(f'Input stall analysis{f" - epoch {epoch}" if epoch else ""}:'
+                  f' {_summary["steps"]} steps, {_total:.2f}s')
+            for _phase in PHASES:
+                print(f'{_phase:<10} {_totals[_phase]:>9.3f}s '
+                      f'{100*_totals[_phase]/max(_total, 1e-9):>6.1f}%')
+            print(f'Input stall\t= {_summary["stall_percent"]:.1f}% '
+                  f'(num_workers={self.num_workers}, '
+                  f'prefetch_factor={self.prefetch_factor})')
+            print(f'Recommended\t: num_workers='
+                  f'{_summary["recommended_num_workers"]}, prefetch_factor='
+                  f'{_summary["recommended_prefetch_factor"]}')
+        self._reset()
+        return _summary
+
+
+def check_stage_timer():
+    """The check_stage_timer function validates that the instrumented and the
+    uninstrumented hybrid model yield identical outputs and prints the stage
+    summary.
+
+    Args:
+        NONE
+
+    Returns:
+        NONE
+    """
+    import torch.nn as nn
+    from model import UNET_AE, LSTM, Hybrid_MD_RNN_UNET, resetPipeline
+
+    _device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    _model_unet = UNET_AE(device=_device, in_channels=3, out_channels=3,
+                          features=[4, 8, 16],
+                          activation=nn.ReLU(inplace=True)).to(_device)
+    _model_rnn = LSTM(input_size=256, hidden_size=256, seq_size=25,
+                      num_layers=1, device=_device).to(_device)
+    _model = Hybrid_MD_RNN_UNET(device=_device, UNET_Model=_model_unet,
+                                RNN_Model=_model_rnn, seq_length=25)
+    _inputs = torch.rand(50, 1, 3, 24, 24, 24).to(_device)
+
+    with torch.no_grad():
+        resetPipeline(_model)
+        _reference = [_model(_x) for _x in _inputs]
+        resetPipeline(_model)
+        _model.timer = StageTimer(profile_start=10, profile_cycles=5,
+                                  trace_file='check_stage_timer_trace.json')
+        _outputs = [_model(_x) for _x in _inputs]
+
+    print('Identical outputs: ', all(torch.equal(_a, _b)
+                                     for _a, _b in zip(_reference, _outputs)))
+    _model.timer.print_summary()
+
+
+def measure_cold_start(module_name, repeats=3, top=10):
+    """The measure_cold_start function measures how long a fresh interpreter
+    takes to import the given module, e.g. 'trial_1' for the cold start of
+    'python trial_1.py' up to its __main__ block. It also lists the modules
+    with the largest cumulative import time as reported by 'python -X
+    importtime'.
+
+    Args:
+        module_name:
+          Object of string type containing the module to be imported.
+        repeats:
+          Object of integer type specifying the number of measurements. The
+          fastest one is reported to exclude a cold file system cache.
+        top:
+          Object of integer type specifying the number of modules listed.
+
+    Returns:
+        seconds:
+          A double value indicating the fastest wall time of the interpreter
+          start including the import.
+        slowest:
+          Object of list type containing (cumulative seconds, module name)
+          tuples of the slowest imports.
+    """
+    _directory = os.path.dirname(os.path.abspath(__file__))
+    _times = []
+    for _ in range(repeats):
+        _start = time.perf_counter()
+        _result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+            cwd=_directory, capture_output=True, text=True)
+        _times.append(time.perf_counter() - _start)
+        if _result.returncode != 0:
+            raise RuntimeError(f'Importing {module_name} failed:\n'
+                               f'{_result.stderr[-2000:]}')
+    _imports = []
+    for _line in _result.stderr.splitlines():
+        _fields = _line.split('|')
+        if len(_fields) == 3 and _fields[1].strip().isdigit():
+            _imports.append((int(_fields[1]) / 1e6, _fields[2].strip()))
+    _slowest = sorted(_imports, reverse=True)[1:top+1]
+    return min(_times), _slowest
+
+
+def _import_module(module_name):
+    __import__(module_name)
+
+
+def measure_spawn_worker(module_name, repeats=3):
+    """The measure_spawn_worker function measures the startup time of a
+    worker process under the 'spawn' start method, i.e. the time from
+    starting the process until it has imported the given module and exited.
+    Spawned DataLoader workers and mp.Process trainers re-import the main
+    module in the same way.
+
+    Args:
+        module_name:
+          Object of string type containing the module the worker imports.
+        repeats:
+          Object of integer type specifying the number of measurements.
+
+    Returns:
+        seconds:
+          A double value indicating the fastest worker startup time.
+    """
+    _context = multiprocessing.get_context('spawn')
+    _times = []
+    for _ in range(repeats):
+        _start = time.perf_counter()
+        _process = _context.Process(target=_import_module, args=(module_name,))
+        _process.start()
+        _process.join()
+        _times.append(time.perf_counter() - _start)
+    return min(_times)
+
+
+def check_cold_start(module_names=('trial_1', 'trial_2', 'trial_5', 'trial_6')):
+    """The check_cold_start function prints the cold start time and the
+    spawned worker startup time of the given training entry points, together
+    with their slowest imports.
+
+    Args:
+        module_names:
+          Object of tuple type containing the module names.
+
+    Returns:
+        NONE
+    """
+    for _module_name in module_names:
+        _seconds, _slowest = measure_cold_start(_module_name)
+        _worker = measure_spawn_worker(_module_name)
+        print(f'{_module_name}: cold start {_seconds:.2f}s, spawned worker '
+              f'{_worker:.2f}s, loads matplotlib: {_uses_matplotlib(_module_name)}')
+        for _cumulative, _name in _slowest[:5]:
+            print(f'\t{_cumulative:.3f}s\t{_name}')
+
+
+def _uses_matplotlib(module_name):
+    _result = subprocess.run(
+        [sys.executable, '-c',
+         f'import sys, {module_name}; print("matplotlib" in sys.modules)'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True)
+    return _result.stdout.strip()
+
+
+if __name__ == "__main__":
+    check_stage_timer()
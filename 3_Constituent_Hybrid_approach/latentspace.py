@@ -0,0 +1,376 @@
+import os
+import json
+import glob
+import hashlib
+import torch
+import numpy as np
+from torch.utils.data import DataLoader
+from dataset import MyMamicoDataset_RNN
+from utils_new import mamico_csv2dataset
+
+DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+_DIRECTORY = '/home/lerdo/lerdo_HPC_Lab_Project/Trainingdata/'
+
+
+def model_weights_hash(model):
+    """The model_weights_hash function computes a sha256 digest over the
+    state_dict of a model. Two models with identical architecture and weights
+    yield the same hash, regardless of the device they live on. The hash is
+    used as the key by which latentspaces are memoized.
+
+    Args:
+        model:
+          Object of PyTorch Module class, i.e. the encoder of interest.
+
+    Returns:
+        digest:
+          Object of string type containing the hex digest of the weights.
+    """
+    _sha = hashlib.sha256()
+    for _name, _tensor in sorted(model.state_dict().items()):
+        _tensor = _tensor.detach().cpu().contiguous().reshape(-1)
+        _sha.update(_name.encode())
+        _sha.update(str(_tensor.dtype).encode())
+        _sha.update(_tensor.view(torch.uint8).numpy().tobytes())
+    return _sha.hexdigest()
+
+
+def source_signature(file_name):
+    """The source_signature function describes the current state of a source
+    file by its absolute path, size and modification time. A change to any of
+    these invalidates all cache entries derived from the file.
+
+    Args:
+        file_name:
+          Object of string type containing the name of the source file.
+
+    Returns:
+        signature:
+          Object of dict type containing path, size and mtime_ns.
+    """
+    _stat = os.stat(file_name)
+    return {
+        'path': os.path.abspath(file_name),
+        'size': _stat.st_size,
+        'mtime_ns': _stat.st_mtime_ns
+    }
+
+
+def _cache_name(file_name):
+    # The file name alone is ambiguous, e.g. for identically named datasets in
+    # different directories. Hence, a hash of the absolute path is appended.
+    _stem = os.path.splitext(os.path.basename(file_name))[0]
+    _path_hash = hashlib.sha1(os.path.abspath(file_name).encode()).hexdigest()
+    return f'{_stem}_{_path_hash[:8]}'
+
+
+def _read_sidecar(file_name):
+    if not os.path.isfile(file_name):
+        return None
+    with open(file_name) as f:
+        return json.load(f)
+
+
+def _write_sidecar(file_name, entry):
+    # Written via a temporary file so concurrent spawned workers never read a
+    # partially written sidecar.
+    _tmp = f'{file_name}.{os.getpid()}.tmp'
+    with open(_tmp, 'w') as f:
+        json.dump(entry, f, indent=1)
+    os.replace(_tmp, file_name)
+
+
+def get_md_dataset_cached(file_name, cache_dir):
+    """The get_md_dataset_cached function is a cached variant of the
+    mamico_csv2dataset function. The first call parses the csv file and stores
+    the dataset as a .npy file in cache_dir. Subsequent calls memory-map the
+    .npy file instead of re-parsing the csv, as long as the source file is
+    unchanged.
+
+    Args:
+        file_name:
+          Object of string type containing the name of the MaMiCo csv file.
+        cache_dir:
+          Object of string type containing the path of the cache directory.
+
+    Returns:
+        dataset:
+          A numpy array of shape (1000 x 3 x 26 x 26 x 26). Refer to the
+          mamico_csv2dataset function for more details.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    _name = _cache_name(file_name)
+    _npy_file = os.path.join(cache_dir, f'{_name}_md.npy')
+    _sidecar = os.path.join(cache_dir, f'{_name}_md.json')
+    _signature = source_signature(file_name)
+
+    _entry = _read_sidecar(_sidecar)
+    if _entry is not None and _entry['source'] == _signature \
+            and os.path.isfile(_npy_file):
+        return np.load(_npy_file, mmap_mode='r')
+
+    _dataset = mamico_csv2dataset(file_name)
+    np.save(_npy_file, _dataset)
+    _write_sidecar(_sidecar, {'source': _signature, 'file': _npy_file})
+    return np.load(_npy_file, mmap_mode='r')
+
+
+def compute_latentspace(model, dataset, batch_size=32):
+    """The compute_latentspace function passes a MaMiCo dataset through the
+    contracting path of the given (UNET_)AE model and returns the flattened
+    bottleneck for every coupling cycle. Ghost cells are removed as in
+    MyMamicoDataset_UNET_AE.
+
+    Args:
+        model:
+          Object of PyTorch Module class, i.e. the (UNET_)AE encoder.
+        dataset:
+          A numpy array of shape (d_0 x 3 x 26 x 26 x 26).
+        batch_size:
+          Object of integer type specifying how many cycles are encoded at once.
+
+    Returns:
+        latentspace:
+          A numpy array of shape (d_0 x 256) containing the latentspace.
+    """
+    _latentspace = []
+    _device = next(model.parameters()).device
+    _was_training = model.training
+    model.eval()
+
+    with torch.no_grad():
+        for _start in range(0, len(dataset), batch_size):
+            _data = np.ascontiguousarray(
+                dataset[_start:_start+batch_size, :, 1:-1, 1:-1, 1:-1])
+            _data = torch.from_numpy(_data).float().to(_device)
+            _bottleneck, _ = model(_data, y='get_bottleneck')
+            _latentspace.append(_bottleneck.reshape(
+                _bottleneck.shape[0], -1).cpu().numpy())
+
+    model.train(_was_training)
+    return np.vstack(_latentspace)
+
+
+def get_latentspace_cached(file_name, model, cache_dir, model_hash=None):
+    """The get_latentspace_cached function returns the latentspace of a MaMiCo
+    dataset for the given encoder. Latentspaces are memoized in cache_dir and
+    keyed by the encoder weight hash and the source file signature. As such,
+    a latentspace is only (re)computed if it does not yet exist, if the encoder
+    was retrained or if the underlying MD data changed. Stale entries of a
+    source file are removed once they are replaced.
+
+    Args:
+        file_name:
+          Object of string type containing the name of the MaMiCo csv file.
+        model:
+          Object of PyTorch Module class, i.e. the (UNET_)AE encoder.
+        cache_dir:
+          Object of string type containing the path of the cache directory.
+        model_hash:
+          Object of string type containing the precomputed model_weights_hash.
+          Computed on demand if not provided.
+
+    Returns:
+        latentspace:
+          A numpy array of shape (d_0 x 256) containing the latentspace.
+    """
+    if model_hash is None:
+        model_hash = model_weights_hash(model)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    _name = _cache_name(file_name)
+    _ls_file = os.path.join(cache_dir, f'{_name}_ls_{model_hash[:16]}.npy')
+    _sidecar = os.path.join(cache_dir, f'{_name}_ls.json')
+    _signature = source_signature(file_name)
+
+    _entry = _read_sidecar(_sidecar)
+    if _entry is not None and _entry['encoder'] == model_hash \
+            and _entry['source'] == _signature and os.path.isfile(_ls_file):
+        print(f'Latentspace up to date: {_name}')
+        return np.load(_ls_file)
+
+    print(f'Computing latentspace: {_name}')
+    _dataset = get_md_dataset_cached(file_name, os.path.join(cache_dir, 'md'))
+    _latentspace = compute_latentspace(model, _dataset)
+    np.save(_ls_file, _latentspace)
+
+    if _entry is not None and _entry['file'] != _ls_file \
+            and os.path.isfile(_entry['file']):
+        os.remove(_entry['file'])
+    _write_sidecar(_sidecar, {
+        'encoder': model_hash,
+        'source': _signature,
+        'file': _ls_file
+    })
+    return _latentspace
+
+
+def get_latentspace_cached_mp(file_names, model, cache_dir):
+    """The get_latentspace_cached_mp function calls get_latentspace_cached for
+    a list of files while hashing the encoder only once.
+
+    Args:
+        file_names:
+          Object of list type containing the names of the MaMiCo csv files.
+        model:
+          Object of PyTorch Module class, i.e. the (UNET_)AE encoder.
+        cache_dir:
+          Object of string type containing the path of the cache directory.
+
+    Returns:
+        results:
+          A list containing the corresponding latentspaces of type numpy array.
+    """
+    _model_hash = model_weights_hash(model)
+    return [get_latentspace_cached(_file, model, cache_dir, _model_hash)
+            for _file in file_names]
+
+
+def get_RNN_loaders_from_encoder(data_distribution, model, batch_size=32, seq_length=15, shuffle=False, cache_dir=''):
+    """The get_RNN_loaders_from_encoder function retrieves the loaders of
+    PyTorch-type DataLoader to automatically feed datasets to the RNN models.
+    As opposed to get_RNN_loaders, it does not read offline latentspace csv
+    files, but derives the latentspaces from the MD data via the given encoder.
+    Refer to get_latentspace_cached for details on memoization. The offline
+    latentspaces of get_RNN_loaders map as follows: CleanCouetteLS and
+    CleanKVSLS to 'get_couette' and 'get_KVS' with a UNET_AE encoder,
+    CleanBothLS to 'get_both' and CleanKVS_AE_LS ('get_AE_KVS') to 'get_KVS'
+    with an AE encoder passed as model.
+
+    Args:
+        data_distribution:
+          Object of string type to differentiate between loading couette, kvs
+          or both datasets:
+          ['get_couette', 'get_KVS', 'get_both']
+        model:
+          Object of PyTorch Module class, i.e. the (UNET_)AE encoder.
+        batch_size:
+          Object of integer type that specifies the batch size.
+        seq_length:
+          Object of integer type specifying the number of elements to include
+          in the RNN sequence.
+        shuffle:
+          Object of boolean type used to turn data shuffling on.
+        cache_dir:
+          Object of string type containing the path of the cache directory.
+
+    Returns:
+        _dataloaders_train:
+          Object of PyTorch-type DataLoader to automatically feed training datasets.
+        _dataloaders_valid:
+          Object of PyTorch-type DataLoader to automatically feed validation datasets.
+    """
+    _batch_size = batch_size
+    _shuffle = shuffle
+    _num_workers = 1
+    _cache_dir = cache_dir
+    if _cache_dir == '':
+        _cache_dir = f'{_DIRECTORY}LatentspaceCache/'
+
+    if _shuffle is False:
+        _batch_size = 1
+
+    if data_distribution == "get_couette":
+        _sub_dirs = ['CleanCouette']
+    elif data_distribution == "get_KVS":
+        _sub_dirs = ['CleanKVS']
+    elif data_distribution == "get_both":
+        _sub_dirs = ['CleanCouette', 'CleanKVS']
+    else:
+        print('Invalid value for function parameter: data_distribution.')
+        return
+
+    print('------------------------------------------------------------')
+    print('                      Loader Summary                        ')
+    print('Cur. Loader\t : get_RNN_loaders_from_encoder')
+    print(f'Data Dist. \t= {data_distribution}')
+    print(f'Batch size\t= {_batch_size}')
+    print(f'Num worker\t= {_num_workers}')
+    print(f'Shuffle\t\t= {"on" if _shuffle else "off"}')
+    print(f'Cache dir\t= {_cache_dir}')
+
+    _train_files = []
+    _valid_files = []
+    for _sub_dir in _sub_dirs:
+        _train_files += sorted(glob.glob(
+            f"{_DIRECTORY}{_sub_dir}/Training/*.csv"))
+        _valid_files += sorted(glob.glob(
+            f"{_DIRECTORY}{_sub_dir}/Validation/*.csv"))
+
+    _data_train = get_latentspace_cached_mp(_train_files, model, _cache_dir)
+    _data_valid = get_latentspace_cached_mp(_valid_files, model, _cache_dir)
+
+    if _shuffle is True:
+        _data_train = [np.vstack(_data_train)]
+        _data_valid = [np.vstack(_data_valid)]
+
+    _dataloaders_train = []
+    _dataloaders_valid = []
+
+    for _data in _data_train:
+        _dataset = MyMamicoDataset_RNN(_data, seq_length)
+        _dataloader = DataLoader(
+            dataset=_dataset,
+            batch_size=_batch_size,
+            shuffle=_shuffle,
+            num_workers=_num_workers
+        )
+        _dataloaders_train.append(_dataloader)
+
+    for _data in _data_valid:
+        _dataset = MyMamicoDataset_RNN(_data, seq_length)
+        _dataloader = DataLoader(
+            dataset=_dataset,
+            batch_size=_batch_size,
+            shuffle=_shuffle,
+            num_workers=_num_workers
+        )
+        _dataloaders_valid.append(_dataloader)
+
+    print(f'Num Train Loaders = {len(_dataloaders_train)}')
+    print(f'Num Valid Loaders = {len(_dataloaders_valid)}')
+    return _dataloaders_train, _dataloaders_valid
+
+
+def check_latentspace_cache():
+    """The check_latentspace_cache function is used to validate that the
+    latentspace cache is reused for an unchanged encoder and recomputed once
+    the encoder weights change.
+
+    Args:
+        None:
+
+    Returns:
+        NONE:
+    """
+    import tempfile
+    from model import UNET_AE
+
+    _model = UNET_AE(
+        device=DEVICE,
+        in_channels=3,
+        out_channels=3,
+        features=[4, 8, 16],
+        activation=torch.nn.ReLU(inplace=True)
+    ).to(DEVICE)
+
+    with tempfile.TemporaryDirectory() as _dir:
+        _file = os.path.join(_dir, 'clean_random.csv')
+        with open(_file, 'w') as f:
+            for _t in range(1, 1001):
+                f.write(f'{_t};2;3;4;0.5;0.1;0.2;0\n')
+
+        _ls_1 = get_latentspace_cached(_file, _model, _dir)
+        _ls_2 = get_latentspace_cached(_file, _model, _dir)
+        print('Cache reused: ', np.array_equal(_ls_1, _ls_2))
+
+        with torch.no_grad():
+            _model.helper_down.weight.mul_(2)
+        _ls_3 = get_latentspace_cached(_file, _model, _dir)
+        print('Shape of latentspace: ', _ls_3.shape)
+        print('Stale entries removed: ',
+              len(glob.glob(os.path.join(_dir, '*_ls_*.npy'))) == 1)
+
+
+if __name__ == "__main__":
+    check_latentspace_cache()
@@ -428,31 +428,39 @@ class Hybrid_MD_RNN_UNET(nn.Module):
         self.seq_length = seq_length
         self.sequence = torch.zeros(self.seq_length, 256)
         # self.doubleConv = DoubleConv(in_channels=3, out_channels=3)
+        # Optional per-stage instrumentation, refer to instrumentation.py
+        self.timer = None
         print('Model initialized: Hybrid_MD_RNN_UNET')
 
-    def forward(self, x):
-
-        # print('Size of initial input: ', x.size())
-        x, skip_connections = self.unet(x, y='get_bottleneck')
-        # print('Size of bottleneck: ', x.size())
+    def encode(self, x):
+        return self.unet(x, y='get_bottleneck')
 
-        x_shape = x.shape
+    def fifo(self, x):
         self.sequence = tensor_FIFO_pipe(
             tensor=self.sequence,
             x=torch.reshape(x, (1, 256)),
             device=self.device).to(self.device)
-        # print('Size of self.sequence: ', self.sequence.size())
+        return torch.reshape(self.sequence, (1, self.seq_length, 256))
 
-        interim = torch.reshape(self.sequence, (1, self.seq_length, 256))
-        x = self.rnn(interim)
-        # print('Size of RNN Output: ', x.size())
+    def predict(self, x):
+        return self.rnn(x)
 
+    def decode(self, x, x_shape, skip_connections):
         x = torch.reshape(x, x_shape)
-        # print('Size of x after reshaping: ', x.size())
+        return self.unet(x, y='get_MD_output', skip_connections=skip_connections)
 
-        x = self.unet(x, y='get_MD_output', skip_connections=skip_connections)
-        # print('Size of x as final output: ', x.size())
-        return x
+    def forward(self, x):
+        # The coupling cycle is split into the stages encode, fifo, predict
+        # and decode, so that they can be timed individually if a StageTimer
+        # is attached. Otherwise, this costs a single attribute check.
+        if self.timer is not None:
+            return self.timer.cycle(self, x)
+
+        x, skip_connections = self.encode(x)
+        x_shape = x.shape
+        x = self.fifo(x)
+        x = self.predict(x)
+        return self.decode(x, x_shape, skip_connections)
 
 
 class Hybrid_MD_RNN_AE(nn.Module):
@@ -465,31 +473,39 @@ class Hybrid_MD_RNN_AE(nn.Module):
         self.seq_length = seq_length
         self.sequence = torch.zeros(self.seq_length, 256)
         # self.doubleConv = DoubleConv(in_channels=3, out_channels=3)
+        # Optional per-stage instrumentation, refer to instrumentation.py
+        self.timer = None
         print('Model initialized: Hybrid_MD_RNN_AE')
 
-    def forward(self, x):
-
-        # print('Size of initial input: ', x.size())
-        x, skip_connections = self.AE(x, y='get_bottleneck')
-        # print('Size of bottleneck: ', x.size())
+    def encode(self, x):
+        return self.AE(x, y='get_bottleneck')
 
-        x_shape = x.shape
+    def fifo(self, x):
         self.sequence = tensor_FIFO_pipe(
             tensor=self.sequence,
             x=torch.reshape(x, (1, 256)),
             device=self.device).to(self.device)
-        # print('Size of self.sequence: ', self.sequence.size())
+        return torch.reshape(self.sequence, (1, self.seq_length, 256))
 
-        interim = torch.reshape(self.sequence, (1, self.seq_length, 256))
-        x = self.rnn(interim)
-        # print('Size of RNN Output: ', x.size())
+    def predict(self, x):
+        return self.rnn(x)
 
+    def decode(self, x, x_shape, skip_connections):
         x = torch.reshape(x, x_shape)
-        # print('Size of x after reshaping: ', x.size())
+        return self.AE(x, y='get_MD_output', skip_connections=skip_connections)
 
-        x = self.AE(x, y='get_MD_output', skip_connections=skip_connections)
-        # print('Size of x as final output: ', x.size())
-        return x
+    def forward(self, x):
+        # The coupling cycle is split into the stages encode, fifo, predict
+        # and decode, so that they can be timed individually if a StageTimer
+        # is attached. Otherwise, this costs a single attribute check.
+        if self.timer is not None:
+            return self.timer.cycle(self, x)
+
+        x, skip_connections = self.encode(x)
+        x_shape = x.shape
+        x = self.fifo(x)
+        x = self.predict(x)
+        return self.decode(x, x_shape, skip_connections)
 
 
 def resetPipeline(model):
@@ -0,0 +1,96 @@
+import torch
+import numpy as np
+
+
+def _to_numpy(x):
+    if torch.is_tensor(x):
+        return x.detach().float().cpu().numpy()
+    return np.asarray(x)
+
+
+def _select(volumes, timesteps):
+    if timesteps is None:
+        return volumes
+    return volumes[list(timesteps)]
+
+
+def plane_averages(volumes, timesteps=None):
+    """The plane_averages function averages every velocity component over the
+    x-y planes of the given volumes, i.e. it yields the flow profile along
+    the z-direction. All selected timesteps are reduced in one operation. For
+    torch tensors, the reduction runs on the tensor's device and only the
+    reduced array is transferred.
+
+    Args:
+        volumes:
+          Object of numpy array or PyTorch Tensor type of shape (t, c, x, y, z).
+        timesteps:
+          Object of list type containing the timesteps to reduce. If None, all
+          timesteps are reduced.
+
+    Returns:
+        profiles:
+          Object of numpy array type of shape (len(timesteps), c, z).
+    """
+    _volumes = _select(volumes, timesteps)
+    if torch.is_tensor(_volumes):
+        return _to_numpy(_volumes.mean(dim=(2, 3)))
+    return _volumes.mean(axis=(2, 3))
+
+
+def centerlines(volumes, timesteps=None):
+    """The centerlines function extracts the velocity components along the
+    three lines through the center of the domain that are parallel to the
+    x-, y- and z-axis, respectively.
+
+    Args:
+        volumes:
+          Object of numpy array or PyTorch Tensor type of shape (t, c, x, y, z)
+          with x = y = z.
+        timesteps:
+          Object of list type containing the timesteps to reduce. If None, all
+          timesteps are reduced.
+
+    Returns:
+        lines:
+          Object of numpy array type of shape (len(timesteps), c, 3, x), where
+          lines[:, :, 0], lines[:, :, 1] and lines[:, :, 2] run along the x-, y-
+          and z-axis.
+    """
+    _volumes = _select(volumes, timesteps)
+    _mid = int(_volumes.shape[-1]/2)
+    _lines = [_volumes[:, :, :, _mid, _mid],
+              _volumes[:, :, _mid, :, _mid],
+              _volumes[:, :, _mid, _mid, :]]
+    if torch.is_tensor(_volumes):
+        return _to_numpy(torch.stack(_lines, dim=2))
+    return np.stack(_lines, axis=2)
+
+
+def line_statistics(volumes, component=0):
+    """The line_statistics function reduces every timestep to the mean and the
+    standard deviation of one velocity component along the y-axis through the
+    domain center, as well as its local value at the center. It is typically
+    applied batch by batch within the evaluation loop, so that only three
+    values per timestep are kept.
+
+    Args:
+        volumes:
+          Object of numpy array or PyTorch Tensor type of shape (t, c, x, y, z).
+        component:
+          Object of integer type specifying the velocity component.
+
+    Returns:
+        statistics:
+          Object of numpy array type of shape (t, 3) containing mean, standard
+          deviation and local value per timestep.
+    """
+    _mid = int(volumes.shape[2]/2)
+    _line = volumes[:, component, _mid, :, _mid]
+    _local = volumes[:, component, _mid, _mid, _mid]
+    if torch.is_tensor(volumes):
+        _line = _line.float()
+        return _to_numpy(torch.stack(
+            [_line.mean(dim=1), _line.std(dim=1, unbiased=False),
+             _local.float()], dim=1))
+    return np.stack([_line.mean(axis=1), _line.std(axis=1), _local], axis=1)
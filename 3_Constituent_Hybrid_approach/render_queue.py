@@ -0,0 +1,181 @@
+import os
+import inspect
+import hashlib
+import importlib
+import concurrent.futures
+import multiprocessing
+import numpy as np
+
+RENDER_CACHE = '.render_cache'  # directory holding one marker file per rendered figure
+
+
+def _hash_value(digest, value):
+    if hasattr(value, 'detach'):
+        value = value.detach().cpu().numpy()
+    if isinstance(value, np.ndarray):
+        _array = np.ascontiguousarray(value)
+        digest.update(f'{_array.dtype.str}{_array.shape}'.encode())
+        digest.update(_array.tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'{type(value).__name__}{len(value)}'.encode())
+        for _item in value:
+            _hash_value(digest, _item)
+    else:
+        digest.update(repr(value).encode())
+
+
+def figure_hash(function, kwargs):
+    """The figure_hash function computes the content hash identifying a
+    figure, i.e. a hash over the plotting function's name, its source code
+    and all of its arguments. Arrays are hashed by dtype, shape and content.
+
+    Args:
+        function:
+          The plotting function, e.g. plotting.plotPredVsTargCouette.
+        kwargs:
+          Object of dict type containing the keyword arguments of function.
+
+    Returns:
+        hash:
+          Object of string type containing the hexadecimal sha1 digest.
+    """
+    _digest = hashlib.sha1()
+    _digest.update(f'{function.__module__}.{function.__qualname__}'.encode())
+    # Changes to the plotting code invalidate its cached figures
+    try:
+        _digest.update(inspect.getsource(function).encode())
+    except (OSError, TypeError):
+        _digest.update(function.__code__.co_code)
+    for _key in sorted(kwargs):
+        _digest.update(_key.encode())
+        _hash_value(_digest, kwargs[_key])
+    return _digest.hexdigest()
+
+
+def _render(module, name, kwargs, marker):
+    # Runs in the worker process. The function is looked up by name, so that
+    # only the module name and the small reduced arrays are pickled. The files
+    # saved by the function are recorded in the marker, refer to _rendered.
+    import matplotlib.pyplot as plt
+    from matplotlib.figure import Figure
+    _outputs = []
+    _savefig = Figure.savefig
+
+    def _recording_savefig(self, fname, *args, **kwargs):
+        if isinstance(fname, (str, os.PathLike)):
+            _outputs.append(os.path.abspath(fname))
+        return _savefig(self, fname, *args, **kwargs)
+
+    Figure.savefig = _recording_savefig
+    try:
+        getattr(importlib.import_module(module), name)(**kwargs)
+    finally:
+        Figure.savefig = _savefig
+        plt.close('all')
+    if marker is not None:
+        with open(marker, 'w') as f:
+            f.writelines(f'{_output}\n' for _output in _outputs)
+    return marker
+
+
+def _rendered(marker):
+    # A figure counts as rendered if its marker exists and all files it saved
+    # still exist, i.e. deleted figures are rendered again.
+    if not os.path.exists(marker):
+        return False
+    with open(marker) as f:
+        _outputs = f.read().splitlines()
+    return len(_outputs) > 0 and all(os.path.exists(_o) for _o in _outputs)
+
+
+class RenderQueue():
+    """This class decouples figure rendering from the evaluation loops. Plot
+    requests are handed to a pool of background processes, so that the
+    caller never waits for matplotlib. A figure is skipped if a figure with
+    identical inputs and plotting code was already rendered and its files
+    still exist, as recorded by a marker file named after its content hash in
+    cache_dir. Hence, the evaluation functions should only submit small
+    reduced arrays, refer to reductions.py.
+
+    Usage:
+        with RenderQueue() as _renderer:
+            _renderer.submit(plotPredVsTargCouette, input_1=..., input_2=...)
+
+    Args:
+        max_workers:
+          Object of integer type specifying the number of rendering
+          processes. If 0, figures are rendered inline by the caller.
+        cache_dir:
+          Object of string type containing the directory of the marker files,
+          or None to disable the cache.
+    """
+
+    def __init__(self, max_workers=1, cache_dir=RENDER_CACHE):
+        self.max_workers = max_workers
+        self.cache_dir = cache_dir
+        self.skipped = 0
+        self._pending = {}
+        self._executor = None
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        if max_workers > 0:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'))
+
+    def submit(self, function, **kwargs):
+        """The submit function enqueues one figure for rendering.
+
+        Args:
+            function:
+              A module-level plotting function, e.g. plotting.compareFlowProfile3x3.
+            kwargs:
+              The keyword arguments passed to function.
+
+        Returns:
+            rendered:
+              Object of boolean type, False if the figure was skipped because
+              identical inputs were already rendered or enqueued.
+        """
+        _hash = figure_hash(function, kwargs)
+        _marker = None
+        if self.cache_dir is not None:
+            _marker = os.path.join(self.cache_dir, _hash)
+            if _hash in self._pending or _rendered(_marker):
+                self.skipped += 1
+                return False
+        _args = (function.__module__, function.__name__, kwargs, _marker)
+        if self._executor is None:
+            _render(*_args)
+        else:
+            self._pending[_hash] = self._executor.submit(_render, *_args)
+            self._collect()
+        return True
+
+    def _collect(self, wait=False):
+        for _hash, _future in list(self._pending.items()):
+            if not wait and not _future.done():
+                continue
+            try:
+                _future.result()
+            except Exception as e:
+                print(f'RenderQueue: rendering {_hash} failed: {e!r}')
+            del self._pending[_hash]
+
+    def wait(self):
+        """The wait function blocks until all enqueued figures are rendered."""
+        self._collect(wait=True)
+
+    def close(self):
+        """The close function waits for all enqueued figures and shuts down
+        the rendering processes."""
+        self.wait()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
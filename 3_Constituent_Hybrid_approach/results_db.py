@@ -0,0 +1,431 @@
+import os
+import re
+import glob
+import json
+import time
+import sqlite3
+import pathlib
+import numpy as np
+from metrics import read_scalars, read_timelines
+
+RESULTS_DB = ('/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/'
+              '3_Constituent_Hybrid_approach/Results/results.db')
+# Results directories relative to the directory of RESULTS_DB. Each one is
+# indexed as a trial of the same name.
+TRIALS = ['1_UNET_AE', '2_RNN', '3_GRU', '4_LSTM', '6_Hybrid_KVS',
+          '7_Hybrid_KVS_non_UNET', '8_Analysis_2_Larger_Time_Intervals',
+          '9_Analysis_3_non_UNET/AE', '9_Analysis_3_non_UNET/RNNs']
+SERIES_PREFIXES = ['Losses', 'Valids', 'Times', 'Resolution']
+ARTIFACT_PATTERNS = ['Model_*', '*.svg', '*.png']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    trial TEXT,
+    model TEXT,
+    config TEXT NOT NULL DEFAULT '{}',
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS series (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    step INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (run_id, name, step)
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (run_id, path)
+);
+CREATE INDEX IF NOT EXISTS runs_trial_model ON runs (trial, model);
+"""
+
+
+def parse_identifier(identifier):
+    """The parse_identifier function derives the model type and the training
+    configuration from a model identifier as used in the result file names,
+    e.g. 'LSTM_LR0_00001_Lay2_Seq25' yields
+    ('LSTM', {'lr': 1e-05, 'layers': 2, 'seq_length': 25}). Any remaining
+    tokens are kept as 'variant', e.g. 'UNET_AE_LR0_0005_DDP2' yields
+    ('UNET_AE', {'lr': 0.0005, 'variant': 'DDP2'}).
+
+    Args:
+        identifier:
+          Object of string type containing the model identifier.
+
+    Returns:
+        model:
+          Object of string type containing the model type, i.e. everything
+          in front of the first configuration token.
+        config:
+          Object of dict type containing the parsed configuration.
+    """
+    _config = {}
+    _lr = re.search(r'LR(\d+_\d+)', identifier)
+    if _lr is not None:
+        _config['lr'] = float(_lr.group(1).replace('_', '.'))
+    for _key, _token in [('layers', 'Lay'), ('seq_length', 'Seq')]:
+        _match = re.search(rf'{_token}(\d+)', identifier)
+        if _match is not None:
+            _config[_key] = int(_match.group(1))
+    _model = re.split(r'_?(?:LR\d|Lay\d|Seq\d)', identifier)[0]
+    _variant = re.sub(r'LR\d+_\d+|Lay\d+|Seq\d+', '',
+                      identifier[len(_model):]).strip('_')
+    if _variant != '':
+        _config['variant'] = re.sub('_+', '_', _variant)
+    return _model, _config
+
+
+def run_name(trial, identifier):
+    """The run_name function returns the unique name of a run, i.e. its
+    model identifier qualified by its trial, e.g. '2_RNN/RNN_LR0_001_Lay1_Seq5',
+    since the analysis trials retrain models of identical identifiers."""
+    return f'{trial}/{identifier}'
+
+
+class ResultsDB():
+    """This class is an embedded, SQLite-backed index of all experiment
+    results. Each run is identified by a unique name, refer to run_name, and
+    stores its trial, model type and configuration (as JSON). Loss curves and timelines are kept
+    as float32 blobs, i.e. one row per curve, and artifacts such as model
+    checkpoints and figures are referenced by path. The whole index is a
+    single file, so that comparison plots and tables are built from one query
+    instead of loading dozens of csv files.
+
+    Usage:
+        with ResultsDB(readonly=True) as _db:
+            _runs = _db.runs(trial='4_LSTM', lr=1e-05)
+            _losses = _db.curves('Losses', trial='4_LSTM', lr=1e-05)
+
+    Args:
+        file_name:
+          Object of string type containing the name of the database file.
+        readonly:
+          Object of boolean type. If True, the database must exist and is
+          opened for queries only, i.e. a mistyped file name raises an
+          sqlite3.OperationalError instead of creating an empty database.
+    """
+
+    def __init__(self, file_name=RESULTS_DB, readonly=False):
+        self.file_name = file_name
+        if readonly:
+            _uri = pathlib.Path(os.path.abspath(file_name)).as_uri()
+            self._connection = sqlite3.connect(f'{_uri}?mode=ro', uri=True)
+            return
+        _directory = os.path.dirname(file_name)
+        if _directory != '':
+            os.makedirs(_directory, exist_ok=True)
+        # Concurrent trainers record their runs into the same database
+        self._connection = sqlite3.connect(file_name, timeout=60)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(_SCHEMA)
+
+    def add_run(self, name, trial=None, model=None, config=None):
+        """The add_run function registers a run or updates its trial, model
+        and configuration if it already exists.
+
+        Args:
+            name:
+              Object of string type containing the unique run name.
+            trial:
+              Object of string type, e.g. '2_RNN'.
+            model:
+              Object of string type, e.g. 'RNN'.
+            config:
+              Object of dict type containing the configuration. It is merged
+              into the stored configuration.
+
+        Returns:
+            run_id:
+              Object of integer type identifying the run.
+        """
+        _row = self._connection.execute(
+            'SELECT id, trial, model, config FROM runs WHERE name = ?',
+            (name,)).fetchone()
+        if _row is None:
+            _cursor = self._connection.execute(
+                'INSERT INTO runs (name, trial, model, config, created) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (name, trial, model, json.dumps(config or {}), time.time()))
+            self._connection.commit()
+            return _cursor.lastrowid
+        _config = json.loads(_row[3])
+        _config.update(config or {})
+        self._connection.execute(
+            'UPDATE runs SET trial = ?, model = ?, config = ? WHERE id = ?',
+            (trial or _row[1], model or _row[2], json.dumps(_config), _row[0]))
+        self._connection.commit()
+        return _row[0]
+
+    def _run_id(self, run):
+        if isinstance(run, int):
+            return run
+        _row = self._connection.execute(
+            'SELECT id FROM runs WHERE name = ?', (run,)).fetchone()
+        if _row is None:
+            raise KeyError(f'Run {run} not found in {self.file_name}.')
+        return _row[0]
+
+    def add_series(self, run, name, values, kind='scalar', step=0, commit=True):
+        """The add_series function stores one curve of a run. A curve of the
+        same name and step is replaced.
+
+        Args:
+            run:
+              Object of string type (run name) or integer type (run id).
+            name:
+              Object of string type, e.g. 'Losses' or 'Valid_Error_Timeline_MAE'.
+            values:
+              Object of list type or numpy array containing the curve.
+            kind:
+              Object of string type, 'scalar' for per-epoch series or
+              'timeline' for per-cycle series.
+            step:
+              Object of integer type, e.g. the epoch of a timeline.
+
+        Returns:
+            NONE
+        """
+        _values = np.ascontiguousarray(np.ravel(values), dtype='<f4')
+        self._connection.execute(
+            'INSERT OR REPLACE INTO series VALUES (?, ?, ?, ?, ?, ?)',
+            (self._run_id(run), name, kind, int(step), len(_values),
+             _values.tobytes()))
+        if commit:
+            self._connection.commit()
+
+    def add_artifact(self, run, path, kind=None):
+        """The add_artifact function references a file belonging to a run,
+        e.g. a model checkpoint or a figure. The kind defaults to the file
+        suffix or 'model' for checkpoints."""
+        if kind is None:
+            _suffix = os.path.splitext(path)[1]
+            kind = _suffix[1:] if _suffix != '' else 'model'
+        self._connection.execute(
+            'INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?)',
+            (self._run_id(run), kind, os.path.abspath(path)))
+        self._connection.commit()
+
+    def import_metrics(self, run, file_name):
+        """The import_metrics function copies all scalar series and timelines
+        of a metrics store (refer to metrics.py) into the run. Series names of
+        the form '<prefix>_<model>', e.g. 'Losses_RNN', are stored as
+        '<prefix>' if the run belongs to that model.
+
+        Args:
+            run:
+              Object of string type (run name) or integer type (run id).
+            file_name:
+              Object of string type containing the name of the store file.
+
+        Returns:
+            NONE
+        """
+        _model = self._connection.execute(
+            'SELECT model FROM runs WHERE id = ?',
+            (self._run_id(run),)).fetchone()[0]
+        for _name, _values in read_scalars(file_name).items():
+            if _model is not None and _name.endswith(f'_{_model}'):
+                _name = _name[:-len(_model)-1]
+            self.add_series(run, _name, _values, commit=False)
+        for _name, _timelines in read_timelines(file_name).items():
+            for _step, _values in enumerate(_timelines):
+                self.add_series(run, _name, _values, kind='timeline',
+                                step=_step, commit=False)
+        self._connection.commit()
+
+    def runs(self, trial=None, model=None, **config):
+        """The runs function queries all runs matching the given trial, model
+        and configuration values, e.g. runs(model='GRU', lr=1e-05, layers=2).
+
+        Returns:
+            runs:
+              Object of list type containing one dict per run with the keys
+              'id', 'name', 'trial', 'model' and 'config', ordered by name.
+        """
+        _query = 'SELECT id, name, trial, model, config FROM runs WHERE 1'
+        _args = []
+        if trial is not None:
+            _query += ' AND trial = ?'
+            _args.append(trial)
+        if model is not None:
+            _query += ' AND model = ?'
+            _args.append(model)
+        for _key, _value in config.items():
+            _query += f" AND json_extract(config, '$.{_key}') = ?"
+            _args.append(_value)
+        _query += ' ORDER BY name'
+        return [{'id': _r[0], 'name': _r[1], 'trial': _r[2], 'model': _r[3],
+                 'config': json.loads(_r[4])}
+                for _r in self._connection.execute(_query, _args)]
+
+    def series(self, run, name, step=None):
+        """The series function loads one curve of a run. For timelines, the
+        most recent step is returned unless step is given."""
+        _query = 'SELECT data FROM series WHERE run_id = ? AND name = ?'
+        _args = [self._run_id(run), name]
+        if step is not None:
+            _query += ' AND step = ?'
+            _args.append(int(step))
+        _row = self._connection.execute(
+            _query + ' ORDER BY step DESC LIMIT 1', _args).fetchone()
+        if _row is None:
+            raise KeyError(f'Series {name} of run {run} not found.')
+        return np.frombuffer(_row[0], dtype='<f4')
+
+    def curves(self, name, trial=None, model=None, **config):
+        """The curves function loads the curve of the given name for all runs
+        matching trial, model and configuration in a single query.
+
+        Returns:
+            curves:
+              Object of dict type mapping each run name to its curve as numpy
+              array, ordered by run name.
+        """
+        _runs = self.runs(trial=trial, model=model, **config)
+        if len(_runs) == 0:
+            return {}
+        _ids = {_r['id']: _r['name'] for _r in _runs}
+        _rows = self._connection.execute(
+            'SELECT run_id, data FROM series WHERE name = ? AND run_id IN '
+            f'({",".join("?" * len(_ids))}) ORDER BY run_id, step',
+            [name] + list(_ids))
+        _curves = {}
+        for _id, _data in _rows:
+            _curves[_ids[_id]] = np.frombuffer(_data, dtype='<f4')
+        return {_r['name']: _curves[_r['name']] for _r in _runs
+                if _r['name'] in _curves}
+
+    def artifacts(self, run, kind=None):
+        """The artifacts function lists the paths of all files referenced by
+        a run, optionally restricted to one kind, e.g. 'svg'."""
+        _query = 'SELECT path FROM artifacts WHERE run_id = ?'
+        _args = [self._run_id(run)]
+        if kind is not None:
+            _query += ' AND kind = ?'
+            _args.append(kind)
+        return [_r[0] for _r in self._connection.execute(_query, _args)]
+
+    def reference(self, run, name):
+        """The reference function returns the string used by load_series and
+        hence the plotting functions to refer to a curve of a run, given by
+        its name or as returned by the runs function."""
+        if isinstance(run, dict):
+            run = run['name']
+        return f'{self.file_name}::{run}::{name}'
+
+    def close(self):
+        """The close function closes the database connection."""
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def record_run(trial, identifier, metrics_file, config=None, artifacts=None, file_name=RESULTS_DB):
+    """The record_run function is the hook the trainers call once a run has
+    finished. It registers the run with its configuration, imports its metrics
+    store and references its artifacts, e.g. the model checkpoint.
+
+    Args:
+        trial:
+          Object of string type, e.g. '2_RNN', refer to TRIALS.
+        identifier:
+          Object of string type containing the model identifier as used in
+          the result file names, e.g. 'RNN_LR0_001_Lay1_Seq5'.
+        metrics_file:
+          Object of string type containing the name of the metrics store.
+        config:
+          Object of dict type containing the training configuration. It is
+          merged into the configuration parsed from identifier.
+        artifacts:
+          Object of list type containing the names of the run's files.
+        file_name:
+          Object of string type containing the name of the database file.
+
+    Returns:
+        name:
+          Object of string type containing the run name.
+    """
+    _model, _config = parse_identifier(identifier)
+    _config.update(config or {})
+    _name = run_name(trial, identifier)
+    with ResultsDB(file_name) as _db:
+        _db.add_run(_name, trial=trial, model=_model, config=_config)
+        _db.import_metrics(_name, metrics_file)
+        for _file in artifacts or []:
+            _db.add_artifact(_name, _file)
+    print(f'Recorded run {_name} in {file_name}.')
+    return _name
+
+
+def index_results(directory, trial=None, db=None):
+    """The index_results function imports an existing results directory into
+    the results database: legacy loss csv files (e.g.
+    'Losses_RNN_LR0_001_Lay1_Seq5.csv'), metrics stores (e.g.
+    'Metrics_RNN_LR0_001_Lay1_Seq5.jsonl') and artifacts, i.e. model
+    checkpoints and figures whose file name contains a model identifier.
+
+    Args:
+        directory:
+          Object of string type containing the results directory.
+        trial:
+          Object of string type, defaults to the name of the directory, e.g.
+          '2_RNN'.
+        db:
+          Object of ResultsDB class, defaults to ResultsDB(RESULTS_DB).
+
+    Returns:
+        runs:
+          Object of list type containing the names of all indexed runs.
+    """
+    _db = db if db is not None else ResultsDB()
+    if trial is None:
+        trial = os.path.basename(os.path.normpath(directory))
+    _runs = {}
+
+    def _add(identifier):
+        if identifier not in _runs:
+            _model, _config = parse_identifier(identifier)
+            _runs[identifier] = run_name(trial, identifier)
+            _db.add_run(_runs[identifier], trial=trial, model=_model,
+                        config=_config)
+        return _runs[identifier]
+
+    for _file in sorted(glob.glob(os.path.join(directory, '*.csv'))):
+        _stem = os.path.splitext(os.path.basename(_file))[0]
+        _prefix, _, _identifier = _stem.partition('_')
+        if _prefix not in SERIES_PREFIXES or _identifier == '':
+            continue
+        _db.add_series(_add(_identifier), _prefix, np.loadtxt(_file, ndmin=1))
+
+    for _file in sorted(glob.glob(os.path.join(directory, 'Metrics_*.jsonl'))):
+        _identifier = os.path.basename(_file)[len('Metrics_'):-len('.jsonl')]
+        _db.import_metrics(_add(_identifier), _file)
+
+    for _pattern in ARTIFACT_PATTERNS:
+        for _file in sorted(glob.glob(os.path.join(directory, _pattern))):
+            _stem = os.path.splitext(os.path.basename(_file))[0]
+            for _identifier, _name in _runs.items():
+                if _stem.endswith(_identifier):
+                    _db.add_artifact(_name, _file)
+
+    if db is None:
+        _db.close()
+    print(f'Indexed {len(_runs)} runs from {directory}.')
+    return sorted(_runs.values())
+
+
+if __name__ == "__main__":
+    _directory = os.path.dirname(RESULTS_DB)
+    with ResultsDB() as _db:
+        for _trial in TRIALS:
+            index_results(os.path.join(_directory, _trial), trial=_trial, db=_db)
@@ -0,0 +1,252 @@
+import os
+import sys
+import time
+import torch
+import numpy as np
+import torch.multiprocessing as mp
+from multiprocessing import shared_memory, resource_tracker
+from coupling_server import INNER_CELLS, GHOST_CELLS, hybrid_model, replay_frames
+
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+RING_NAME = 'md_ml_coupling'    # name of the shared memory block
+SLOTS = 2                       # double buffering, i.e. up to two frames in flight
+SPIN = 2000 if (os.cpu_count() or 1) > 1 else 0  # busy polls before a waiting side sleeps
+MAX_PAUSE = 2e-4                # longest sleep in seconds between two polls
+# Indices of the int64 control block preceding the frames
+FRAME_SEQ, PREDICTION_SEQ, CLOSED, CELLS, READY = 0, 1, 2, 3, 4
+CONTROL_SIZE = 8
+_CREATED = set()                # rings created by this process
+
+
+class FrameRing():
+    """This class maps a ring of coupling cycle frames in shared memory, so
+    that the MD solver and the predictor exchange frames without copies or
+    serialization. The block consists of an int64 control block followed by
+    SLOTS input frames of shape (3, cells, cells, cells) and SLOTS predictions
+    of shape (3, 24, 24, 24), all of them float32. Cycle t uses slot t % SLOTS.
+
+    The sides synchronize by two sequence counters, each written by a single
+    side only after its payload is complete:
+      MD solver - waits until PREDICTION_SEQ >= t+1-SLOTS, i.e. the slot is
+                  free, writes frame t and sets FRAME_SEQ = t+1.
+      predictor - waits until FRAME_SEQ >= t+1, writes prediction t in place
+                  and sets PREDICTION_SEQ = t+1.
+    Hence, there is no lock. A prediction remains valid until the MD solver
+    publishes the frame that reuses its slot.
+
+    Args:
+        name:
+          Object of string type containing the name of the shared memory.
+        create:
+          Object of boolean type, True for the side that allocates the ring.
+        cells:
+          Object of integer type specifying the cells per side of the input
+          frames, i.e. 26 including ghost cells or 24. Only used by create.
+    """
+
+    def __init__(self, name=RING_NAME, create=False, cells=INNER_CELLS + 2*GHOST_CELLS):
+        self.create = create
+        if create:
+            _size = 8*CONTROL_SIZE + 4*3*SLOTS*(cells**3 + INNER_CELLS**3)
+            self._shm = shared_memory.SharedMemory(name, create=True, size=_size)
+            _CREATED.add(self._shm._name)
+        else:
+            self._shm = shared_memory.SharedMemory(name)
+            # Only the creating side may unlink the block, refer to bpo-39959.
+            # Processes spawned by the creator share its resource tracker.
+            if self._shm._name not in _CREATED and mp.parent_process() is None:
+                resource_tracker.unregister(self._shm._name, 'shared_memory')
+        self.control = np.ndarray(
+            (CONTROL_SIZE,), dtype=np.int64, buffer=self._shm.buf)
+        if create:
+            self.control[:] = 0
+            self.control[CELLS] = cells
+        self.cells = int(self.control[CELLS])
+        _offset = 8*CONTROL_SIZE
+        _shape = (SLOTS, 3, self.cells, self.cells, self.cells)
+        self.frames = np.ndarray(_shape, dtype=np.float32,
+                                 buffer=self._shm.buf, offset=_offset)
+        _offset += self.frames.nbytes
+        self.predictions = np.ndarray(
+            (SLOTS, 3, INNER_CELLS, INNER_CELLS, INNER_CELLS),
+            dtype=np.float32, buffer=self._shm.buf, offset=_offset)
+
+    def wait(self, index, value, timeout=None):
+        """The wait function blocks until control[index] >= value. It busy
+        polls SPIN times and then sleeps between polls, doubling the pause up
+        to MAX_PAUSE, so that a waiting side does not take the processor from
+        the other side for long waits, e.g. a whole forward pass.
+
+        Returns:
+            ready:
+              Object of boolean type, False if the ring was closed or the
+              timeout expired.
+        """
+        _control = self.control
+        for _ in range(SPIN):
+            if _control[index] >= value:
+                return True
+        _start = time.perf_counter()
+        _pause = 1e-6
+        while _control[index] < value:
+            if _control[CLOSED] or (timeout is not None
+                                    and time.perf_counter() - _start > timeout):
+                return False
+            time.sleep(_pause)
+            _pause = min(2*_pause, MAX_PAUSE)
+        return True
+
+    def frame_slot(self, cycle, timeout=None):
+        """The frame_slot function returns the input frame of cycle as a
+        writable numpy view, once its slot is free. The MD solver writes the
+        cell velocities directly into it and calls publish_frame."""
+        if not self.wait(PREDICTION_SEQ, cycle + 1 - SLOTS, timeout):
+            raise TimeoutError(f'Slot of cycle {cycle} did not become free.')
+        return self.frames[cycle % SLOTS]
+
+    def publish_frame(self, cycle):
+        self.control[FRAME_SEQ] = cycle + 1
+
+    def publish_prediction(self, cycle):
+        self.control[PREDICTION_SEQ] = cycle + 1
+
+    def prediction(self, cycle, timeout=None):
+        """The prediction function waits for the prediction of cycle and
+        returns it as a numpy view into the ring."""
+        if not self.wait(PREDICTION_SEQ, cycle + 1, timeout):
+            raise TimeoutError(f'No prediction for cycle {cycle}.')
+        return self.predictions[cycle % SLOTS]
+
+    def tensors(self, cycle):
+        """The tensors function wraps the input frame and the prediction of
+        cycle as PyTorch Tensors sharing the ring's memory. The input frame is
+        of shape (1, 3, 24, 24, 24), i.e. ghost cells are cropped by a view.
+        """
+        _frame = torch.from_numpy(self.frames[cycle % SLOTS])[None]
+        if self.cells != INNER_CELLS:
+            _g = GHOST_CELLS
+            _frame = _frame[:, :, _g:-_g, _g:-_g, _g:-_g]
+        return _frame, torch.from_numpy(self.predictions[cycle % SLOTS])
+
+    def close(self):
+        """The close function sets the CLOSED flag, such that waiting sides
+        return, and unmaps the ring. The creating side also unlinks it."""
+        self.control[CLOSED] = 1
+        del self.control, self.frames, self.predictions
+        self._shm.close()
+        if self.create:
+            self._shm.unlink()
+            _CREATED.discard(self._shm._name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def serve_ring(model, ring):
+    """The serve_ring function is the predictor's loop. It marks the ring
+    READY, runs the hybrid model on every published frame and writes the
+    prediction into the ring in place, until the ring is closed.
+
+    Args:
+        model:
+          Object of Hybrid_MD_RNN_UNET class.
+        ring:
+          Object of FrameRing class.
+
+    Returns:
+        cycles:
+          Object of integer type containing the number of predicted cycles.
+    """
+    _cycle = 0
+    ring.control[READY] = 1
+    with torch.inference_mode():
+        while ring.wait(FRAME_SEQ, _cycle + 1):
+            _frame, _prediction = ring.tensors(_cycle)
+            _prediction.copy_(model(_frame.to(device))[0])
+            ring.publish_prediction(_cycle)
+            _cycle += 1
+    return _cycle
+
+
+def _predictor(name, unet_file=None, rnn_file=None):
+    # Process target of the predictor side, refer to replay_shm.
+    _ring = FrameRing(name)
+    try:
+        serve_ring(hybrid_model(unet_file, rnn_file), _ring)
+    finally:
+        _ring.close()
+
+
+def replay_shm(dataset, name=RING_NAME, cycles=None, unet_file=None, rnn_file=None):
+    """The replay_shm function is the Python stand-in for the MD side. It
+    creates the ring, spawns the predictor process and streams a MaMiCo
+    dataset through the ring, while measuring the round trip latency of every
+    coupling cycle. The results are comparable to coupling_server.replay.
+
+    Args:
+        dataset:
+          Object of string type or numpy array type, refer to
+          coupling_server.replay_frames.
+        name:
+          Object of string type containing the name of the shared memory.
+        cycles:
+          Object of integer type limiting the number of cycles.
+        unet_file:
+          Object of string type, refer to coupling_server.hybrid_model.
+        rnn_file:
+          Object of string type, refer to coupling_server.hybrid_model.
+
+    Returns:
+        results:
+          Object of dict type containing the numpy arrays 'latency_ms' and
+          'MAE' holding one value per coupling cycle.
+    """
+    _g = GHOST_CELLS
+    _latencies = []
+    _errors = []
+    _prediction = None
+    with FrameRing(name, create=True) as _ring:
+        _process = mp.get_context('spawn').Process(
+            target=_predictor, args=(name, unet_file, rnn_file))
+        _process.start()
+        if not _ring.wait(READY, 1, timeout=120):
+            raise TimeoutError('Predictor did not start.')
+        for _t, _frame in enumerate(replay_frames(dataset, cycles)):
+            if _prediction is not None:
+                _errors.append(np.abs(
+                    _prediction - _frame[:, _g:-_g, _g:-_g, _g:-_g]).mean())
+            _slot = _ring.frame_slot(_t)
+            _start = time.perf_counter()
+            _slot[:] = _frame
+            _ring.publish_frame(_t)
+            _prediction = _ring.prediction(_t)
+            _latencies.append(time.perf_counter() - _start)
+        # Views into the ring must not outlive its mapping
+        _slot = _prediction = None
+    _process.join()
+
+    _latencies = 1000*np.array(_latencies)
+    print(f'Replayed {len(_latencies)} coupling cycles via shared memory: '
+          f'round trip latency p50 {np.percentile(_latencies, 50):.2f} ms, '
+          f'p99 {np.percentile(_latencies, 99):.2f} ms, '
+          f'max {_latencies.max():.2f} ms.')
+    return {'latency_ms': _latencies, 'MAE': np.array(_errors)}
+
+
+if __name__ == "__main__":
+    # python shm_transport.py serve [name] [unet_file rnn_file]
+    # python shm_transport.py replay <csv_file> [name] [cycles]
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        _name = sys.argv[2] if len(sys.argv) > 2 else RING_NAME
+        _files = sys.argv[3:5] if len(sys.argv) > 4 else [None, None]
+        _predictor(_name, *_files)
+    elif len(sys.argv) > 2 and sys.argv[1] == 'replay':
+        _name = sys.argv[3] if len(sys.argv) > 3 else RING_NAME
+        _cycles = int(sys.argv[4]) if len(sys.argv) > 4 else None
+        replay_shm(sys.argv[2], _name, _cycles)
+    else:
+        print('Usage: python shm_transport.py serve [name] [unet_file rnn_file]')
+        print('       python shm_transport.py replay <csv_file> [name] [cycles]')
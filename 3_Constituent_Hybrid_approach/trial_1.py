@@ -1,13 +1,19 @@
 import torch
 import random
 import torch.multiprocessing as mp
-import matplotlib.pyplot as plt
 import torch.optim as optim
 import torch.nn as nn
 import numpy as np
-from model import UNET_AE
-from utils_new import get_UNET_AE_loaders, losses2file, dataset2csv
-from plotting import compareLossVsValid
+import time
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Subset, RandomSampler
+from model import AE, UNET_AE
+from utils_new import get_UNET_AE_loaders, dataset2csv
+from compilation import compile_model
+from instrumentation import PhaseTimer
+from metrics import MetricsWriter
+from results_db import record_run
+from evaluation import evaluate_timelines, log_timelines
 
 torch.manual_seed(10)
 random.seed(10)
@@ -17,16 +23,17 @@ try:
 except RuntimeError:
     pass
 
-plt.style.use(['science'])
 np.set_printoptions(precision=6)
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 NUM_WORKERS = 1
 PIN_MEMORY = True
 LOAD_MODEL = False
+PROFILE_LOADERS = False     # opt-in input stall analysis, refer to instrumentation.py
+COMPILE_MODEL = False       # opt-in torch.compile, refer to compilation.py
 
 
-def train_AE(loader, model, optimizer, criterion, scaler, model_identifier, current_epoch):
+def train_AE(loader, model, optimizer, criterion, scaler, model_identifier, current_epoch, resolution=24, profiler=None):
     """The train_AE function trains the model and computes the average loss on
     the training set.
 
@@ -47,6 +54,12 @@ def train_AE(loader, model, optimizer, criterion, scaler, model_identifier, curr
           used to identify which model is being trained.
         current_epoch:
           A string containing the current epoch for terminal output.
+        resolution:
+          Object of integer type. If smaller than 24, the inputs and targets
+          are spatially downsampled to resolution^3 via average pooling.
+        profiler:
+          Object of PhaseTimer class to split each step into fetch, h2d,
+          forward, backward and optimizer time, or None.
 
     Returns:
         avg_loss:
@@ -56,19 +69,36 @@ def train_AE(loader, model, optimizer, criterion, scaler, model_identifier, curr
     _epoch_loss = 0
     _counter = 0
 
+    if profiler is not None:
+        profiler.begin(loader)
+
     for _batch_idx, (_data, _targets) in enumerate(loader):
+        if profiler is not None:
+            profiler.mark('fetch')
         _data = _data.float().to(device=device)
         _targets = _targets.float().to(device=device)
+        if profiler is not None:
+            profiler.mark('h2d')
+
+        if resolution < _data.shape[-1]:
+            _data = F.adaptive_avg_pool3d(_data, resolution)
+            _targets = F.adaptive_avg_pool3d(_targets, resolution)
 
         with torch.cuda.amp.autocast():
             _predictions = model(_data)
             _loss = criterion(_predictions.float(), _targets.float())
             _epoch_loss += _loss.item()
             _counter += 1
+        if profiler is not None:
+            profiler.mark('forward')
 
         _loss.backward(retain_graph=True)
+        if profiler is not None:
+            profiler.mark('backward')
         optimizer.step()
         optimizer.zero_grad()
+        if profiler is not None:
+            profiler.mark('optimizer')
 
     _avg_loss = _epoch_loss/_counter
     return _avg_loss
@@ -275,11 +305,20 @@ def trial_1_UNET_AE(alpha, alpha_string, train_loaders, valid_loaders):
         activation=nn.ReLU(inplace=True)
     ).to(device)
 
+    _train_model = _model
+    if COMPILE_MODEL:
+        _train_model = compile_model(
+            model=_model,
+            example_input=torch.zeros(32, 3, 24, 24, 24).to(device),
+            train=True
+        )
+
     print('Initializing training parameters.')
     _scaler = torch.cuda.amp.GradScaler()
     _optimizer = optim.Adam(_model.parameters(), lr=alpha)
-    _epoch_losses = []
-    _epoch_valids = []
+    _profiler = PhaseTimer(device) if PROFILE_LOADERS else None
+    _metrics = MetricsWriter(
+        f'{_file_prefix}Metrics_UNET_AE_{_model_identifier}')
 
     print('Beginning training.')
     for epoch in range(50):
@@ -287,21 +326,26 @@ def trial_1_UNET_AE(alpha, alpha_string, train_loaders, valid_loaders):
         for _train_loader in train_loaders:
             _avg_loss += train_AE(
                 loader=_train_loader,
-                model=_model,
+                model=_train_model,
                 optimizer=_optimizer,
                 criterion=_criterion,
                 scaler=_scaler,
                 model_identifier=_model_identifier,
-                current_epoch=epoch+1
+                current_epoch=epoch+1,
+                profiler=_profiler
             )
         _avg_loss = _avg_loss/len(train_loaders)
+        if _profiler is not None:
+            _profiler.end_epoch(epoch+1)
         print('------------------------------------------------------------')
         print(f'{_model_identifier} Training Epoch: {epoch+1} -> Averaged'
               f'Loader Loss: {_avg_loss:.3f}')
-        _epoch_losses.append(_avg_loss)
+        _metrics.scalar('Losses_UNET_AE', _avg_loss, step=epoch)
 
         _avg_valid = 0
         for _valid_loader in valid_loaders:
+            # Validated eagerly, since validation runs without autograd and
+            # would only add further specializations of the compiled model.
             _avg_valid += valid_AE(
                 loader=_valid_loader,
                 model=_model,
@@ -312,21 +356,16 @@ def trial_1_UNET_AE(alpha, alpha_string, train_loaders, valid_loaders):
         print('------------------------------------------------------------')
         print(f'{_model_identifier} Validation -> Averaged Loader Loss:'
               f'{_avg_valid:.3f}')
-        _epoch_valids.append(_avg_valid)
+        _metrics.scalar('Valids_UNET_AE', _avg_valid, step=epoch)
 
-    losses2file(
-        losses=_epoch_losses,
-        file_name=f'{_file_prefix}Losses_UNET_AE_{_model_identifier}'
-    )
-    losses2file(
-        losses=_epoch_valids,
-        file_name=f'{_file_prefix}Valids_UNET_AE_{_model_identifier}'
-    )
+    _metrics.close()
 
+    # plotting is imported lazily, so that spawned workers skip matplotlib
+    from plotting import compareLossVsValid
     compareLossVsValid(
         loss_files=[
-            f'{_file_prefix}Losses_UNET_AE_{_model_identifier}.csv',
-            f'{_file_prefix}Valids_UNET_AE_{_model_identifier}.csv'
+            _metrics.reference('Losses_UNET_AE'),
+            _metrics.reference('Valids_UNET_AE')
         ],
         loss_labels=['Training', 'Validation'],
         file_prefix=_file_prefix,
@@ -336,6 +375,13 @@ def trial_1_UNET_AE(alpha, alpha_string, train_loaders, valid_loaders):
         _model.state_dict(),
         f'{_file_prefix}Model_UNET_AE_{_model_identifier}'
     )
+    record_run(
+        trial='1_UNET_AE',
+        identifier=f'UNET_AE_{_model_identifier}',
+        metrics_file=_metrics.file_name,
+        config={'lr': alpha, 'epochs': 50, 'compiled': COMPILE_MODEL},
+        artifacts=[f'{_file_prefix}Model_UNET_AE_{_model_identifier}']
+    )
     return
 
 
@@ -379,10 +425,222 @@ def trial_1_UNET_AE_mp():
     return
 
 
+def stride_loaders(loaders, temporal_stride):
+    """The stride_loaders function creates copies of the given loaders that
+    only contain every temporal_stride-th coupling cycle of each dataset.
+    Batch size, shuffling and number of workers are retained.
+
+    Args:
+        loaders:
+          Object of list type containing objects of PyTorch-type DataLoader.
+        temporal_stride:
+          Object of integer type specifying the stride between coupling cycles.
+
+    Returns:
+        strided_loaders:
+          Object of list type containing objects of PyTorch-type DataLoader.
+    """
+    if temporal_stride == 1:
+        return loaders
+
+    _strided_loaders = []
+    for _loader in loaders:
+        _dataset = Subset(_loader.dataset, range(
+            0, len(_loader.dataset), temporal_stride))
+        _strided_loaders.append(DataLoader(
+            dataset=_dataset,
+            batch_size=_loader.batch_size,
+            shuffle=isinstance(_loader.sampler, RandomSampler),
+            num_workers=_loader.num_workers
+        ))
+    return _strided_loaders
+
+
+def trial_1_curriculum(alpha, alpha_string, train_loaders, valid_loaders, model_name='UNET_AE', coarse_epochs=10, fine_epochs=40, coarse_resolution=16, temporal_stride=4, target_loss=0.0):
+    """The trial_1_curriculum function trains the UNET_AE or AE model via a
+    multi-fidelity curriculum. During the first coarse_epochs, the model is
+    trained on spatially downsampled volumes (coarse_resolution^3) of every
+    temporal_stride-th coupling cycle. Afterwards, it is fine-tuned on the full
+    resolution data for fine_epochs. Validation is always performed on full
+    resolution. Setting coarse_epochs=0 yields the single-fidelity run.
+
+    Note that 12^3 volumes are not supported by these models, since the three
+    pooling stages reduce them to 1^3 ahead of the 2^3 helper convolution. The
+    coarsest supported resolution is therefore 16^3.
+
+    Args:
+        alpha:
+          A double value indicating the chosen learning rate.
+        alpha_string:
+          Object of type string used as a model identifier.
+        train_loaders:
+          Object of PyTorch-type DataLoader to automatically pass training
+          dataset to model.
+        valid_loaders:
+          Object of PyTorch-type DataLoader to automatically pass validation
+          dataset to model.
+        model_name:
+          Object of string type to choose the model: ['UNET_AE', 'AE']
+        coarse_epochs:
+          Object of integer type specifying the number of coarse epochs.
+        fine_epochs:
+          Object of integer type specifying the number of fine-tuning epochs.
+        coarse_resolution:
+          Object of integer type specifying the coarse spatial resolution.
+          Must be a multiple of 8 and at least 16.
+        temporal_stride:
+          Object of integer type specifying the coarse temporal stride.
+        target_loss:
+          A double value indicating the validation L1 loss at which the
+          wall-clock time to target is recorded.
+
+    Returns:
+        time_to_target:
+          A double value indicating the wall-clock time in seconds until the
+          validation loss first reached target_loss, or None if it did not.
+    """
+    if coarse_resolution % 8 != 0 or coarse_resolution < 16:
+        print('Invalid value for function parameter: coarse_resolution.')
+        return
+
+    _criterion = nn.L1Loss()
+    _file_prefix = '/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/' + \
+        '3_Constituent_Hybrid_approach/Results/1_UNET_AE/'
+    _model_identifier = f'LR{alpha_string}_C{coarse_epochs}_R' + \
+        f'{coarse_resolution}_S{temporal_stride}'
+    _model_class = UNET_AE if model_name == 'UNET_AE' else AE
+    print(f'Initializing {model_name} model.')
+    _model = _model_class(
+        device=device,
+        in_channels=3,
+        out_channels=3,
+        features=[4, 8, 16],
+        activation=nn.ReLU(inplace=True)
+    ).to(device)
+
+    _scaler = torch.cuda.amp.GradScaler()
+    _optimizer = optim.Adam(_model.parameters(), lr=alpha)
+    _metrics = MetricsWriter(
+        f'{_file_prefix}Metrics_{model_name}_{_model_identifier}')
+    _time_to_target = None
+
+    _phases = [
+        (coarse_resolution, stride_loaders(train_loaders, temporal_stride),
+         coarse_epochs),
+        (24, train_loaders, fine_epochs)
+    ]
+
+    print('Beginning training.')
+    _start_time = time.time()
+    _epoch = 0
+    for _resolution, _loaders, _num_epochs in _phases:
+        for _ in range(_num_epochs):
+            _avg_loss = 0
+            for _train_loader in _loaders:
+                _avg_loss += train_AE(
+                    loader=_train_loader,
+                    model=_model,
+                    optimizer=_optimizer,
+                    criterion=_criterion,
+                    scaler=_scaler,
+                    model_identifier=_model_identifier,
+                    current_epoch=_epoch+1,
+                    resolution=_resolution
+                )
+            _avg_loss = _avg_loss/len(_loaders)
+
+            _avg_valid = 0
+            for _valid_loader in valid_loaders:
+                _avg_valid += valid_AE(
+                    loader=_valid_loader,
+                    model=_model,
+                    criterion=_criterion,
+                    model_identifier=_model_identifier
+                )
+            _avg_valid = _avg_valid/len(valid_loaders)
+            _elapsed = time.time() - _start_time
+            _metrics.scalar('Losses', _avg_loss, step=_epoch)
+            _metrics.scalar('Valids', _avg_valid, step=_epoch)
+            _metrics.scalar('Times', _elapsed, step=_epoch)
+            _metrics.scalar('Resolution', _resolution, step=_epoch)
+            _epoch += 1
+
+            if _time_to_target is None and _avg_valid <= target_loss:
+                _time_to_target = _elapsed
+
+            print('------------------------------------------------------------')
+            print(f'{_model_identifier} Epoch: {_epoch} ({_resolution}^3) -> '
+                  f'Training Loss: {_avg_loss:.3f}, Validation Loss: '
+                  f'{_avg_valid:.3f}, Time: {_elapsed:.1f}s')
+
+    _metrics.close()
+    torch.save(
+        _model.state_dict(),
+        f'{_file_prefix}Model_{model_name}_{_model_identifier}'
+    )
+    record_run(
+        trial='1_UNET_AE',
+        identifier=f'{model_name}_{_model_identifier}',
+        metrics_file=_metrics.file_name,
+        config={'lr': alpha, 'coarse_epochs': coarse_epochs,
+                'fine_epochs': fine_epochs,
+                'coarse_resolution': coarse_resolution,
+                'temporal_stride': temporal_stride},
+        artifacts=[f'{_file_prefix}Model_{model_name}_{_model_identifier}']
+    )
+    print(f'{_model_identifier} Time to target loss {target_loss}: '
+          f'{_time_to_target}')
+    return _time_to_target
+
+
+def trial_1_curriculum_comparison(target_loss=0.05, model_name='UNET_AE'):
+    """The trial_1_curriculum_comparison function compares the wall-clock time
+    to reach target_loss on the validation set for the single-fidelity run and
+    the multi-fidelity curriculum. Both runs use the same learning rate and
+    total number of epochs. Refer to the trial_1_curriculum function for more
+    details.
+
+    Args:
+        target_loss:
+          A double value indicating the target validation L1 loss.
+        model_name:
+          Object of string type to choose the model: ['UNET_AE', 'AE']
+
+    Returns:
+        NONE
+    """
+    print('Starting Trial 1: Curriculum Comparison')
+    _train_loaders, _valid_loaders = get_UNET_AE_loaders(
+        data_distribution='get_couette',
+        batch_size=32,
+        shuffle=True
+    )
+
+    _results = []
+    for _coarse_epochs in [0, 10]:
+        torch.manual_seed(10)
+        _results.append(trial_1_curriculum(
+            alpha=0.0005,
+            alpha_string='0_0005',
+            train_loaders=_train_loaders,
+            valid_loaders=_valid_loaders,
+            model_name=model_name,
+            coarse_epochs=_coarse_epochs,
+            fine_epochs=50-_coarse_epochs,
+            target_loss=target_loss
+        ))
+
+    print('------------------------------------------------------------')
+    print(f'Time to validation L1 <= {target_loss}:')
+    print(f'Single-fidelity: {_results[0]}')
+    print(f'Multi-fidelity:  {_results[1]}')
+    return
+
+
 def trial_1_error_timeline():
     """The trial_1_error_timeline function is essentially a helper function to
-    facilitate the error_timeline function with the desired model and datasets.
-    Refer to the error_timeline function for more details.
+    compute the error timelines of the desired model and datasets. Refer to the
+    evaluate_timelines function in evaluation.py for more details.
 
     Args:
         NONE
@@ -403,7 +661,6 @@ def trial_1_error_timeline():
         activation=nn.ReLU(inplace=True)
     ).to(device)
     _model.load_state_dict(torch.load(f'{_directory}{_model_name}'))
-    _criterion = nn.L1Loss()
     _, _valid_loaders = get_UNET_AE_loaders(
         data_distribution='get_couette',
         batch_size=1,
@@ -419,16 +676,14 @@ def trial_1_error_timeline():
         'C_5_0_B'
     ]
 
-    for idx, _loader in enumerate(_valid_loaders):
-        _losses = error_timeline(
-            loader=_loader,
-            model=_model,
-            criterion=_criterion
-        )
-        losses2file(
-            losses=_losses,
-            file_name=f'{_directory}{_model_name}_Valid_Error_Timeline_{_datasets[idx]}'
-        )
+    with MetricsWriter(f'{_directory}Metrics_{_model_name}') as _metrics:
+        for idx, _loader in enumerate(_valid_loaders):
+            _timelines = evaluate_timelines(
+                loader=_loader,
+                models=[_model]
+            )
+            log_timelines(
+                _metrics, _timelines[0], f'Valid_Error_Timeline_{_datasets[idx]}')
 
     pass
 
@@ -1,13 +1,15 @@
 import torch
 import random
 import torch.multiprocessing as mp
-import matplotlib.pyplot as plt
 import torch.optim as optim
 import torch.nn as nn
 import numpy as np
-from model import RNN
-from utils import get_RNN_loaders, losses2file
-from plotting import compareAvgLoss
+from model import RNN, UNET_AE
+from utils import get_RNN_loaders
+from latentspace import get_RNN_loaders_from_encoder
+from instrumentation import PhaseTimer
+from metrics import MetricsWriter
+from results_db import record_run
 
 torch.manual_seed(10)
 random.seed(10)
@@ -17,16 +19,22 @@ try:
 except RuntimeError:
     pass
 
-plt.style.use(['science'])
 np.set_printoptions(precision=6)
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 NUM_WORKERS = 1
 PIN_MEMORY = True
 LOAD_MODEL = False
+PROFILE_LOADERS = False     # opt-in input stall analysis, refer to instrumentation.py
+# If True, the latentspaces are derived from ENCODER_CHECKPOINT on the fly
+# instead of being read from the offline latentspace csv files.
+LATENT_FROM_ENCODER = False
+ENCODER_CHECKPOINT = ('/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/'
+                      '3_Constituent_Hybrid_approach/Results/1_UNET_AE/'
+                      'Model_UNET_AE_LR0_0005')
 
 
-def train_RNN(loader, model, optimizer, criterion, scaler, model_identifier, current_epoch):
+def train_RNN(loader, model, optimizer, criterion, scaler, model_identifier, current_epoch, profiler=None):
     """The train_AE function trains the model and computes the average loss on
     the training set.
 
@@ -48,6 +56,9 @@ def train_RNN(loader, model, optimizer, criterion, scaler, model_identifier, cur
           length (_seq_length) is used.
         current_epoch:
           A string containing the current epoch for terminal output.
+        profiler:
+          Object of PhaseTimer class to split each step into fetch, h2d,
+          forward, backward and optimizer time, or None.
 
     Returns:
         avg_loss:
@@ -57,19 +68,32 @@ def train_RNN(loader, model, optimizer, criterion, scaler, model_identifier, cur
     _epoch_loss = 0
     _counter = 0
 
+    if profiler is not None:
+        profiler.begin(loader)
+
     for _batch_idx, (_data, _targets) in enumerate(loader):
+        if profiler is not None:
+            profiler.mark('fetch')
         _data = _data.float().to(device=device)
         _targets = _targets.float().to(device=device)
+        if profiler is not None:
+            profiler.mark('h2d')
 
         with torch.cuda.amp.autocast():
             _predictions = model(_data)
             _loss = criterion(_predictions.float(), _targets.float())
             _epoch_loss += _loss.item()
             _counter += 1
+        if profiler is not None:
+            profiler.mark('forward')
 
         _loss.backward(retain_graph=True)
+        if profiler is not None:
+            profiler.mark('backward')
         optimizer.step()
         optimizer.zero_grad()
+        if profiler is not None:
+            profiler.mark('optimizer')
 
     _avg_loss = _epoch_loss/_counter
     return _avg_loss
@@ -158,8 +182,9 @@ def trial_2_RNN(seq_length, num_layers, alpha, alpha_string, train_loaders, vali
     print('Initializing training parameters.')
     _scaler = torch.cuda.amp.GradScaler()
     _optimizer = optim.Adam(_model.parameters(), lr=alpha)
-    _epoch_losses = []
-    _epoch_valids = []
+    _profiler = PhaseTimer(device) if PROFILE_LOADERS else None
+    _metrics = MetricsWriter(
+        f'{_file_prefix}Metrics_RNN_{_model_identifier}')
 
     print('Beginning training.')
     for epoch in range(50):
@@ -172,15 +197,18 @@ def trial_2_RNN(seq_length, num_layers, alpha, alpha_string, train_loaders, vali
                 criterion=_criterion,
                 scaler=_scaler,
                 model_identifier=_model_identifier,
-                current_epoch=epoch+1
+                current_epoch=epoch+1,
+                profiler=_profiler
             )
         _avg_loss = _avg_loss/len(train_loaders)
+        if _profiler is not None:
+            _profiler.end_epoch(epoch+1)
         print('------------------------------------------------------------')
         print(
             f'{_model_identifier} Training Epoch: {epoch+1}-> Averaged '
             f'Loader Loss: {_avg_loss:.3f}')
 
-        _epoch_losses.append(_avg_loss)
+        _metrics.scalar('Losses_RNN', _avg_loss, step=epoch)
 
         _avg_valid = 0
         for _valid_loader in valid_loaders:
@@ -194,21 +222,16 @@ def trial_2_RNN(seq_length, num_layers, alpha, alpha_string, train_loaders, vali
         print('------------------------------------------------------------')
         print(
             f'{_model_identifier} Validation -> Averaged Loader Loss: {_avg_valid:.3f}')
-        _epoch_valids.append(_avg_valid)
+        _metrics.scalar('Valids_RNN', _avg_valid, step=epoch)
 
-    losses2file(
-        losses=_epoch_losses,
-        file_name=f'{_file_prefix}Losses_RNN_{_model_identifier}'
-    )
-    losses2file(
-        losses=_epoch_valids,
-        file_name=f'{_file_prefix}Valids_RNN_{_model_identifier}'
-    )
+    _metrics.close()
 
+    # plotting is imported lazily, so that spawned workers skip matplotlib
+    from plotting import compareAvgLoss
     compareAvgLoss(
         loss_files=[
-            f'{_file_prefix}Losses_RNN_{_model_identifier}.csv',
-            f'{_file_prefix}Valids_RNN_{_model_identifier}.csv'
+            _metrics.reference('Losses_RNN'),
+            _metrics.reference('Valids_RNN')
         ],
         loss_labels=['Training', 'Validation'],
         file_prefix=_file_prefix,
@@ -218,6 +241,14 @@ def trial_2_RNN(seq_length, num_layers, alpha, alpha_string, train_loaders, vali
         _model.state_dict(),
         f'{_file_prefix}Model_RNN_{_model_identifier}'
     )
+    record_run(
+        trial='2_RNN',
+        identifier=f'RNN_{_model_identifier}',
+        metrics_file=_metrics.file_name,
+        config={'lr': alpha, 'layers': num_layers, 'seq_length': seq_length,
+                'epochs': 50, 'latent_from_encoder': LATENT_FROM_ENCODER},
+        artifacts=[f'{_file_prefix}Model_RNN_{_model_identifier}']
+    )
 
 
 def trial_2_RNN_mp():
@@ -244,17 +275,32 @@ def trial_2_RNN_mp():
     _alphas.reverse()
     _alpha_strings.reverse()
 
-    _t_loader_05, _v_loader_05 = get_RNN_loaders(
+    _get_loaders = get_RNN_loaders
+    if LATENT_FROM_ENCODER:
+        _model = UNET_AE(
+            device=device,
+            in_channels=3,
+            out_channels=3,
+            features=[4, 8, 16],
+            activation=torch.nn.ReLU(inplace=True)
+        ).to(device)
+        _model.load_state_dict(torch.load(
+            ENCODER_CHECKPOINT, map_location=device))
+
+        def _get_loaders(**kwargs):
+            return get_RNN_loaders_from_encoder(model=_model, **kwargs)
+
+    _t_loader_05, _v_loader_05 = _get_loaders(
         data_distribution='get_couette',
         batch_size=32,
         seq_length=5
     )
-    _t_loader_15, _v_loader_15 = get_RNN_loaders(
+    _t_loader_15, _v_loader_15 = _get_loaders(
         data_distribution='get_couette',
         batch_size=32,
         seq_length=15
     )
-    _t_loader_25, _v_loader_25 = get_RNN_loaders(
+    _t_loader_25, _v_loader_25 = _get_loaders(
         data_distribution='get_couette',
         batch_size=32,
         seq_length=25
@@ -1,14 +1,15 @@
 import torch
 import random
 import torch.multiprocessing as mp
-import matplotlib.pyplot as plt
 import torch.optim as optim
 import torch.nn as nn
 import numpy as np
-from model import LSTM
+from model import LSTM, UNET_AE
 from trial_2 import train_RNN, valid_RNN
-from utils import get_RNN_loaders, losses2file
-from plotting import compareAvgLoss
+from utils import get_RNN_loaders
+from latentspace import get_RNN_loaders_from_encoder
+from metrics import MetricsWriter
+from results_db import record_run
 
 torch.manual_seed(10)
 random.seed(10)
@@ -18,13 +19,18 @@ try:
 except RuntimeError:
     pass
 
-plt.style.use(['science'])
 np.set_printoptions(precision=6)
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 NUM_WORKERS = 1             # guideline: 4* num_GPU
 PIN_MEMORY = True
 LOAD_MODEL = False
+# If True, the latentspaces are derived from ENCODER_CHECKPOINT on the fly
+# instead of being read from the offline latentspace csv files.
+LATENT_FROM_ENCODER = False
+ENCODER_CHECKPOINT = ('/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/'
+                      '3_Constituent_Hybrid_approach/Results/1_UNET_AE/'
+                      'Model_UNET_AE_LR0_0005')
 
 
 def trial_4_LSTM(seq_length, num_layers, alpha, alpha_string, train_loaders, valid_loaders):
@@ -71,8 +77,8 @@ def trial_4_LSTM(seq_length, num_layers, alpha, alpha_string, train_loaders, val
     print('Initializing training parameters.')
     _scaler = torch.cuda.amp.GradScaler()
     _optimizer = optim.Adam(_model.parameters(), lr=alpha)
-    _epoch_losses = []
-    _epoch_valids = []
+    _metrics = MetricsWriter(
+        f'{_file_prefix}Metrics_LSTM_{_model_identifier}')
 
     print('Beginning training.')
     for epoch in range(50):
@@ -93,7 +99,7 @@ def trial_4_LSTM(seq_length, num_layers, alpha, alpha_string, train_loaders, val
             f'{_model_identifier} Training Epoch: {epoch+1}-> Averaged '
             f'Loader Loss: {_avg_loss:.3f}')
 
-        _epoch_losses.append(_avg_loss)
+        _metrics.scalar('Losses_LSTM', _avg_loss, step=epoch)
 
         _avg_valid = 0
         for _valid_loader in valid_loaders:
@@ -107,21 +113,16 @@ def trial_4_LSTM(seq_length, num_layers, alpha, alpha_string, train_loaders, val
         print('------------------------------------------------------------')
         print(
             f'{_model_identifier} Validation -> Averaged Loader Loss: {_avg_valid:.3f}')
-        _epoch_valids.append(_avg_valid)
+        _metrics.scalar('Valids_LSTM', _avg_valid, step=epoch)
 
-    losses2file(
-        losses=_epoch_losses,
-        file_name=f'{_file_prefix}Losses_LSTM_{_model_identifier}'
-    )
-    losses2file(
-        losses=_epoch_valids,
-        file_name=f'{_file_prefix}Valids_LSTM_{_model_identifier}'
-    )
+    _metrics.close()
 
+    # plotting is imported lazily, so that spawned workers skip matplotlib
+    from plotting import compareAvgLoss
     compareAvgLoss(
         loss_files=[
-            f'{_file_prefix}Losses_LSTM_{_model_identifier}.csv',
-            f'{_file_prefix}Valids_LSTM_{_model_identifier}.csv'
+            _metrics.reference('Losses_LSTM'),
+            _metrics.reference('Valids_LSTM')
         ],
         loss_labels=['Training', 'Validation'],
         file_prefix=_file_prefix,
@@ -131,6 +132,14 @@ def trial_4_LSTM(seq_length, num_layers, alpha, alpha_string, train_loaders, val
         _model.state_dict(),
         f'{_file_prefix}Model_LSTM_{_model_identifier}'
     )
+    record_run(
+        trial='4_LSTM',
+        identifier=f'LSTM_{_model_identifier}',
+        metrics_file=_metrics.file_name,
+        config={'lr': alpha, 'layers': num_layers, 'seq_length': seq_length,
+                'epochs': 50, 'latent_from_encoder': LATENT_FROM_ENCODER},
+        artifacts=[f'{_file_prefix}Model_LSTM_{_model_identifier}']
+    )
 
 
 def trial_4_LSTM_mp():
@@ -157,17 +166,32 @@ def trial_4_LSTM_mp():
     _alphas.reverse()
     _alpha_strings.reverse()
 
-    _t_loader_05, _v_loader_05 = get_RNN_loaders(
+    _get_loaders = get_RNN_loaders
+    if LATENT_FROM_ENCODER:
+        _model = UNET_AE(
+            device=device,
+            in_channels=3,
+            out_channels=3,
+            features=[4, 8, 16],
+            activation=torch.nn.ReLU(inplace=True)
+        ).to(device)
+        _model.load_state_dict(torch.load(
+            ENCODER_CHECKPOINT, map_location=device))
+
+        def _get_loaders(**kwargs):
+            return get_RNN_loaders_from_encoder(model=_model, **kwargs)
+
+    _t_loader_05, _v_loader_05 = _get_loaders(
         data_distribution='get_couette',
         batch_size=32,
         seq_length=5
     )
-    _t_loader_15, _v_loader_15 = get_RNN_loaders(
+    _t_loader_15, _v_loader_15 = _get_loaders(
         data_distribution='get_couette',
         batch_size=32,
         seq_length=15
     )
-    _t_loader_25, _v_loader_25 = get_RNN_loaders(
+    _t_loader_25, _v_loader_25 = _get_loaders(
         data_distribution='get_couette',
         batch_size=32,
         seq_length=25
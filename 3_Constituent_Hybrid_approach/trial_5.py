@@ -1,13 +1,16 @@
 import torch
 import random
 import torch.multiprocessing as mp
-import matplotlib.pyplot as plt
 import torch.nn as nn
 import numpy as np
+from render_queue import RenderQueue
+from reductions import plane_averages, line_statistics
 from model import UNET_AE, RNN, GRU, LSTM, Hybrid_MD_RNN_UNET, resetPipeline
 from utils_new import get_Hybrid_loaders
-from trial_1 import error_timeline
-from plotting import compareFlowProfile3x3, compareErrorTimeline_np, plotPredVsTargCouette
+from evaluation import evaluate_timelines, log_timelines
+from metrics import MetricsWriter
+from compilation import compile_hybrid
+from instrumentation import StageTimer
 
 torch.manual_seed(10)
 random.seed(10)
@@ -17,21 +20,25 @@ try:
 except RuntimeError:
     pass
 
-plt.style.use(['science'])
 np.set_printoptions(precision=6)
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 NUM_WORKERS = 1             # guideline: 4* num_GPU
 PIN_MEMORY = True
 LOAD_MODEL = False
+COMPILE_MODEL = False       # opt-in torch.compile, refer to compilation.py
+INSTRUMENT_MODEL = False    # opt-in stage timing, refer to instrumentation.py
+RENDER_WORKERS = 1          # background plotting processes, 0 renders inline
+PLOT_FLOW_PROFILES = False  # opt-in compareFlowProfile3x3 of every validation dataset
 
 
-def valid_HYBRID_Couette(loader, model, criterion, model_identifier, dataset_identifier):
+def valid_HYBRID_Couette(loader, model, criterion, model_identifier, dataset_identifier, renderer=None):
     """The valid_Hybrid function computes the average loss on a given dataset
     without updating/optimizing the learnable model parameters. Additionally,
-    it passes two stacked numpy arrays containing predictions and targets,
-    respectively, to the compareFlowProfile3x3 function to create and save
-    graphical comparisons.
+    it reduces predictions and targets batch by batch via reductions.py and
+    passes the stacked, reduced numpy arrays to the plotPredVsTargCouette
+    function and, if PLOT_FLOW_PROFILES is set, to the compareFlowProfile3x3
+    function to create and save graphical comparisons.
 
     Args:
         loader:
@@ -43,6 +50,9 @@ def valid_HYBRID_Couette(loader, model, criterion, model_identifier, dataset_ide
         model_identifier:
           A unique string to identify the model. Here, the learning rate is
           used to identify which model is being trained.
+        renderer:
+          Object of RenderQueue class the figures are submitted to, or None to
+          render them inline.
 
     Returns:
         avg_loss:
@@ -59,7 +69,11 @@ def valid_HYBRID_Couette(loader, model, criterion, model_identifier, dataset_ide
     _timeline = []
     _preds = []
     _targs = []
+    _pred_profiles = []
+    _targ_profiles = []
     _counter = 0
+    _render = renderer.submit if renderer is not None else \
+        lambda function, **kwargs: function(**kwargs)
 
     for batch_idx, (_data, _targets) in enumerate(loader):
         _data = _data.float().to(device=device)
@@ -70,18 +84,25 @@ def valid_HYBRID_Couette(loader, model, criterion, model_identifier, dataset_ide
             _loss = criterion(_predictions.float(), _targets.float())
             _epoch_loss += _loss.item()
             _timeline.append(_loss.item())
-            _preds.append(_predictions.cpu().detach().numpy())
-            _targs.append(_targets.cpu().detach().numpy())
+            _preds.append(line_statistics(_predictions, component=0))
+            _targs.append(line_statistics(_targets, component=0))
+            if PLOT_FLOW_PROFILES:
+                _pred_profiles.append(plane_averages(_predictions))
+                _targ_profiles.append(plane_averages(_targets))
             _counter += 1
-    '''
-    compareFlowProfile3x3(
-        preds=np.vstack(_preds),
-        targs=np.vstack(_targs),
-        model_id=model_identifier,
-        dataset_id=dataset_identifier
-    )
-    '''
-    plotPredVsTargCouette(
+
+    # plotting is imported lazily, so that spawned workers skip matplotlib
+    from plotting import compareFlowProfile3x3, plotPredVsTargCouette
+    if PLOT_FLOW_PROFILES:
+        _render(
+            compareFlowProfile3x3,
+            preds=np.vstack(_pred_profiles)[[50, 500, -1]],
+            targs=np.vstack(_targ_profiles)[[50, 500, -1]],
+            model_id=model_identifier,
+            dataset_id=dataset_identifier
+        )
+    _render(
+        plotPredVsTargCouette,
         input_1=np.vstack(_preds),
         input_2=np.vstack(_targs),
         file_prefix=_file_prefix,
@@ -142,7 +163,13 @@ def trial_5_Hybrid(model_rnn, model_identifier, train_loaders, valid_loaders):
         seq_length=25
     ).to(device)
 
+    if COMPILE_MODEL:
+        compile_hybrid(_model_hybrid)
+    if INSTRUMENT_MODEL:
+        _model_hybrid.timer = StageTimer()
+
     _counter = 0
+    _renderer = RenderQueue(max_workers=RENDER_WORKERS)
 
     _train_loss = 0
     for _loader in train_loaders:
@@ -151,7 +178,8 @@ def trial_5_Hybrid(model_rnn, model_identifier, train_loaders, valid_loaders):
             model=_model_hybrid,
             criterion=_criterion,
             model_identifier=model_identifier,
-            dataset_identifier=_counter
+            dataset_identifier=_counter,
+            renderer=_renderer
         )
         _train_loss += _loss
         resetPipeline(_model_hybrid)
@@ -168,7 +196,8 @@ def trial_5_Hybrid(model_rnn, model_identifier, train_loaders, valid_loaders):
             model=_model_hybrid,
             criterion=_criterion,
             model_identifier=model_identifier,
-            dataset_identifier=_counter
+            dataset_identifier=_counter,
+            renderer=_renderer
         )
         _valid_loss += _loss
         resetPipeline(_model_hybrid)
@@ -177,6 +206,10 @@ def trial_5_Hybrid(model_rnn, model_identifier, train_loaders, valid_loaders):
     print('------------------------------------------------------------')
     print(f'{model_identifier} Validation -> Averaged Loader Loss: '
           f'{_valid_loss/len(valid_loaders)}')
+    _renderer.close()
+
+    if INSTRUMENT_MODEL:
+        _model_hybrid.timer.print_summary()
     return
 
 
@@ -258,8 +291,10 @@ def trial_5_Hybrid_mp():
 
 def trial_5_error_timeline():
     """The trial_5_error_timeline function creates an error timeline for each
-    Hybrid MD RNN UNET model and each validation dataset. The resulting error
-    timelines are plotted via the compareErrorTimeline_np function.
+    Hybrid MD RNN UNET model and each validation dataset. All models are
+    evaluated in a single pass per dataset and all metrics are written to the
+    metrics store. The resulting MAE timelines are plotted via the
+    compareErrorTimeline_np function.
 
     Args:
         NONE
@@ -277,7 +312,6 @@ def trial_5_error_timeline():
 
     _models = []
     _hybrid_models = []
-    _criterion = nn.L1Loss()
     _error_timelines = [[], [], [], [], [], []]
 
     _model_identifiers = [
@@ -347,15 +381,19 @@ def trial_5_error_timeline():
         ).to(device)
         _hybrid_models.append(_model_hybrid)
 
-    for i, _loader in enumerate(_valid_loaders):
-        for _model in _hybrid_models:
-            _error_timeline = error_timeline(
+    with MetricsWriter(f'{_directory}5_Hybrid/Metrics_Hybrid_Models') as _metrics:
+        for i, _loader in enumerate(_valid_loaders):
+            _timelines = evaluate_timelines(
                 loader=_loader,
-                model=_model,
-                criterion=_criterion
+                models=_hybrid_models
             )
-            _error_timelines[i].append(_error_timeline)
+            for j, _timeline in enumerate(_timelines):
+                log_timelines(
+                    _metrics, _timeline,
+                    f'{_model_identifiers[j]}_{_dataset_identifiers[i]}'.replace(' ', '_'))
+                _error_timelines[i].append(_timeline['MAE'])
 
+    from plotting import compareErrorTimeline_np
     compareErrorTimeline_np(
         l_of_l_losses=_error_timelines,
         l_of_l_labels=_model_identifiers,
@@ -1,15 +1,19 @@
 import torch
 import random
 import torch.multiprocessing as mp
-import matplotlib.pyplot as plt
 import torch.optim as optim
 import torch.nn as nn
 import numpy as np
+from render_queue import RenderQueue
+from reductions import line_statistics
 from model import UNET_AE, RNN, GRU, LSTM, Hybrid_MD_RNN_UNET, resetPipeline
-from utils_new import get_UNET_AE_loaders, get_RNN_loaders, losses2file, get_Hybrid_loaders
-from plotting import compareAvgLoss, compareLossVsValid, plotPredVsTargKVS
-from trial_1 import train_AE, valid_AE, error_timeline, get_latentspace_AE
+from utils_new import get_UNET_AE_loaders, get_RNN_loaders, get_Hybrid_loaders
+from latentspace import get_RNN_loaders_from_encoder
+from trial_1 import train_AE, valid_AE, get_latentspace_AE
 from trial_2 import train_RNN, valid_RNN
+from evaluation import evaluate_timelines, log_timelines
+from metrics import MetricsWriter
+from results_db import record_run
 
 torch.manual_seed(10)
 random.seed(10)
@@ -19,19 +23,25 @@ try:
 except RuntimeError:
     pass
 
-plt.style.use(['science'])
 np.set_printoptions(precision=6)
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 NUM_WORKERS = 1
+RENDER_WORKERS = 1          # background plotting processes, 0 renders inline
+# If True, the KVS latentspaces are derived from ENCODER_CHECKPOINT on the fly
+# instead of being read from the offline CleanKVSLS csv files.
+LATENT_FROM_ENCODER = False
+ENCODER_CHECKPOINT = ('/home/lerdo/lerdo_HPC_Lab_Project/MD_U-Net/'
+                      '3_Constituent_Hybrid_approach/Results/6_Hybrid_KVS/'
+                      'Model_UNET_AE_KVS_LR0_0005')
 
 
-def valid_HYBRID_KVS(loader, model, criterion, model_identifier, dataset_identifier):
+def valid_HYBRID_KVS(loader, model, criterion, model_identifier, dataset_identifier, renderer=None):
     """The valid_Hybrid_KVS function computes the average loss on a given dataset
     without updating/optimizing the learnable model parameters. Additionally,
-    it passes two stacked numpy arrays containing predictions and targets,
-    respectively, to the plotPredVsTargKVS function to compare u_z for the
-    entire dataset.
+    it reduces predictions and targets batch by batch via reductions.py and
+    passes the stacked, reduced numpy arrays to the plotPredVsTargKVS function
+    to compare u_z for the entire dataset.
 
     Args:
         loader:
@@ -43,6 +53,9 @@ def valid_HYBRID_KVS(loader, model, criterion, model_identifier, dataset_identif
         model_identifier:
           A unique string to identify the model. Here, the learning rate is
           used to identify which model is being trained.
+        renderer:
+          Object of RenderQueue class the figures are submitted to, or None to
+          render them inline.
 
     Returns:
         avg_loss:
@@ -60,6 +73,8 @@ def valid_HYBRID_KVS(loader, model, criterion, model_identifier, dataset_identif
     _preds = []
     _targs = []
     _counter = 0
+    _render = renderer.submit if renderer is not None else \
+        lambda function, **kwargs: function(**kwargs)
 
     for batch_idx, (_data, _targets) in enumerate(loader):
         _data = _data.float().to(device=device)
@@ -70,11 +85,14 @@ def valid_HYBRID_KVS(loader, model, criterion, model_identifier, dataset_identif
             _loss = criterion(_predictions.float(), _targets.float())
             _epoch_loss += _loss.item()
             _timeline.append(_loss.item())
-            _preds.append(_predictions.cpu().detach().numpy())
-            _targs.append(_targets.cpu().detach().numpy())
+            _preds.append(line_statistics(_predictions, component=2))
+            _targs.append(line_statistics(_targets, component=2))
             _counter += 1
 
-    plotPredVsTargKVS(
+    # plotting is imported lazily, so that spawned workers skip matplotlib
+    from plotting import plotPredVsTargKVS
+    _render(
+        plotPredVsTargKVS,
         input_1=np.vstack(_preds),
         input_2=np.vstack(_targs),
         file_prefix=_file_prefix,
@@ -122,8 +140,8 @@ def trial_6_KVS_AE(alpha, alpha_string, train_loaders, valid_loaders):
     print('Initializing training parameters.')
     _scaler = torch.cuda.amp.GradScaler()
     _optimizer = optim.Adam(_model.parameters(), lr=alpha)
-    _epoch_losses = []
-    _epoch_valids = []
+    _metrics = MetricsWriter(
+        f'{_file_prefix}Metrics_UNET_AE_KVS_{_model_identifier}')
 
     print('Beginning training.')
     for epoch in range(50):
@@ -142,7 +160,7 @@ def trial_6_KVS_AE(alpha, alpha_string, train_loaders, valid_loaders):
         print('------------------------------------------------------------')
         print(f'{_model_identifier} Training Epoch: {epoch+1} -> Averaged'
               f'Loader Loss: {_avg_loss:.3f}')
-        _epoch_losses.append(_avg_loss)
+        _metrics.scalar('Losses_UNET_AE_KVS', _avg_loss, step=epoch)
 
         _avg_valid = 0
         for _valid_loader in valid_loaders:
@@ -156,21 +174,15 @@ def trial_6_KVS_AE(alpha, alpha_string, train_loaders, valid_loaders):
         print('------------------------------------------------------------')
         print(f'{_model_identifier} Validation -> Averaged Loader Loss:'
               f'{_avg_valid:.3f}')
-        _epoch_valids.append(_avg_valid)
+        _metrics.scalar('Valids_UNET_AE_KVS', _avg_valid, step=epoch)
 
-    losses2file(
-        losses=_epoch_losses,
-        file_name=f'{_file_prefix}Losses_UNET_AE_KVS_{_model_identifier}'
-    )
-    losses2file(
-        losses=_epoch_valids,
-        file_name=f'{_file_prefix}Valids_UNET_AE_KVS_{_model_identifier}'
-    )
+    _metrics.close()
 
+    from plotting import compareLossVsValid
     compareLossVsValid(
         loss_files=[
-            f'{_file_prefix}Losses_UNET_AE_KVS_{_model_identifier}.csv',
-            f'{_file_prefix}Valids_UNET_AE_KVS_{_model_identifier}.csv'
+            _metrics.reference('Losses_UNET_AE_KVS'),
+            _metrics.reference('Valids_UNET_AE_KVS')
         ],
         loss_labels=['Training', 'Validation'],
         file_prefix=_file_prefix,
@@ -180,6 +192,13 @@ def trial_6_KVS_AE(alpha, alpha_string, train_loaders, valid_loaders):
         _model.state_dict(),
         f'{_file_prefix}Model_UNET_AE_KVS_{_model_identifier}'
     )
+    record_run(
+        trial='6_Hybrid_KVS',
+        identifier=f'UNET_AE_KVS_{_model_identifier}',
+        metrics_file=_metrics.file_name,
+        config={'lr': alpha, 'epochs': 50},
+        artifacts=[f'{_file_prefix}Model_UNET_AE_KVS_{_model_identifier}']
+    )
     return
 
 
@@ -271,8 +290,8 @@ def trial_6_KVS_AE_latentspace_helper():
 
 def trial_6_KVS_error_timeline():
     """The trial_6_KVS_error_timeline function creates an error timeline for
-    each validation dataset. The resulting error timelines are plotted via the
-    compareErrorTimeline_np function.
+    each validation dataset. All metrics of evaluation.py are written to the
+    metrics store.
 
     Args:
         NONE
@@ -310,7 +329,6 @@ def trial_6_KVS_error_timeline():
         seq_length=25
     ).to(device)
 
-    _criterion = nn.L1Loss()
     _, valid_loaders = get_Hybrid_loaders(file_names=-2)
 
     _datasets = [
@@ -320,16 +338,14 @@ def trial_6_KVS_error_timeline():
         'kvs_40K_SW'
     ]
 
-    for idx, _loader in enumerate(valid_loaders):
-        _losses = error_timeline(
-            loader=_loader,
-            model=_model_hybrid,
-            criterion=_criterion
-        )
-        losses2file(
-            losses=_losses,
-            file_name=f'{_directory}{model_name_3}_KVS_Valid_Error_Timeline_{_datasets[idx]}'
-        )
+    with MetricsWriter(f'{_directory}Metrics_{model_name_3}_KVS') as _metrics:
+        for idx, _loader in enumerate(valid_loaders):
+            _timelines = evaluate_timelines(
+                loader=_loader,
+                models=[_model_hybrid]
+            )
+            log_timelines(
+                _metrics, _timelines[0], f'Valid_Error_Timeline_{_datasets[idx]}')
 
     pass
 
@@ -367,8 +383,8 @@ def trial_6_KVS_RNN(model, model_identifier, alpha, train_loaders, valid_loaders
     print('Initializing training parameters.')
     _scaler = torch.cuda.amp.GradScaler()
     _optimizer = optim.Adam(model.parameters(), lr=alpha)
-    _epoch_losses = []
-    _epoch_valids = []
+    _metrics = MetricsWriter(
+        f'{_file_prefix}Metrics_{model_identifier}')
 
     print('Beginning training.')
     for epoch in range(50):
@@ -389,7 +405,7 @@ def trial_6_KVS_RNN(model, model_identifier, alpha, train_loaders, valid_loaders
             f'{model_identifier} Training Epoch: {epoch+1}-> Averaged '
             f'Loader Loss: {_avg_loss:.3f}')
 
-        _epoch_losses.append(_avg_loss)
+        _metrics.scalar('Losses', _avg_loss, step=epoch)
 
         _avg_valid = 0
         for _valid_loader in valid_loaders:
@@ -403,21 +419,15 @@ def trial_6_KVS_RNN(model, model_identifier, alpha, train_loaders, valid_loaders
         print('------------------------------------------------------------')
         print(f'{model_identifier} Validation -> Averaged '
               f'Loader Loss: {_avg_valid:.3f}')
-        _epoch_valids.append(_avg_valid)
+        _metrics.scalar('Valids', _avg_valid, step=epoch)
 
-    losses2file(
-        losses=_epoch_losses,
-        file_name=f'{_file_prefix}Losses_{model_identifier}'
-    )
-    losses2file(
-        losses=_epoch_valids,
-        file_name=f'{_file_prefix}Valids_{model_identifier}'
-    )
+    _metrics.close()
 
+    from plotting import compareAvgLoss
     compareAvgLoss(
         loss_files=[
-            f'{_file_prefix}Losses_{model_identifier}.csv',
-            f'{_file_prefix}Valids_{model_identifier}.csv'
+            _metrics.reference('Losses'),
+            _metrics.reference('Valids')
         ],
         loss_labels=['Training', 'Validation'],
         file_prefix=_file_prefix,
@@ -427,6 +437,14 @@ def trial_6_KVS_RNN(model, model_identifier, alpha, train_loaders, valid_loaders
         model.state_dict(),
         f'{_file_prefix}Model_{model_identifier}'
     )
+    record_run(
+        trial='6_Hybrid_KVS',
+        identifier=model_identifier,
+        metrics_file=_metrics.file_name,
+        config={'lr': alpha, 'epochs': 50,
+                'latent_from_encoder': LATENT_FROM_ENCODER},
+        artifacts=[f'{_file_prefix}Model_{model_identifier}']
+    )
 
 
 def trial_6_KVS_RNN_mp():
@@ -476,7 +494,22 @@ def trial_6_KVS_RNN_mp():
     ).to(device)
     _models.append(_model_rnn_3)
 
-    _t_loader_25, _v_loader_25 = get_RNN_loaders(
+    _get_loaders = get_RNN_loaders
+    if LATENT_FROM_ENCODER:
+        _model = UNET_AE(
+            device=device,
+            in_channels=3,
+            out_channels=3,
+            features=[4, 8, 16],
+            activation=torch.nn.ReLU(inplace=True)
+        ).to(device)
+        _model.load_state_dict(torch.load(
+            ENCODER_CHECKPOINT, map_location=device))
+
+        def _get_loaders(**kwargs):
+            return get_RNN_loaders_from_encoder(model=_model, **kwargs)
+
+    _t_loader_25, _v_loader_25 = _get_loaders(
         data_distribution='get_KVS',
         batch_size=32,
         seq_length=25
@@ -549,6 +582,7 @@ def trial_6_KVS_Hybrid(model_rnn, model_identifier, train_loaders, valid_loaders
     ).to(device)
 
     _counter = 0
+    _renderer = RenderQueue(max_workers=RENDER_WORKERS)
 
     _train_loss = 0
     for _loader in train_loaders:
@@ -557,7 +591,8 @@ def trial_6_KVS_Hybrid(model_rnn, model_identifier, train_loaders, valid_loaders
             model=_model_hybrid,
             criterion=_criterion,
             model_identifier=model_identifier,
-            dataset_identifier=str(_counter)
+            dataset_identifier=str(_counter),
+            renderer=_renderer
         )
         _train_loss += _loss
         resetPipeline(_model_hybrid)
@@ -574,7 +609,8 @@ def trial_6_KVS_Hybrid(model_rnn, model_identifier, train_loaders, valid_loaders
             model=_model_hybrid,
             criterion=_criterion,
             model_identifier=model_identifier,
-            dataset_identifier=str(_counter)
+            dataset_identifier=str(_counter),
+            renderer=_renderer
         )
         _valid_loss += _loss
         resetPipeline(_model_hybrid)
@@ -583,6 +619,7 @@ def trial_6_KVS_Hybrid(model_rnn, model_identifier, train_loaders, valid_loaders
     print('------------------------------------------------------------')
     print(f'{model_identifier} Validation -> Averaged Loader Loss: '
           f'{_valid_loss/len(valid_loaders)}')
+    _renderer.close()
     return
 
 